@@ -0,0 +1,53 @@
+"""
+Copyright (c) 2003-2010  Gustavo Niemeyer <gustavo@niemeyer.net>
+
+This module offers the proleptic gregorian calendar arithmetic shared
+by the other dateutil modules. Unlike the calendar module, nothing is
+computed that isn't asked for, and no date instances are built.
+"""
+__author__ = "Gustavo Niemeyer <gustavo@niemeyer.net>"
+__license__ = "PSF License"
+
+MONTHDAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Days in the year before each month, and in the whole year.
+M366RANGE = (0,31,60,91,121,152,182,213,244,274,305,335,366)
+M365RANGE = (0,31,59,90,120,151,181,212,243,273,304,334,365)
+
+# Ordinal of 1970-01-01, where ordinal 1 is 0001-01-01.
+EPOCHORDINAL = 719163
+
+def isleap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+def yearlen(year):
+    if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return 366
+    return 365
+
+def monthdays(year, month):
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or
+                                         year % 400 == 0):
+        return 29
+    return MONTHDAYS[month]
+
+def mrange(year):
+    if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return M366RANGE
+    return M365RANGE
+
+def yearordinal(year):
+    """Ordinal of january 1st of the given year."""
+    year -= 1
+    return year*365+year//4-year//100+year//400+1
+
+def yearweekday(year):
+    """Weekday of january 1st of the given year, where 0=MO."""
+    year -= 1
+    return (year*365+year//4-year//100+year//400) % 7
+
+def toordinal(year, month, day):
+    """Same as datetime.date(year, month, day).toordinal()."""
+    return yearordinal(year)+mrange(year)[month-1]+day-1
+
+# vim:ts=4:sw=4:et
@@ -8,13 +8,32 @@ __author__ = "Gustavo Niemeyer <gustavo@niemeyer.net>"
 __license__ = "PSF License"
 
 import datetime
+import array
 
-__all__ = ["easter", "EASTER_JULIAN", "EASTER_ORTHODOX", "EASTER_WESTERN"]
+__all__ = ["easter", "easter_range",
+           "EASTER_JULIAN", "EASTER_ORTHODOX", "EASTER_WESTERN"]
 
 EASTER_JULIAN   = 1
 EASTER_ORTHODOX = 2
 EASTER_WESTERN  = 3
 
+# Years covered by the lookup tables, where all methods are valid.
+FIRSTYEAR = 1583
+LASTYEAR  = 4099
+
+# Ordinals of easter in each year from FIRSTYEAR to LASTYEAR, per
+# method. Each table is built the first time its method is used.
+_tables = [None, None, None, None]
+
+def _table(method):
+    table = _tables[method]
+    if table is None:
+        table = array.array("l", [datetime.date(*_easter(y, method))
+                                  .toordinal()
+                                  for y in range(FIRSTYEAR, LASTYEAR+1)])
+        _tables[method] = table
+    return table
+
 def easter(year, method=EASTER_WESTERN):
     """
     This method was ported from the work done by GM Arts,
@@ -39,7 +58,8 @@ def easter(year, method=EASTER_WESTERN):
     EASTER_ORTHODOX = 2
     EASTER_WESTERN  = 3
 
-    The default method is method 3.
+    The default method is method 3. Years 1583 to 4099 are
+    looked up in a table, built once per method.
     
     More about the algorithm may be found at:
 
@@ -53,7 +73,25 @@ def easter(year, method=EASTER_WESTERN):
 
     if not (1 <= method <= 3):
         raise ValueError, "invalid method"
+    if type(year) is int and FIRSTYEAR <= year <= LASTYEAR:
+        return datetime.date.fromordinal(_table(method)[year-FIRSTYEAR])
+    y, m, d = _easter(year, method)
+    return datetime.date(y, m, d)
+
+def easter_range(start_year, end_year, method=EASTER_WESTERN):
+    """
+    Return an array.array with the ordinals of easter in each
+    year from start_year to end_year, both included, as given
+    by easter().
+    """
+    if not (1 <= method <= 3):
+        raise ValueError, "invalid method"
+    if FIRSTYEAR <= start_year and end_year <= LASTYEAR:
+        return _table(method)[start_year-FIRSTYEAR:end_year-FIRSTYEAR+1]
+    return array.array("l", [datetime.date(*_easter(y, method)).toordinal()
+                             for y in range(start_year, end_year+1)])
 
+def _easter(year, method):
     # g - Golden year - 1
     # c - Century
     # h - (23 - Epact) mod 30
@@ -88,5 +126,5 @@ def easter(year, method=EASTER_WESTERN):
     p = i-j+e
     d = 1+(p+27+(p+6)//40)%31
     m = 3+(p+26)//30
-    return datetime.date(int(y),int(m),int(d))
+    return int(y), int(m), int(d)
 
@@ -21,9 +21,11 @@ except ImportError:
 
 import relativedelta
 import tz
+from _calendar import (EPOCHORDINAL, monthdays, toordinal, yearlen,
+                       yearordinal)
 
 
-__all__ = ["parse", "parserinfo"]
+__all__ = ["parse", "parse_epoch", "isoparse", "finditer", "parserinfo"]
 
 
 # Some pointers:
@@ -162,6 +164,19 @@ class _resultbase(object):
         return self._repr(self.__class__.__name__)
 
 
+class _tokeninfo(object):
+    # Classification of a single token, as found in the parserinfo
+    # tables.
+    __slots__ = ["jump", "weekday", "month", "hms", "ampm",
+                 "pertain", "utczone"]
+
+    def __init__(self):
+        self.jump = self.pertain = self.utczone = False
+        self.weekday = self.month = self.hms = self.ampm = None
+
+_NOTOKEN = _tokeninfo()
+
+
 class parserinfo(object):
 
     # m from a.m/p.m, t from ISO T separator
@@ -205,6 +220,14 @@ class parserinfo(object):
         self._ampm = self._convert(self.AMPM)
         self._utczone = self._convert(self.UTCZONE)
         self._pertain = self._convert(self.PERTAIN)
+        self._tokens = self._compile()
+        for name in _tokeninfo.__slots__:
+            if (getattr(type(self), name).im_func is not
+                getattr(parserinfo, name).im_func):
+                # The tables don't know about it, so the parser
+                # must ask the methods.
+                self._lookup = self._ask
+                break
 
         self.dayfirst = dayfirst
         self.yearfirst = yearfirst
@@ -223,42 +246,84 @@ class parserinfo(object):
                 dct[v.lower()] = i
         return dct
 
+    def _compile(self):
+        # Build a single table mapping each known name to everything
+        # it may mean, so that a token is classified with one lookup.
+        # Common case variants are added up front, and other ones are
+        # added by _find() as they're found.
+        tokens = {}
+        def record(name):
+            try:
+                return tokens[name]
+            except KeyError:
+                tokens[name] = info = _tokeninfo()
+                return info
+        for name in self._jump:
+            record(name).jump = True
+        for name in self._pertain:
+            record(name).pertain = True
+        for name in self._utczone:
+            record(name).utczone = True
+        for name, value in self._hms.items():
+            record(name).hms = value
+        for name, value in self._ampm.items():
+            record(name).ampm = value
+        for name, value in self._weekdays.items():
+            if len(name) >= 3:
+                record(name).weekday = value
+        for name, value in self._months.items():
+            if len(name) >= 3:
+                record(name).month = value+1
+        for name, info in tokens.items():
+            for variant in (name.upper(), name.capitalize(), name.title()):
+                tokens.setdefault(variant, info)
+        return tokens
+
+    def _find(self, name):
+        try:
+            return self._tokens[name]
+        except KeyError:
+            info = self._tokens.get(name.lower(), _NOTOKEN)
+            if info is not _NOTOKEN:
+                self._tokens[name] = info
+            return info
+
+    # Classifies a token for the parser, unless a subclass overrides
+    # one of the methods below.
+    _lookup = _find
+
+    def _ask(self, name):
+        info = _tokeninfo()
+        found = False
+        for attr in _tokeninfo.__slots__:
+            value = getattr(self, attr)(name)
+            if value != getattr(_NOTOKEN, attr):
+                setattr(info, attr, value)
+                found = True
+        if found:
+            return info
+        return _NOTOKEN
+
     def jump(self, name):
-        return name.lower() in self._jump
+        return self._find(name).jump
 
     def weekday(self, name):
-        if len(name) >= 3:
-            try:
-                return self._weekdays[name.lower()]
-            except KeyError:
-                pass
-        return None
+        return self._find(name).weekday
 
     def month(self, name):
-        if len(name) >= 3:
-            try:
-                return self._months[name.lower()]+1
-            except KeyError:
-                pass
-        return None
+        return self._find(name).month
 
     def hms(self, name):
-        try:
-            return self._hms[name.lower()]
-        except KeyError:
-            return None
+        return self._find(name).hms
 
     def ampm(self, name):
-        try:
-            return self._ampm[name.lower()]
-        except KeyError:
-            return None
+        return self._find(name).ampm
 
     def pertain(self, name):
-        return name.lower() in self._pertain
+        return self._find(name).pertain
 
     def utczone(self, name):
-        return name.lower() in self._utczone
+        return self._find(name).utczone
 
     def tzoffset(self, name):
         if name in self._utczone:
@@ -295,19 +360,47 @@ class parser(object):
     def parse(self, timestr, default=None,
                     ignoretz=False, tzinfos=None,
                     **kwargs):
-        if not default:
-            default = datetime.datetime.now().replace(hour=0, minute=0,
-                                                      second=0, microsecond=0)
-        res = self._parse(timestr, **kwargs)
+        # Most strings are ISO-8601, so try the strict parser first.
+        res = self._parseiso(timestr)
+        if res is None:
+            res = self._parse(timestr, **kwargs)
         if res is None:
             raise ValueError, "unknown string format"
-        repl = {}
-        for attr in ["year", "month", "day", "hour",
-                     "minute", "second", "microsecond"]:
-            value = getattr(res, attr)
-            if value is not None:
-                repl[attr] = value
-        ret = default.replace(**repl)
+        return self._build(res, default, ignoretz, tzinfos)
+
+    def _parseiso(self, timestr):
+        # Years read by the strict parser have four digits, so they're
+        # not converted as two digit years, and year 0 is left to the
+        # general parser to reject.
+        res = DEFAULTISOPARSER.parse(timestr)
+        if res is None or res.year == 0:
+            return None
+        year = res.year
+        if not self.info.validate(res):
+            return None
+        res.year = year
+        return res
+
+    def _build(self, res, default, ignoretz, tzinfos):
+        if (not default and res.year is not None and
+            res.month is not None and res.day is not None):
+            # The date is complete, so there's no need to build the
+            # default one just to replace all of its fields.
+            ret = datetime.datetime(res.year, res.month, res.day,
+                                    res.hour or 0, res.minute or 0,
+                                    res.second or 0, res.microsecond or 0)
+        else:
+            if not default:
+                default = datetime.datetime.now().replace(hour=0, minute=0,
+                                                          second=0,
+                                                          microsecond=0)
+            repl = {}
+            for attr in ["year", "month", "day", "hour",
+                         "minute", "second", "microsecond"]:
+                value = getattr(res, attr)
+                if value is not None:
+                    repl[attr] = value
+            ret = default.replace(**repl)
         if res.weekday is not None and not res.day:
             ret = ret+relativedelta.relativedelta(weekday=res.weekday)
         if not ignoretz:
@@ -334,19 +427,213 @@ class parser(object):
                 ret = ret.replace(tzinfo=tz.tzoffset(res.tzname, res.tzoffset))
         return ret
 
+    def parse_epoch(self, timestr, default=None,
+                          ignoretz=False, tzinfos=None,
+                          **kwargs):
+        res = self._parseiso(timestr)
+        if res is None:
+            res = self._parse(timestr, **kwargs)
+        if res is None:
+            raise ValueError, "unknown string format"
+        return self._epoch(res, default, ignoretz, tzinfos)
+
+    def _epoch(self, res, default, ignoretz, tzinfos):
+        # Offsets given by tzinfo instances, tz strings, or the local
+        # zone depend on the date itself, so let them be computed by
+        # the tzinfo on a real datetime.
+        if (default and default.tzinfo or not ignoretz and
+            (callable(tzinfos) or tzinfos and res.tzname in tzinfos and
+             not isinstance(tzinfos[res.tzname], int) or
+             res.tzname and res.tzname in time.tzname and
+             not (tzinfos and res.tzname in tzinfos))):
+            dt = self._build(res, default, ignoretz, tzinfos)
+            offset = dt.utcoffset()
+            if offset:
+                dt -= offset
+            return _epoch(dt.year, dt.month, dt.day, dt.hour, dt.minute,
+                          dt.second, dt.microsecond)
+        if default:
+            year, month, day = default.year, default.month, default.day
+            hour, minute = default.hour, default.minute
+            second, microsecond = default.second, default.microsecond
+        else:
+            if res.year is None or res.month is None or res.day is None:
+                year, month, day = time.localtime()[:3]
+            hour = minute = second = microsecond = 0
+        if res.year is not None: year = res.year
+        if res.month is not None: month = res.month
+        if res.day is not None: day = res.day
+        if res.hour is not None: hour = res.hour
+        if res.minute is not None: minute = res.minute
+        if res.second is not None: second = res.second
+        if res.microsecond is not None: microsecond = res.microsecond
+        ret = _epoch(year, month, day, hour, minute, second, microsecond)
+        if res.weekday is not None and not res.day:
+            # Same as adding relativedelta(weekday=res.weekday).
+            days = ret//86400000000
+            ret += (res.weekday-(days+3)%7)%7*86400000000
+        if not ignoretz:
+            if tzinfos and res.tzname in tzinfos:
+                ret -= tzinfos[res.tzname]*1000000
+            elif res.tzoffset:
+                ret -= res.tzoffset*1000000
+        return ret
+
     class _result(_resultbase):
         __slots__ = ["year", "month", "day", "weekday",
                      "hour", "minute", "second", "microsecond",
                      "tzname", "tzoffset"]
 
+    def finditer(self, instream, default=None,
+                       ignoretz=False, tzinfos=None, **kwargs):
+        if not default:
+            default = datetime.datetime.now().replace(hour=0, minute=0,
+                                                      second=0, microsecond=0)
+        lookup = self.info._lookup
+        # Candidate tokens are kept in run, and start is the offset of
+        # its first token in the text.
+        start = offset = 0
+        run = []
+        for token in _timelex(_textreader(instream)):
+            if (token[0] in "0123456789" or token in ("+", "-", ":", "(", ")")
+                or lookup(token) is not _NOTOKEN
+                or self._tzname(token, tzinfos)):
+                if not run:
+                    start = offset
+                run.append(token)
+                offset += len(token)
+                if len(run) < MAXRUNLEN:
+                    continue
+                # Keep memory bounded on endless runs, leaving enough
+                # tokens behind for a date crossing the limit.
+                limit = len(run)-MAXSPANLEN
+            else:
+                offset += len(token)
+                if not run:
+                    continue
+                limit = len(run)
+            matches, i = self._findinrun(run, start, limit, default,
+                                         ignoretz, tzinfos, kwargs)
+            for match in matches:
+                yield match
+            start += sum([len(x) for x in run[:i]])
+            del run[:i]
+        if run:
+            matches, i = self._findinrun(run, start, len(run), default,
+                                         ignoretz, tzinfos, kwargs)
+            for match in matches:
+                yield match
+
+    def _tzname(self, token, tzinfos):
+        # Whether token is a timezone name the parser understands.
+        if not (len(token) <= 5 and token.isalpha() and token.isupper()):
+            return False
+        return (callable(tzinfos) or (tzinfos and token in tzinfos) or
+                token in time.tzname or self.info.tzoffset(token) is not None)
+
+    def _findinrun(self, run, start, limit, default,
+                         ignoretz, tzinfos, kwargs):
+        # Look for the longest parseable spans starting before limit in
+        # a run of tokens which might be part of a date, left to right.
+        # Returns the (start, end, datetime) matches, and the index of
+        # the first token not looked at.
+        lookup = self.info._lookup
+        len_run = len(run)
+        offsets = [start]
+        for token in run:
+            offsets.append(offsets[-1]+len(token))
+        matches = []
+        i = 0
+        while i < limit:
+            tok = lookup(run[i])
+            if not (run[i][0] in "0123456789" or tok.month or
+                    tok.weekday is not None):
+                i += 1
+                continue
+            for j in range(min(len_run, i+MAXSPANLEN), i, -1):
+                tok = lookup(run[j-1])
+                if (tok.jump and tok.hms is None or
+                    run[j-1] in ("+", ":", "(")):
+                    continue
+                ret = self._parsespan(run[i:j], default,
+                                      ignoretz, tzinfos, kwargs)
+                if ret is not None:
+                    # Don't glue a complete date to whatever follows a
+                    # comma, as in lists of dates.
+                    for k in range(i+1, j):
+                        if run[k] in (",", ";"):
+                            res = self._parsespan(run[i:k], None, ignoretz,
+                                                  tzinfos, kwargs, True)
+                            if (res is not None and res.year is not None and
+                                res.month is not None and
+                                res.day is not None):
+                                j = k
+                                ret = self._parsespan(run[i:j], default,
+                                                      ignoretz, tzinfos,
+                                                      kwargs)
+                                break
+                    matches.append((offsets[i], offsets[j], ret))
+                    i = j
+                    break
+            else:
+                i += 1
+        return matches, i
+
+    def _parsespan(self, tokens, default, ignoretz, tzinfos, kwargs,
+                         result=False):
+        # Spans must look like a date, and carry at least two fields, so
+        # that lists of numbers, or lone numbers and names in the text,
+        # aren't taken as dates.  They also can't cross the end of a
+        # sentence, but may include abbreviated month names ("Sep. 25").
+        lookup = self.info._lookup
+        for i in range(1, len(tokens)-1):
+            if (tokens[i] == "." and tokens[i+1] == " " and
+                not lookup(tokens[i-1]).month):
+                return None
+        for i in range(len(tokens)):
+            token = tokens[i]
+            if token[0] in "0123456789":
+                if len(token) in (8, 12, 14):
+                    break
+                if (i+2 < len(tokens) and tokens[i+1] in "-/.:" and
+                    tokens[i+2][0] in "0123456789"):
+                    break
+            else:
+                tok = lookup(token)
+                if tok.month:
+                    break
+                if ((tok.hms is not None or tok.ampm is not None) and
+                    i and tokens[i-1][-1] in "0123456789"):
+                    break
+        else:
+            return None
+        try:
+            res = self._parse(tokens, **kwargs)
+            if res is None:
+                return None
+            found = [x for x in (res.year, res.month, res.day, res.weekday,
+                                 res.hour, res.minute) if x is not None]
+            if len(found) < 2:
+                return None
+            if result:
+                return res
+            return self._build(res, default, ignoretz, tzinfos)
+        except (ValueError, OverflowError):
+            return None
+
     def _parse(self, timestr, dayfirst=None, yearfirst=None, fuzzy=False):
         info = self.info
         if dayfirst is None:
             dayfirst = info.dayfirst
         if yearfirst is None:
             yearfirst = info.yearfirst
+        lookup = info._lookup
         res = self._result()
-        l = _timelex.split(timestr)
+        if isinstance(timestr, list):
+            # Already split, as done by finditer().
+            l = timestr
+        else:
+            l = _timelex.split(timestr)
         try:
 
             # year/month/day list
@@ -370,9 +657,13 @@ class parser(object):
                     # Token is a number
                     len_li = len(l[i])
                     i += 1
+                    if i < len_l:
+                        tok = lookup(l[i])
+                    else:
+                        tok = _NOTOKEN
                     if (len(ymd) == 3 and len_li in (2, 4)
                         and (i >= len_l or (l[i] != ':' and
-                                            info.hms(l[i]) is None))):
+                                            tok.hms is None))):
                         # 19990101T23[59]
                         s = l[i-1]
                         res.hour = int(s[:2])
@@ -406,13 +697,14 @@ class parser(object):
                         res.minute = int(s[10:12])
                         if len_li == 14:
                             res.second = int(s[12:])
-                    elif ((i < len_l and info.hms(l[i]) is not None) or
+                    elif (tok.hms is not None or
                           (i+1 < len_l and l[i] == ' ' and
-                           info.hms(l[i+1]) is not None)):
+                           lookup(l[i+1]).hms is not None)):
                         # HH[ ]h or MM[ ]m or SS[.ss][ ]s
                         if l[i] == ' ':
                             i += 1
-                        idx = info.hms(l[i])
+                            tok = lookup(l[i])
+                        idx = tok.hms
                         while True:
                             if idx == 0:
                                 res.hour = int(value)
@@ -438,7 +730,7 @@ class parser(object):
                                 i += 1
                                 idx += 1
                                 if i < len_l:
-                                    newidx = info.hms(l[i])
+                                    newidx = lookup(l[i]).hms
                                     if newidx is not None:
                                         idx = newidx
                     elif i+1 < len_l and l[i] == ':':
@@ -457,13 +749,13 @@ class parser(object):
                         sep = l[i]
                         ymd.append(int(value))
                         i += 1
-                        if i < len_l and not info.jump(l[i]):
+                        if i < len_l and not lookup(l[i]).jump:
                             try:
                                 # 01-01[-01]
                                 ymd.append(int(l[i]))
                             except ValueError:
                                 # 01-Jan[-01]
-                                value = info.month(l[i])
+                                value = lookup(l[i]).month
                                 if value is not None:
                                     ymd.append(value)
                                     assert mstridx == -1
@@ -474,7 +766,7 @@ class parser(object):
                             if i < len_l and l[i] == sep:
                                 # We have three members
                                 i += 1
-                                value = info.month(l[i])
+                                value = lookup(l[i]).month
                                 if value is not None:
                                     ymd.append(value)
                                     mstridx = len(ymd)-1
@@ -482,25 +774,29 @@ class parser(object):
                                 else:
                                     ymd.append(int(l[i]))
                                 i += 1
-                    elif i >= len_l or info.jump(l[i]):
-                        if i+1 < len_l and info.ampm(l[i+1]) is not None:
+                    elif i >= len_l or tok.jump:
+                        if i+1 < len_l:
+                            ampm = lookup(l[i+1]).ampm
+                        else:
+                            ampm = None
+                        if ampm is not None:
                             # 12 am
                             res.hour = int(value)
-                            if res.hour < 12 and info.ampm(l[i+1]) == 1:
+                            if res.hour < 12 and ampm == 1:
                                 res.hour += 12
-                            elif res.hour == 12 and info.ampm(l[i+1]) == 0:
+                            elif res.hour == 12 and ampm == 0:
                                 res.hour = 0
                             i += 1
                         else:
                             # Year, month or day
                             ymd.append(int(value))
                         i += 1
-                    elif info.ampm(l[i]) is not None:
+                    elif tok.ampm is not None:
                         # 12am
                         res.hour = int(value)
-                        if res.hour < 12 and info.ampm(l[i]) == 1:
+                        if res.hour < 12 and tok.ampm == 1:
                             res.hour += 12
-                        elif res.hour == 12 and info.ampm(l[i]) == 0:
+                        elif res.hour == 12 and tok.ampm == 0:
                             res.hour = 0
                         i += 1
                     elif not fuzzy:
@@ -510,14 +806,15 @@ class parser(object):
                     continue
 
                 # Check weekday
-                value = info.weekday(l[i])
+                tok = lookup(l[i])
+                value = tok.weekday
                 if value is not None:
                     res.weekday = value
                     i += 1
                     continue
 
                 # Check month name
-                value = info.month(l[i])
+                value = tok.month
                 if value is not None:
                     ymd.append(value)
                     assert mstridx == -1
@@ -536,7 +833,7 @@ class parser(object):
                                 ymd.append(int(l[i]))
                                 i += 1
                         elif (i+3 < len_l and l[i] == l[i+2] == ' '
-                              and info.pertain(l[i+1])):
+                              and lookup(l[i+1]).pertain):
                             # Jan of 01
                             # In this case, 01 is clearly year
                             try:
@@ -551,7 +848,7 @@ class parser(object):
                     continue
 
                 # Check am/pm
-                value = info.ampm(l[i])
+                value = tok.ampm
                 if value is not None:
                     if value == 1 and res.hour < 12:
                         res.hour += 12
@@ -605,7 +902,7 @@ class parser(object):
 
                     # Look for a timezone name between parenthesis
                     if (i+3 < len_l and
-                        info.jump(l[i]) and l[i+1] == '(' and l[i+3] == ')' and
+                        lookup(l[i]).jump and l[i+1] == '(' and l[i+3] == ')' and
                         3 <= len(l[i+2]) <= 5 and
                         not [x for x in l[i+2]
                                 if x not in string.ascii_uppercase]):
@@ -615,7 +912,7 @@ class parser(object):
                     continue
 
                 # Check jumps
-                if not (info.jump(l[i]) or fuzzy):
+                if not (tok.jump or fuzzy):
                     return None
 
                 i += 1
@@ -696,6 +993,282 @@ def parse(timestr, parserinfo=None, **kwargs):
     else:
         return DEFAULTPARSER.parse(timestr, **kwargs)
 
+def parse_epoch(timestr, parserinfo=None, **kwargs):
+    if parserinfo:
+        return parser(parserinfo).parse_epoch(timestr, **kwargs)
+    else:
+        return DEFAULTPARSER.parse_epoch(timestr, **kwargs)
+
+def finditer(instream, parserinfo=None, **kwargs):
+    if parserinfo:
+        return parser(parserinfo).finditer(instream, **kwargs)
+    else:
+        return DEFAULTPARSER.finditer(instream, **kwargs)
+
+
+# Longest run of candidate tokens kept in memory by finditer(), and
+# longest span of tokens tried as a single date.
+MAXRUNLEN = 256
+MAXSPANLEN = 32
+
+class _textreader(object):
+
+    # File-like wrapper handing text to _timelex one character at a
+    # time, while reading the underlying stream in large chunks.  NUL
+    # characters, which _timelex would silently skip, are handed out
+    # as spaces instead, so that the length of the tokens add up to
+    # the offsets in the original text.
+
+    def __init__(self, instream, chunksize=65536):
+        if isinstance(instream, basestring):
+            self.buf = instream
+            self.instream = None
+        else:
+            self.buf = ""
+            self.instream = instream
+        self.chunksize = chunksize
+        self.pos = 0
+
+    def read(self, size=1):
+        if self.pos >= len(self.buf):
+            if self.instream is None:
+                return ""
+            self.buf = self.instream.read(self.chunksize)
+            self.pos = 0
+        s = self.buf[self.pos:self.pos+size]
+        self.pos += len(s)
+        if "\x00" in s:
+            s = s.replace("\x00", " ")
+        return s
+
+
+class _isoparser(object):
+
+    # Strict ISO-8601 parser working on fixed positions of the string,
+    # without tokenizing it.  It understands calendar dates (YYYY-MM-DD,
+    # YYYYMMDD, YYYY-MM, YYYY), week dates (YYYY-Www[-D], YYYYWww[D]),
+    # ordinal dates (YYYY-DDD, YYYYDDD), times (hh[:mm[:ss]], hh[mm[ss]])
+    # with a decimal fraction in the last component, and UTC offsets
+    # (Z, +hh, +hhmm, +hh:mm).  Whenever the string doesn't follow one
+    # of these forms, None is returned, so that the caller may fall back
+    # to the general parser.
+
+    def parse(self, timestr):
+        if not isinstance(timestr, basestring):
+            return None
+        res = parser._result()
+        len_s = len(timestr)
+        try:
+            if len_s >= 4 and timestr[:4].isdigit():
+                i = self._parse_date(timestr, res)
+                if i == len_s:
+                    return res
+                if timestr[i] not in "T " or res.day is None:
+                    # Times only follow complete dates, and anything
+                    # else is left to the general parser.
+                    return None
+                i += 1
+            elif timestr[:1] == "T":
+                i = 1
+            elif timestr[2:3] == ":":
+                # Only the extended format is accepted without the
+                # T designator, as hhmmss is indistinguishable from
+                # YYMMDD.
+                i = 0
+            else:
+                return None
+            i = self._parse_time(timestr, i, res)
+            if i < len_s:
+                i = self._parse_tzoffset(timestr, i, res)
+            if i != len_s:
+                return None
+        except ValueError:
+            return None
+        return res
+
+    def _parse_date(self, s, res):
+        len_s = len(s)
+        # Fast path for the common YYYY-MM-DD form.
+        if len_s >= 10 and s[4] == "-" and s[7] == "-":
+            month, day = s[5:7], s[8:10]
+            if (month.isdigit() and day.isdigit() and
+                (len_s == 10 or not s[10].isdigit())):
+                res.year, res.month, res.day = int(s[:4]), int(month), int(day)
+                if not 1 <= res.month <= 12:
+                    raise ValueError
+                return 10
+        year = int(s[:4])
+        if len_s == 4:
+            res.year = year
+            return 4
+        sep = s[4]
+        if sep == "-":
+            i = 5
+        elif sep == "W" or sep.isdigit():
+            i = 4
+            sep = ""
+        else:
+            # Only a complete date may be followed by a time.
+            raise ValueError
+        if s[i:i+1] == "W":
+            # Week date
+            week = _isoint(s, i+1, 2)
+            i += 3
+            wday = 1
+            if sep:
+                if s[i:i+1] == sep:
+                    wday = _isoint(s, i+1, 1)
+                    i += 2
+            elif s[i:i+1].isdigit():
+                wday = _isoint(s, i, 1)
+                i += 1
+            if not (1 <= week <= 53 and 1 <= wday <= 7):
+                raise ValueError
+            jan4 = datetime.date(year, 1, 4)
+            date = datetime.date.fromordinal(jan4.toordinal()-jan4.weekday()
+                                             +(week-1)*7+wday-1)
+            if date.isocalendar()[0] != year:
+                raise ValueError
+            res.year, res.month, res.day = date.year, date.month, date.day
+            return i
+        j = i
+        while j < len_s and s[j].isdigit():
+            j += 1
+        ndigits = j-i
+        if ndigits == 3:
+            # Ordinal date
+            yday = int(s[i:j])
+            if not 1 <= yday <= yearlen(year):
+                raise ValueError
+            date = datetime.date.fromordinal(yearordinal(year)+yday-1)
+            res.year, res.month, res.day = year, date.month, date.day
+            return j
+        if sep and ndigits == 2:
+            res.year, res.month = year, int(s[i:j])
+            if s[j:j+1] == "-":
+                res.day = _isoint(s, j+1, 2)
+                j += 3
+        elif not sep and ndigits == 4:
+            res.year, res.month, res.day = year, int(s[4:6]), int(s[6:8])
+        else:
+            raise ValueError
+        if not 1 <= res.month <= 12:
+            raise ValueError
+        return j
+
+    def _parse_time(self, s, i, res):
+        len_s = len(s)
+        # Fast path for the common hh:mm:ss form.
+        hms = s[i:i+2]+s[i+3:i+5]+s[i+6:i+8]
+        if s[i+2:i+3] == s[i+5:i+6] == ":" and len(hms) == 6 and hms.isdigit():
+            fields = [int(hms[:2]), int(hms[2:4]), int(hms[4:])]
+            i += 8
+        else:
+            fields = [_isoint(s, i, 2)]
+            i += 2
+        sep = s[i:i+1]
+        if sep != ":":
+            sep = ""
+        while len(fields) < 3 and i < len_s:
+            if sep:
+                if s[i] != sep:
+                    break
+                value = _isoint(s, i+1, 2)
+                i += 3
+            elif s[i].isdigit():
+                value = _isoint(s, i, 2)
+                i += 2
+            else:
+                break
+            fields.append(value)
+        if i < len_s and s[i] in ".,":
+            j = i = i+1
+            while j < len_s and s[j].isdigit():
+                j += 1
+            if j == i:
+                raise ValueError
+            # Fraction of the last component, in microseconds.
+            frac = s[i:j]
+            if len(fields) == 3:
+                fields.append(int(frac[:6].ljust(6, "0")))
+            else:
+                unit = (3600000000, 60000000)[len(fields)-1]
+                us = int(frac)*unit//10**len(frac)
+                while len(fields) < 3:
+                    unit //= 60
+                    fields.append(us//unit)
+                    us %= unit
+                fields.append(us)
+            i = j
+        elif len(fields) == 3:
+            fields.append(0)
+        if fields[0] > 23 or [x for x in fields[1:3] if x > 59]:
+            raise ValueError
+        fields.extend([None]*(4-len(fields)))
+        res.hour, res.minute, res.second, res.microsecond = fields
+        return i
+
+    def _parse_tzoffset(self, s, i, res):
+        c = s[i]
+        if c == "Z":
+            res.tzname = "Z"
+            res.tzoffset = 0
+            return i+1
+        if c not in "+-":
+            raise ValueError
+        offset = _isoint(s, i+1, 2)*3600
+        i += 3
+        if s[i:i+1] == ":":
+            i += 1
+        if i < len(s):
+            minutes = _isoint(s, i, 2)
+            if minutes > 59:
+                raise ValueError
+            offset += minutes*60
+            i += 2
+        if c == "-":
+            offset = -offset
+        res.tzoffset = offset
+        return i
+
+
+def _epoch(year, month, day, hour, minute, second, microsecond):
+    """Microseconds since the epoch of the given UTC time."""
+    if not 1 <= year <= 9999:
+        raise ValueError, "year is out of range"
+    if not 1 <= month <= 12:
+        raise ValueError, "month must be in 1..12"
+    if not 1 <= day <= monthdays(year, month):
+        raise ValueError, "day is out of range for month"
+    if not (0 <= hour <= 23 and 0 <= minute <= 59 and
+            0 <= second <= 59 and 0 <= microsecond <= 999999):
+        raise ValueError, "time is out of range"
+    days = toordinal(year, month, day)-EPOCHORDINAL
+    return (((days*24+hour)*60+minute)*60+second)*1000000+microsecond
+
+def _isoint(s, i, n):
+    """Parse the n digits found at position i of s."""
+    s = s[i:i+n]
+    if len(s) != n or not s.isdigit():
+        raise ValueError
+    return int(s)
+
+
+DEFAULTISOPARSER = _isoparser()
+def isoparse(timestr):
+    """Parse a strict ISO-8601 string into a datetime instance."""
+    res = DEFAULTISOPARSER.parse(timestr)
+    if res is None or res.year is None:
+        raise ValueError, "unknown string format"
+    ret = datetime.datetime(res.year, res.month or 1, res.day or 1,
+                            res.hour or 0, res.minute or 0,
+                            res.second or 0, res.microsecond or 0)
+    if res.tzoffset == 0:
+        ret = ret.replace(tzinfo=tz.tzutc())
+    elif res.tzoffset is not None:
+        ret = ret.replace(tzinfo=tz.tzoffset(None, res.tzoffset))
+    return ret
+
 
 class _tzparser(object):
 
@@ -8,9 +8,19 @@ __author__ = "Gustavo Niemeyer <gustavo@niemeyer.net>"
 __license__ = "PSF License"
 
 import datetime
-import calendar
+import array
 
-__all__ = ["relativedelta", "MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+from _calendar import EPOCHORDINAL, isleap, monthdays, toordinal
+
+MAXORDINAL = datetime.date.max.toordinal()
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ["relativedelta", "mutablerelativedelta",
+           "MO", "TU", "WE", "TH", "FR", "SA", "SU"]
 
 class weekday(object):
     __slots__ = ["weekday", "n"]
@@ -25,6 +35,12 @@ class weekday(object):
         else:
             return self.__class__(self.weekday, n)
 
+    def __hash__(self):
+        return hash((self.weekday, self.n))
+
+    def __reduce__(self):
+        return (self.__class__, (self.weekday, self.n))
+
     def __eq__(self, other):
         try:
             if self.weekday != other.weekday or self.n != other.n:
@@ -42,7 +58,41 @@ class weekday(object):
 
 MO, TU, WE, TH, FR, SA, SU = weekdays = tuple([weekday(x) for x in range(7)])
 
-class relativedelta:
+def _diff(dt1, dt2, months):
+    # Adding the month delta to dt2 lands in dt1's month, and at
+    # most one month too far, since the day is clamped to the end
+    # of the month. Step back if so, and return the remainder
+    # as (months, seconds, microseconds).
+    if isinstance(dt1, datetime.datetime):
+        time1 = ((dt1.hour*60+dt1.minute)*60+dt1.second)*1000000 \
+                +dt1.microsecond
+        time2 = ((dt2.hour*60+dt2.minute)*60+dt2.second)*1000000 \
+                +dt2.microsecond
+    else:
+        time1 = time2 = 0
+    year, month = dt1.year, dt1.month
+    days = dt1.day-min(dt2.day, monthdays(year, month))
+    if dt1 < dt2:
+        if days > 0 or days == 0 and time1 > time2:
+            if month == 12:
+                year, month = year+1, 1
+            else:
+                month += 1
+            days = (dt1.day-monthdays(dt1.year, dt1.month)
+                    -min(dt2.day, monthdays(year, month)))
+            months += 1
+    elif days < 0 or days == 0 and time1 < time2:
+        if month == 1:
+            year, month = year-1, 12
+        else:
+            month -= 1
+        mdays = monthdays(year, month)
+        days = dt1.day+mdays-min(dt2.day, mdays)
+        months -= 1
+    seconds, microseconds = divmod(days*86400000000+time1-time2, 1000000)
+    return months, seconds, microseconds
+
+class relativedelta(object):
     """
 The relativedelta type is based on the specification of the excelent
 work done by M.-A. Lemburg in his mx.DateTime extension. However,
@@ -106,6 +156,11 @@ Here is the behavior of operations with relativedelta:
    (0, 1) or (0, -1) won't change the day.
     """
 
+    __slots__ = ["years", "months", "days", "leapdays",
+                 "hours", "minutes", "seconds", "microseconds",
+                 "year", "month", "day", "weekday",
+                 "hour", "minute", "second", "microsecond", "_has_time"]
+
     def __init__(self, dt1=None, dt2=None,
                  years=0, months=0, days=0, leapdays=0, weeks=0,
                  hours=0, minutes=0, seconds=0, microseconds=0,
@@ -121,61 +176,33 @@ Here is the behavior of operations with relativedelta:
                     dt1 = datetime.datetime.fromordinal(dt1.toordinal())
                 elif not isinstance(dt2, datetime.datetime):
                     dt2 = datetime.datetime.fromordinal(dt2.toordinal())
-            self.years = 0
-            self.months = 0
-            self.days = 0
-            self.leapdays = 0
-            self.hours = 0
-            self.minutes = 0
-            self.seconds = 0
-            self.microseconds = 0
-            self.year = None
-            self.month = None
-            self.day = None
-            self.weekday = None
-            self.hour = None
-            self.minute = None
-            self.second = None
-            self.microsecond = None
-            self._has_time = 0
+            years = days = leapdays = hours = minutes = 0
+            year = month = day = weekday = None
+            hour = minute = second = microsecond = None
 
             months = (dt1.year*12+dt1.month)-(dt2.year*12+dt2.month)
-            self._set_months(months)
-            dtm = self.__radd__(dt2)
-            if dt1 < dt2:
-                while dt1 > dtm:
-                    months += 1
-                    self._set_months(months)
-                    dtm = self.__radd__(dt2)
+            if getattr(dt1, "tzinfo", None) is getattr(dt2, "tzinfo", None):
+                months, seconds, microseconds = _diff(dt1, dt2, months)
             else:
-                while dt1 < dtm:
-                    months -= 1
-                    self._set_months(months)
-                    dtm = self.__radd__(dt2)
-            delta = dt1 - dtm
-            self.seconds = delta.seconds+delta.days*86400
-            self.microseconds = delta.microseconds
+                # Comparisons and differences depend on the UTC
+                # offsets, so search for the month delta instead.
+                dtm = dt2+relativedelta(months=months)
+                if dt1 < dt2:
+                    while dt1 > dtm:
+                        months += 1
+                        dtm = dt2+relativedelta(months=months)
+                else:
+                    while dt1 < dtm:
+                        months -= 1
+                        dtm = dt2+relativedelta(months=months)
+                delta = dt1 - dtm
+                seconds = delta.seconds+delta.days*86400
+                microseconds = delta.microseconds
         else:
-            self.years = years
-            self.months = months
-            self.days = days+weeks*7
-            self.leapdays = leapdays
-            self.hours = hours
-            self.minutes = minutes
-            self.seconds = seconds
-            self.microseconds = microseconds
-            self.year = year
-            self.month = month
-            self.day = day
-            self.hour = hour
-            self.minute = minute
-            self.second = second
-            self.microsecond = microsecond
+            days += weeks*7
 
             if type(weekday) is int:
-                self.weekday = weekdays[weekday]
-            else:
-                self.weekday = weekday
+                weekday = weekdays[weekday]
 
             yday = 0
             if nlyearday:
@@ -183,64 +210,85 @@ Here is the behavior of operations with relativedelta:
             elif yearday:
                 yday = yearday
                 if yearday > 59:
-                    self.leapdays = -1
+                    leapdays = -1
             if yday:
                 ydayidx = [31,59,90,120,151,181,212,243,273,304,334,366]
                 for idx, ydays in enumerate(ydayidx):
                     if yday <= ydays:
-                        self.month = idx+1
+                        month = idx+1
                         if idx == 0:
-                            self.day = yday
+                            day = yday
                         else:
-                            self.day = yday-ydayidx[idx-1]
+                            day = yday-ydayidx[idx-1]
                         break
                 else:
                     raise ValueError, "invalid year day (%d)" % yday
 
-        self._fix()
-
-    def _fix(self):
-        if abs(self.microseconds) > 999999:
-            s = self.microseconds//abs(self.microseconds)
-            div, mod = divmod(self.microseconds*s, 1000000)
-            self.microseconds = mod*s
-            self.seconds += div*s
-        if abs(self.seconds) > 59:
-            s = self.seconds//abs(self.seconds)
-            div, mod = divmod(self.seconds*s, 60)
-            self.seconds = mod*s
-            self.minutes += div*s
-        if abs(self.minutes) > 59:
-            s = self.minutes//abs(self.minutes)
-            div, mod = divmod(self.minutes*s, 60)
-            self.minutes = mod*s
-            self.hours += div*s
-        if abs(self.hours) > 23:
-            s = self.hours//abs(self.hours)
-            div, mod = divmod(self.hours*s, 24)
-            self.hours = mod*s
-            self.days += div*s
-        if abs(self.months) > 11:
-            s = self.months//abs(self.months)
-            div, mod = divmod(self.months*s, 12)
-            self.months = mod*s
-            self.years += div*s
-        if (self.hours or self.minutes or self.seconds or self.microseconds or
-            self.hour is not None or self.minute is not None or
-            self.second is not None or self.microsecond is not None):
-            self._has_time = 1
-        else:
-            self._has_time = 0
-
-    def _set_months(self, months):
-        self.months = months
-        if abs(self.months) > 11:
-            s = self.months//abs(self.months)
-            div, mod = divmod(self.months*s, 12)
-            self.months = mod*s
-            self.years = div*s
-        else:
-            self.years = 0
+        # Carry the relative information over to the larger units.
+        if abs(microseconds) > 999999:
+            s = microseconds//abs(microseconds)
+            div, mod = divmod(microseconds*s, 1000000)
+            microseconds = mod*s
+            seconds += div*s
+        if abs(seconds) > 59:
+            s = seconds//abs(seconds)
+            div, mod = divmod(seconds*s, 60)
+            seconds = mod*s
+            minutes += div*s
+        if abs(minutes) > 59:
+            s = minutes//abs(minutes)
+            div, mod = divmod(minutes*s, 60)
+            minutes = mod*s
+            hours += div*s
+        if abs(hours) > 23:
+            s = hours//abs(hours)
+            div, mod = divmod(hours*s, 24)
+            hours = mod*s
+            days += div*s
+        if abs(months) > 11:
+            s = months//abs(months)
+            div, mod = divmod(months*s, 12)
+            months = mod*s
+            years += div*s
+
+        # Instances are immutable, so attributes are only set here,
+        # through the slot descriptors.
+        _set_years(self, years)
+        _set_months(self, months)
+        _set_days(self, days)
+        _set_leapdays(self, leapdays)
+        _set_hours(self, hours)
+        _set_minutes(self, minutes)
+        _set_seconds(self, seconds)
+        _set_microseconds(self, microseconds)
+        _set_year(self, year)
+        _set_month(self, month)
+        _set_day(self, day)
+        _set_weekday(self, weekday)
+        _set_hour(self, hour)
+        _set_minute(self, minute)
+        _set_second(self, second)
+        _set_microsecond(self, microsecond)
+        _set_has_time(self, int(bool(hours or minutes or seconds or
+                                     microseconds or hour is not None or
+                                     minute is not None or
+                                     second is not None or
+                                     microsecond is not None)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError, "relativedelta instances are immutable"
+
+    def __delattr__(self, name):
+        raise AttributeError, "relativedelta instances are immutable"
+
+    def __reduce__(self):
+        return (self.__class__, (None, None, self.years, self.months,
+                                 self.days, self.leapdays, 0,
+                                 self.hours, self.minutes, self.seconds,
+                                 self.microseconds, self.year, self.month,
+                                 self.day, self.weekday, None, None,
+                                 self.hour, self.minute, self.second,
+                                 self.microsecond))
 
     def __radd__(self, other):
         if not isinstance(other, datetime.date):
@@ -258,15 +306,16 @@ Here is the behavior of operations with relativedelta:
             elif month < 1:
                 year -= 1
                 month += 12
-        day = min(calendar.monthrange(year, month)[1],
-                  self.day or other.day)
+        if not 1 <= month <= 12:
+            raise ValueError, "month must be in 1..12"
+        day = min(monthdays(year, month), self.day or other.day)
         repl = {"year": year, "month": month, "day": day}
         for attr in ["hour", "minute", "second", "microsecond"]:
             value = getattr(self, attr)
             if value is not None:
                 repl[attr] = value
         days = self.days
-        if self.leapdays and month > 2 and calendar.isleap(year):
+        if self.leapdays and month > 2 and isleap(year):
             days += self.leapdays
         ret = (other.replace(**repl)
                + datetime.timedelta(days=days,
@@ -288,63 +337,449 @@ Here is the behavior of operations with relativedelta:
     def __rsub__(self, other):
         return self.__neg__().__radd__(other)
 
+    def apply_many(self, dates):
+        """
+        Add this relativedelta to each of the given dates, which may be
+        a sequence of date/datetime instances, an array.array of date
+        ordinals, or a numpy datetime64 array. The result has the same
+        kind as the input, with the same semantics as '+'.
+        """
+        if isinstance(dates, array.array):
+            if self._has_time:
+                raise ValueError, "can't add time offsets to ordinals"
+            return array.array(dates.typecode,
+                               [o for o, t in self._iterapply(
+                                   [(o, None) for o in dates])])
+        if numpy is not None and isinstance(dates, numpy.ndarray):
+            return self._apply_datetime64(dates)
+        dates = list(dates)
+        items = []
+        for dt in dates:
+            if isinstance(dt, datetime.datetime):
+                items.append((dt.toordinal(),
+                              ((dt.hour*60+dt.minute)*60+dt.second)*1000000
+                              +dt.microsecond))
+            elif isinstance(dt, datetime.date):
+                items.append((dt.toordinal(), None))
+            else:
+                raise TypeError, "unsupported type for add operation"
+        ret = []
+        timedelta = datetime.timedelta
+        fromordinal = datetime.date.fromordinal
+        for dt, item, (o, t) in zip(dates, items, self._iterapply(items)):
+            if t is None:
+                ret.append(fromordinal(o))
+            elif item[1] is None:
+                ret.append(datetime.datetime.fromordinal(o)+
+                           timedelta(0, 0, t))
+            else:
+                ret.append(dt+timedelta(o-item[0], 0, t-item[1]))
+        return ret
+
+    def range(self, start, stop=None, count=None, output=None):
+        """
+        Yield start+n*self for n = 0, 1, 2, ..., each computed from
+        start rather than from the previous item, so days clamped
+        at the end of short months don't drift. It ends when count
+        items were yielded, or at the first item which isn't before
+        stop (or isn't after it, if stop is before the first item), or
+        when the maximum year is reached. Items are all datetimes if
+        either start or self has a time.
+
+        With output="array", an array.array of date ordinals is
+        returned instead, and with output="datetime64", a numpy
+        datetime64 array. These need stop or count.
+
+        ValueError is raised if stop is given without count, and no
+        item moves toward it, as the delta has no relative part.
+        """
+        if not isinstance(start, datetime.date):
+            raise TypeError, "unsupported type for range operation"
+        if (stop is not None and count is None and
+            not (self.years or self.months or self.days or self.hours or
+                 self.minutes or self.seconds or self.microseconds)):
+            # Every item is start+self, which would be yielded forever.
+            raise ValueError, "range() never reaches stop with %s" % `self`
+        if output is not None:
+            if stop is None and count is None:
+                raise ValueError, "%s output needs stop or count" % output
+            if output == "array":
+                if self._has_time or isinstance(start, datetime.datetime):
+                    raise ValueError, "can't store times as ordinals"
+                return array.array("l", [x.toordinal() for x in
+                                         self.range(start, stop, count)])
+            elif output == "datetime64":
+                if numpy is None:
+                    raise ValueError, "datetime64 output needs numpy"
+                return numpy.array(list(self.range(start, stop, count)),
+                                   dtype="datetime64[us]")
+            raise ValueError, "unknown output %s" % `output`
+        return self._range(start, stop, count)
+
+    def _range(self, start, stop, count):
+        timedelta = datetime.timedelta
+        if self._has_time and not isinstance(start, datetime.datetime):
+            start = datetime.datetime.fromordinal(start.toordinal())
+        if isinstance(start, datetime.datetime):
+            if stop is not None and not isinstance(stop, datetime.datetime):
+                stop = datetime.datetime.fromordinal(stop.toordinal())
+            starttime = (((start.hour*60+start.minute)*60+start.second)
+                         *1000000+start.microsecond)
+            hour, minute = self.hour, self.minute
+            second, microsecond = self.second, self.microsecond
+            if hour is None: hour = start.hour
+            if minute is None: minute = start.minute
+            if second is None: second = start.second
+            if microsecond is None: microsecond = start.microsecond
+            time = ((hour*60+minute)*60+second)*1000000+microsecond
+        else:
+            starttime = time = None
+        startordinal = start.toordinal()
+        monthindex = (self.year or start.year)*12+(self.month or
+                                                   start.month)-1
+        monthstep = self.years*12+self.months
+        day = self.day or start.day
+        reltime = (((self.hours*60+self.minutes)*60+self.seconds)*1000000
+                   +self.microseconds)
+        if self.weekday:
+            weekday, nth = self.weekday.weekday, self.weekday.n or 1
+        n = 0
+        while count is None or n < count:
+            year, month = divmod(monthindex+n*monthstep, 12)
+            month += 1
+            if not 1 <= year <= datetime.MAXYEAR:
+                return
+            o = (toordinal(year, month, min(monthdays(year, month), day))
+                 +n*self.days)
+            if self.leapdays and month > 2 and isleap(year):
+                o += self.leapdays
+            if time is not None:
+                days, t = divmod(time+n*reltime, 86400000000)
+                o += days
+            if self.weekday:
+                jumpdays = (abs(nth)-1)*7
+                if nth > 0:
+                    jumpdays += (7-(o-1)%7+weekday)%7
+                else:
+                    jumpdays += ((o-1)%7-weekday)%7
+                    jumpdays *= -1
+                o += jumpdays
+            if not 0 < o <= MAXORDINAL:
+                return
+            if time is None:
+                ret = start+timedelta(o-startordinal)
+            else:
+                ret = start+timedelta(o-startordinal, 0, t-starttime)
+            if stop is not None:
+                if n == 0:
+                    ascending = ret <= stop
+                if ascending:
+                    if ret >= stop:
+                        return
+                elif ret <= stop:
+                    return
+            yield ret
+            n += 1
+
+    def compose(cls, *deltas):
+        """
+        Return the shortest list of relativedeltas which, added in
+        order, are the same as adding each of the given ones in
+        order. Consecutive deltas are fused into one whenever the
+        result doesn't depend on the date they're added to, so the
+        list has a single item in the common cases.
+        """
+        ret = []
+        for delta in deltas:
+            if not isinstance(delta, relativedelta):
+                raise TypeError, "unsupported type for compose operation"
+            if not delta:
+                continue
+            if ret:
+                fused = ret[-1]._fuse(delta, cls)
+                if fused is not None:
+                    ret[-1] = fused
+                    continue
+            ret.append(cls(**delta._kwargs()))
+        return ret
+    compose = classmethod(compose)
+
+    def _kwargs(self):
+        return {"years": self.years, "months": self.months,
+                "days": self.days, "leapdays": self.leapdays,
+                "hours": self.hours, "minutes": self.minutes,
+                "seconds": self.seconds, "microseconds": self.microseconds,
+                "year": self.year, "month": self.month, "day": self.day,
+                "weekday": self.weekday, "hour": self.hour,
+                "minute": self.minute, "second": self.second,
+                "microsecond": self.microsecond}
+
+    def _fuse(self, other, cls):
+        # Return a single delta doing the same as adding self and
+        # then other, or None if there's no such delta.
+        dateonly = not (other.years or other.months or other.leapdays or
+                        other.weekday or other.year is not None or
+                        other.month is not None or other.day is not None)
+        if not dateonly:
+            return None
+        abstime = (other.hour is not None or other.minute is not None or
+                   other.second is not None or other.microsecond is not None)
+        reltime = (other.hours or other.minutes or other.seconds or
+                   other.microseconds)
+        kwargs = self._kwargs()
+        if not abstime and not self.weekday:
+            # Fixed durations add up, as long as the weekday
+            # jump doesn't have to happen between them.
+            for attr in ["days", "hours", "minutes",
+                         "seconds", "microseconds"]:
+                kwargs[attr] += getattr(other, attr)
+            fused = cls(**kwargs)
+            if fused._has_time or not (self._has_time or other._has_time):
+                return fused
+            # Times adding up to whole days would turn dates into
+            # dates, rather than datetimes.
+            return None
+        if (not other.days and not reltime and
+            not (self.hours or self.minutes or
+                 self.seconds or self.microseconds)):
+            # Setting the time after the date was computed is the
+            # same as setting it before, when nothing moves the
+            # date based on the time.
+            for attr in ["hour", "minute", "second", "microsecond"]:
+                value = getattr(other, attr)
+                if value is not None:
+                    kwargs[attr] = value
+            return cls(**kwargs)
+        return None
+
+    def compile(self):
+        """
+        Return a function adding this relativedelta to the date or
+        datetime given to it, which is faster than '+' when the same
+        relativedelta is added many times.
+        """
+        hastime = self._has_time
+        absyear, years = self.year, self.years
+        absmonth, months = self.month, self.months
+        absday = self.day
+        movedate = bool(absyear or years or absmonth or months or absday)
+        repl = {}
+        for attr in ["hour", "minute", "second", "microsecond"]:
+            value = getattr(self, attr)
+            if value is not None:
+                repl[attr] = value
+        delta = datetime.timedelta(days=self.days, hours=self.hours,
+                                   minutes=self.minutes,
+                                   seconds=self.seconds,
+                                   microseconds=self.microseconds)
+        leapdelta = datetime.timedelta(days=self.leapdays)
+        if self.weekday:
+            weekday, nth = self.weekday.weekday, self.weekday.n or 1
+            jumpweeks = datetime.timedelta(days=(abs(nth)-1)*7)
+        else:
+            weekday = None
+        date, datetime_ = datetime.date, datetime.datetime
+
+        if not (movedate or repl or self.leapdays or weekday is not None):
+            # Just a fixed duration.
+            if hastime:
+                def apply(dt):
+                    if not isinstance(dt, datetime_):
+                        if not isinstance(dt, date):
+                            raise TypeError, \
+                                  "unsupported type for add operation"
+                        dt = datetime_.fromordinal(dt.toordinal())
+                    return dt+delta
+            else:
+                def apply(dt):
+                    if not isinstance(dt, date):
+                        raise TypeError, "unsupported type for add operation"
+                    return dt+delta
+            return apply
+
+        def apply(dt):
+            if not isinstance(dt, date):
+                raise TypeError, "unsupported type for add operation"
+            if hastime and not isinstance(dt, datetime_):
+                dt = datetime_.fromordinal(dt.toordinal())
+            if movedate:
+                year = (absyear or dt.year)+years
+                month = absmonth or dt.month
+                if months:
+                    month += months
+                    if month > 12:
+                        year += 1
+                        month -= 12
+                    elif month < 1:
+                        year -= 1
+                        month += 12
+                if not 1 <= month <= 12:
+                    raise ValueError, "month must be in 1..12"
+                day = min(monthdays(year, month), absday or dt.day)
+                dt = dt.replace(year=year, month=month, day=day, **repl)
+            else:
+                year, month = dt.year, dt.month
+                if repl:
+                    dt = dt.replace(**repl)
+            if leapdelta and month > 2 and isleap(year):
+                dt += leapdelta
+            dt += delta
+            if weekday is not None:
+                if nth > 0:
+                    dt += jumpweeks+datetime.timedelta(
+                                         days=(7-dt.weekday()+weekday)%7)
+                else:
+                    dt -= jumpweeks+datetime.timedelta(
+                                         days=(dt.weekday()-weekday)%7)
+            return dt
+        return apply
+
+    def _apply_datetime64(self, dates):
+        if dates.dtype.kind != "M":
+            raise TypeError, "unsupported type for add operation"
+        # Work on microseconds since the epoch, and leave NaT alone.
+        us = dates.astype("datetime64[us]").astype("int64")
+        nat = numpy.datetime64("NaT").astype("int64")
+        items = []
+        for value in us.ravel().tolist():
+            if value == nat:
+                items.append(None)
+            else:
+                days, t = divmod(value, 86400000000)
+                items.append((days+EPOCHORDINAL, t))
+        ret = [nat]*len(items)
+        valid = [i for i, item in enumerate(items) if item is not None]
+        for i, (o, t) in zip(valid,
+                             self._iterapply([items[i] for i in valid])):
+            ret[i] = (o-EPOCHORDINAL)*86400000000+t
+        ret = numpy.array(ret, dtype="int64").reshape(dates.shape)
+        ret = ret.view("datetime64[us]")
+        if not self._has_time:
+            ret = ret.astype(dates.dtype)
+        return ret
+
+    def _iterapply(self, items):
+        # Yield the (ordinal, microseconds of the day) pair for each
+        # date given the same way, doing what __radd__ does with plain
+        # integers. A time of None stands for a date, and is kept
+        # unless the relativedelta has time information.
+        fromordinal = datetime.date.fromordinal
+        hasabstime = (self.hour is not None or self.minute is not None or
+                      self.second is not None or self.microsecond is not None)
+        reltime = (((self.hours*60+self.minutes)*60+self.seconds)*1000000
+                   +self.microseconds)
+        if self.weekday:
+            weekday, nth = self.weekday.weekday, self.weekday.n or 1
+        monthstart = {}
+        for o, t in items:
+            if t is None and self._has_time:
+                t = 0
+            d = fromordinal(o)
+            year = (self.year or d.year)+self.years
+            month = self.month or d.month
+            if self.months:
+                month += self.months
+                if month > 12:
+                    year += 1
+                    month -= 12
+                elif month < 1:
+                    year -= 1
+                    month += 12
+            try:
+                start, mdays = monthstart[year, month]
+            except KeyError:
+                if not 1 <= year <= datetime.MAXYEAR:
+                    raise ValueError, "year is out of range"
+                if not 1 <= month <= 12:
+                    raise ValueError, "month must be in 1..12"
+                start = toordinal(year, month, 1)
+                mdays = monthdays(year, month)
+                monthstart[year, month] = start, mdays
+            o = start+min(mdays, self.day or d.day)-1+self.days
+            if self.leapdays and month > 2 and isleap(year):
+                o += self.leapdays
+            if t is not None:
+                if hasabstime:
+                    s, us = divmod(t, 1000000)
+                    m, s = divmod(s, 60)
+                    h, m = divmod(m, 60)
+                    if self.hour is not None: h = self.hour
+                    if self.minute is not None: m = self.minute
+                    if self.second is not None: s = self.second
+                    if self.microsecond is not None: us = self.microsecond
+                    t = ((h*60+m)*60+s)*1000000+us
+                days, t = divmod(t+reltime, 86400000000)
+                o += days
+            if self.weekday:
+                # Ordinal 1 is a monday.
+                jumpdays = (abs(nth)-1)*7
+                if nth > 0:
+                    jumpdays += (7-(o-1)%7+weekday)%7
+                else:
+                    jumpdays += ((o-1)%7-weekday)%7
+                    jumpdays *= -1
+                o += jumpdays
+            yield o, t
+
     def __add__(self, other):
         if not isinstance(other, relativedelta):
             raise TypeError, "unsupported type for add operation"
-        return relativedelta(years=other.years+self.years,
-                             months=other.months+self.months,
-                             days=other.days+self.days,
-                             hours=other.hours+self.hours,
-                             minutes=other.minutes+self.minutes,
-                             seconds=other.seconds+self.seconds,
-                             microseconds=other.microseconds+self.microseconds,
-                             leapdays=other.leapdays or self.leapdays,
-                             year=other.year or self.year,
-                             month=other.month or self.month,
-                             day=other.day or self.day,
-                             weekday=other.weekday or self.weekday,
-                             hour=other.hour or self.hour,
-                             minute=other.minute or self.minute,
-                             second=other.second or self.second,
-                             microsecond=other.second or self.microsecond)
+        return self.__class__(years=other.years+self.years,
+                              months=other.months+self.months,
+                              days=other.days+self.days,
+                              hours=other.hours+self.hours,
+                              minutes=other.minutes+self.minutes,
+                              seconds=other.seconds+self.seconds,
+                              microseconds=(other.microseconds+
+                                            self.microseconds),
+                              leapdays=other.leapdays or self.leapdays,
+                              year=other.year or self.year,
+                              month=other.month or self.month,
+                              day=other.day or self.day,
+                              weekday=other.weekday or self.weekday,
+                              hour=other.hour or self.hour,
+                              minute=other.minute or self.minute,
+                              second=other.second or self.second,
+                              microsecond=other.microsecond or self.microsecond)
 
     def __sub__(self, other):
         if not isinstance(other, relativedelta):
             raise TypeError, "unsupported type for sub operation"
-        return relativedelta(years=other.years-self.years,
-                             months=other.months-self.months,
-                             days=other.days-self.days,
-                             hours=other.hours-self.hours,
-                             minutes=other.minutes-self.minutes,
-                             seconds=other.seconds-self.seconds,
-                             microseconds=other.microseconds-self.microseconds,
-                             leapdays=other.leapdays or self.leapdays,
-                             year=other.year or self.year,
-                             month=other.month or self.month,
-                             day=other.day or self.day,
-                             weekday=other.weekday or self.weekday,
-                             hour=other.hour or self.hour,
-                             minute=other.minute or self.minute,
-                             second=other.second or self.second,
-                             microsecond=other.second or self.microsecond)
+        return self.__class__(years=other.years-self.years,
+                              months=other.months-self.months,
+                              days=other.days-self.days,
+                              hours=other.hours-self.hours,
+                              minutes=other.minutes-self.minutes,
+                              seconds=other.seconds-self.seconds,
+                              microseconds=(other.microseconds-
+                                            self.microseconds),
+                              leapdays=other.leapdays or self.leapdays,
+                              year=other.year or self.year,
+                              month=other.month or self.month,
+                              day=other.day or self.day,
+                              weekday=other.weekday or self.weekday,
+                              hour=other.hour or self.hour,
+                              minute=other.minute or self.minute,
+                              second=other.second or self.second,
+                              microsecond=other.microsecond or self.microsecond)
 
     def __neg__(self):
-        return relativedelta(years=-self.years,
-                             months=-self.months,
-                             days=-self.days,
-                             hours=-self.hours,
-                             minutes=-self.minutes,
-                             seconds=-self.seconds,
-                             microseconds=-self.microseconds,
-                             leapdays=self.leapdays,
-                             year=self.year,
-                             month=self.month,
-                             day=self.day,
-                             weekday=self.weekday,
-                             hour=self.hour,
-                             minute=self.minute,
-                             second=self.second,
-                             microsecond=self.microsecond)
+        return self.__class__(years=-self.years,
+                              months=-self.months,
+                              days=-self.days,
+                              hours=-self.hours,
+                              minutes=-self.minutes,
+                              seconds=-self.seconds,
+                              microseconds=-self.microseconds,
+                              leapdays=self.leapdays,
+                              year=self.year,
+                              month=self.month,
+                              day=self.day,
+                              weekday=self.weekday,
+                              hour=self.hour,
+                              minute=self.minute,
+                              second=self.second,
+                              microsecond=self.microsecond)
 
     def __nonzero__(self):
         return not (not self.years and
@@ -366,48 +801,43 @@ Here is the behavior of operations with relativedelta:
 
     def __mul__(self, other):
         f = float(other)
-        return relativedelta(years        = int(round(self.years*f)),
-                             months       = int(round(self.months*f)),
-                             days         = int(round(self.days*f)),
-                             hours        = int(round(self.hours*f)),
-                             minutes      = int(round(self.minutes*f)),
-                             seconds      = int(round(self.seconds*f)),
-                             microseconds = self.microseconds*f,
-                             leapdays     = self.leapdays,
-                             year         = self.year,
-                             month        = self.month,
-                             day          = self.day,
-                             weekday      = self.weekday,
-                             hour         = self.hour,
-                             minute       = self.minute,
-                             second       = self.second,
-                             microsecond  = self.microsecond)
+        return self.__class__(years        = int(round(self.years*f)),
+                              months       = int(round(self.months*f)),
+                              days         = int(round(self.days*f)),
+                              hours        = int(round(self.hours*f)),
+                              minutes      = int(round(self.minutes*f)),
+                              seconds      = int(round(self.seconds*f)),
+                              microseconds = self.microseconds*f,
+                              leapdays     = self.leapdays,
+                              year         = self.year,
+                              month        = self.month,
+                              day          = self.day,
+                              weekday      = self.weekday,
+                              hour         = self.hour,
+                              minute       = self.minute,
+                              second       = self.second,
+                              microsecond  = self.microsecond)
+
+    def _key(self):
+        # What __eq__ compares. A weekday without N is the same
+        # as N=+1.
+        weekday = self.weekday
+        if weekday:
+            weekday = (weekday.weekday, weekday.n or 1)
+        return (self.years, self.months, self.days, self.leapdays,
+                self.hours, self.minutes, self.seconds, self.microseconds,
+                self.year, self.month, self.day, weekday,
+                self.hour, self.minute, self.second, self.microsecond)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, relativedelta):
             return False
-        if self.weekday or other.weekday:
-            if not self.weekday or not other.weekday:
-                return False
-            if self.weekday.weekday != other.weekday.weekday:
-                return False
-            n1, n2 = self.weekday.n, other.weekday.n
-            if n1 != n2 and not ((not n1 or n1 == 1) and (not n2 or n2 == 1)):
-                return False
-        return (self.years == other.years and
-                self.months == other.months and
-                self.days == other.days and
-                self.hours == other.hours and
-                self.minutes == other.minutes and
-                self.seconds == other.seconds and
-                self.leapdays == other.leapdays and
-                self.year == other.year and
-                self.month == other.month and
-                self.day == other.day and
-                self.hour == other.hour and
-                self.minute == other.minute and
-                self.second == other.second and
-                self.microsecond == other.microsecond)
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -429,4 +859,23 @@ Here is the behavior of operations with relativedelta:
                 l.append("%s=%s" % (attr, `value`))
         return "%s(%s)" % (self.__class__.__name__, ", ".join(l))
 
+(_set_years, _set_months, _set_days, _set_leapdays,
+ _set_hours, _set_minutes, _set_seconds, _set_microseconds,
+ _set_year, _set_month, _set_day, _set_weekday,
+ _set_hour, _set_minute, _set_second, _set_microsecond,
+ _set_has_time) = [relativedelta.__dict__[x].__set__
+                   for x in relativedelta.__slots__]
+
+class mutablerelativedelta(relativedelta):
+    """
+A relativedelta whose attributes may be changed after it's built,
+as they could before relativedelta instances became immutable.
+Changed attributes are used as given, without carrying them over
+to the larger units. Instances are not hashable.
+    """
+
+    __setattr__ = object.__setattr__
+    __delattr__ = object.__delattr__
+    __hash__ = None
+
 # vim:ts=4:sw=4:et
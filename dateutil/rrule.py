@@ -12,11 +12,16 @@ import datetime
 import calendar
 import thread
 import heapq
+import bisect
+import weakref
+import types
 import sys
 import re
 from utils import ordinal
+from _calendar import (M365RANGE, M366RANGE, isleap, monthdays,
+                       yearordinal, yearweekday)
 
-__all__ = ["rrule", "rruleset", "rrulestr",
+__all__ = ["rrule", "rruleset", "rrulestr", "RuleIndex", "freebusy",
            "YEARLY", "MONTHLY", "WEEKLY", "DAILY",
            "HOURLY", "MINUTELY", "SECONDLY",
            "MO", "TU", "WE", "TH", "FR", "SA", "SU"]
@@ -31,8 +36,6 @@ MDAY365MASK = list(MDAY366MASK)
 M29, M30, M31 = range(-29,0), range(-30,0), range(-31,0)
 NMDAY366MASK = tuple(M31+M29+M31+M30+M31+M30+M31+M31+M30+M31+M30+M31+M31[:7])
 NMDAY365MASK = list(NMDAY366MASK)
-M366RANGE = (0,31,60,91,121,152,182,213,244,274,305,335,366)
-M365RANGE = (0,31,59,90,120,151,181,212,243,273,304,334,365)
 WDAYMASK = [0,1,2,3,4,5,6]*55
 del M29, M30, M31, M365MASK[59], MDAY365MASK[59], NMDAY365MASK[31]
 MDAY365MASK = tuple(MDAY365MASK)
@@ -78,6 +81,12 @@ class weekday(object):
             return False
         return True
 
+    def __hash__(self):
+        return hash((self.weekday, self.n))
+
+    def __reduce__(self):
+        return (self.__class__, (self.weekday, self.n))
+
     def __repr__(self):
         s = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")[self.weekday]
         if not self.n:
@@ -116,16 +125,18 @@ class rrulebase:
         while gen:
             if i == len(cache):
                 acquire()
-                if self._cache_complete:
-                    break
                 try:
-                    for j in range(10):
-                        cache.append(gen.next())
-                except StopIteration:
-                    self._cache_gen = gen = None
-                    self._cache_complete = True
-                    break
-                release()
+                    if self._cache_complete:
+                        break
+                    try:
+                        for j in range(10):
+                            cache.append(gen.next())
+                    except StopIteration:
+                        self._cache_gen = gen = None
+                        self._cache_complete = True
+                        break
+                finally:
+                    release()
             yield cache[i]
             i += 1
         while i < self._len:
@@ -152,7 +163,42 @@ class rrulebase:
                 raise IndexError
             return res
         else:
-            return list(iter(self))[item]
+            gen = reversed(self)
+            try:
+                for i in range(-item):
+                    res = gen.next()
+            except StopIteration:
+                raise IndexError
+            return res
+
+    def __reversed__(self):
+        if self._cache_complete:
+            return reversed(self._cache)
+        return self._iter_before(None, True)
+
+    def iter_before(self, dt, inc=False):
+        """
+        Generate the occurrences before dt, or also at dt if inc is
+        true, from the newest to the oldest.
+        """
+        if self._cache_complete:
+            if inc:
+                i = bisect.bisect_right(self._cache, dt)
+            else:
+                i = bisect.bisect_left(self._cache, dt)
+            return reversed(self._cache[:i])
+        return self._iter_before(dt, inc)
+
+    def _iter_before(self, dt, inc):
+        # Subclasses which may walk backwards override this. Otherwise,
+        # walk forwards and keep what came before dt.
+        l = []
+        for i in self:
+            if dt is not None and (i > dt or (i == dt and not inc)):
+                break
+            l.append(i)
+        l.reverse()
+        return iter(l)
 
     def __contains__(self, item):
         if self._cache_complete:
@@ -167,43 +213,61 @@ class rrulebase:
 
     # __len__() introduces a large performance penality.
     def count(self):
-        if not self._until:
-            return -1
         if self._len is None:
             for x in self: pass
         return self._len
 
+    def count_between(self, after, before, inc=False):
+        return len(self.between(after, before, inc))
+
+    def page(self, cursor=None, size=50):
+        """
+        Return a list with up to size occurrences, from the first one,
+        or from where the page which returned cursor ended, and the
+        cursor for the next page, or None if there are no more
+        occurrences. Cursors are plain strings, which may be stored
+        and given to an equal rule later on.
+        """
+        if cursor is None:
+            state = None
+        else:
+            try:
+                state = [int(x) for x in cursor.split(".")]
+            except (AttributeError, ValueError):
+                raise ValueError, "invalid cursor: %r" % (cursor,)
+        items, state = self._page(state, size)
+        if state is not None:
+            state = ".".join([str(x) for x in state])
+        return items, state
+
     def before(self, dt, inc=False):
+        for i in self.iter_before(dt, inc):
+            return i
+        return None
+
+    def iter_after(self, dt, inc=False):
+        """
+        Generate the occurrences after dt, or also at dt if inc is
+        true, from the oldest to the newest.
+        """
         if self._cache_complete:
-            gen = self._cache
-        else:
-            gen = self
-        last = None
+            if inc:
+                i = bisect.bisect_left(self._cache, dt)
+            else:
+                i = bisect.bisect_right(self._cache, dt)
+            return iter(self._cache[i:])
+        return self._iter_after(dt, inc)
+
+    def _iter_after(self, dt, inc):
+        # Subclasses which may start anywhere override this. Otherwise,
+        # walk forwards from the start.
         if inc:
-            for i in gen:
-                if i > dt:
-                    break
-                last = i
-        else:
-            for i in gen:
-                if i >= dt:
-                    break
-                last = i
-        return last
+            return itertools.dropwhile(lambda x: x < dt, self)
+        return itertools.dropwhile(lambda x: x <= dt, self)
 
     def after(self, dt, inc=False):
-        if self._cache_complete:
-            gen = self._cache
-        else:
-            gen = self
-        if inc:
-            for i in gen:
-                if i >= dt:
-                    return i
-        else:
-            for i in gen:
-                if i > dt:
-                    return i
+        for i in self.iter_after(dt, inc):
+            return i
         return None
 
     def between(self, after, before, inc=False):
@@ -355,48 +419,97 @@ class rrule(rrulebase):
         del kwargs['self']
         if 'original_str' in kwargs:
             del kwargs['original_str']
-        
-        original_kwargs = dict((k,v) for k,v in kwargs.iteritems() if v is not None and v is not False and not isinstance(v, datetime.datetime))
-        self.original_params = {name.upper().replace('BYWEEKDAY', 'BYDAY'): val for name,val in original_kwargs.items()}
-
-        if not interval: # needed to work around checking the kwargs
-            interval = 1
         rrulebase.__init__(self, cache)
-        global easter
         self._original_str = original_str
-        if not dtstart:
-            dtstart = datetime.datetime.now().replace(microsecond=0)
-        elif not isinstance(dtstart, datetime.datetime):
-            dtstart = datetime.datetime.fromordinal(dtstart.toordinal())
-        else:
-            dtstart = dtstart.replace(microsecond=0)
-        self._dtstart = dtstart
-        self._tzinfo = dtstart.tzinfo
-        self._freq = freq
-        self._interval = interval
-        self._count = count
-        if until and not isinstance(until, datetime.datetime):
-            until = datetime.datetime.fromordinal(until.toordinal())
-        self._until = until
-        if wkst is None:
-            self._wkst = calendar.firstweekday()
-        elif type(wkst) is int:
-            self._wkst = wkst
+        self._setparams(kwargs)
+        if normalized_start:
+            self.normalize_start()
+
+    def _setparams(self, kwargs, changed=None):
+        # Derive the parts from the constructor arguments in kwargs,
+        # either all of them, or only those depending on the names in
+        # changed, sharing the rest with the rule this one was copied
+        # from.
+        everything = changed is None
+        self._params = kwargs
+        if everything:
+            original_kwargs = dict((k,v) for k,v in kwargs.iteritems() if v is not None and v is not False and not isinstance(v, datetime.datetime))
+            self.original_params = {name.upper().replace('BYWEEKDAY', 'BYDAY'): val for name,val in original_kwargs.items()}
         else:
-            self._wkst = wkst.weekday
-        if bysetpos is None:
-            self._bysetpos = None
-        elif type(bysetpos) is int:
-            if bysetpos == 0 or not (-366 <= bysetpos <= 366):
-                raise ValueError("bysetpos must be between 1 and 366, "
-                                 "or between -366 and -1")
-            self._bysetpos = (bysetpos,)
+            self.original_params = params = self.original_params.copy()
+            for name in changed:
+                value = kwargs[name]
+                name = name.upper().replace('BYWEEKDAY', 'BYDAY')
+                if (value is None or value is False or
+                    isinstance(value, datetime.datetime)):
+                    params.pop(name, None)
+                else:
+                    params[name] = value
+
+        freq = kwargs["freq"]
+        if everything:
+            dtstart = kwargs["dtstart"]
+            if not dtstart:
+                dtstart = datetime.datetime.now().replace(microsecond=0)
+            elif not isinstance(dtstart, datetime.datetime):
+                dtstart = datetime.datetime.fromordinal(dtstart.toordinal())
+            else:
+                dtstart = dtstart.replace(microsecond=0)
+            self._dtstart = dtstart
+            self._tzinfo = dtstart.tzinfo
+            self._freq = freq
         else:
-            self._bysetpos = tuple(bysetpos)
-            for pos in self._bysetpos:
-                if pos == 0 or not (-366 <= pos <= 366):
+            dtstart = self._dtstart
+        if everything or "interval" in changed:
+            # needed to work around checking the kwargs
+            self._interval = kwargs["interval"] or 1
+        if everything or "count" in changed:
+            self._count = kwargs["count"]
+        if everything or "until" in changed:
+            until = kwargs["until"]
+            if until and not isinstance(until, datetime.datetime):
+                until = datetime.datetime.fromordinal(until.toordinal())
+            self._until = until
+        if everything or "wkst" in changed:
+            wkst = kwargs["wkst"]
+            if wkst is None:
+                self._wkst = calendar.firstweekday()
+            elif type(wkst) is int:
+                self._wkst = wkst
+            else:
+                self._wkst = wkst.weekday
+        if everything or "bysetpos" in changed:
+            bysetpos = kwargs["bysetpos"]
+            if bysetpos is None:
+                self._bysetpos = None
+            elif type(bysetpos) is int:
+                if bysetpos == 0 or not (-366 <= bysetpos <= 366):
                     raise ValueError("bysetpos must be between 1 and 366, "
                                      "or between -366 and -1")
+                self._bysetpos = (bysetpos,)
+            else:
+                self._bysetpos = tuple(bysetpos)
+                for pos in self._bysetpos:
+                    if pos == 0 or not (-366 <= pos <= 366):
+                        raise ValueError("bysetpos must be between 1 and 366, "
+                                         "or between -366 and -1")
+        if everything or changed.intersection(_dayparams):
+            self._setdays(kwargs, freq, dtstart)
+        if everything or changed.intersection(_timeparams):
+            self._settimes(kwargs, freq, dtstart)
+
+        self._countinfo = None
+        self._optimized = None
+        self._key = None
+
+    def _setdays(self, kwargs, freq, dtstart):
+        global easter
+        bymonth = kwargs["bymonth"]
+        bymonthday = kwargs["bymonthday"]
+        byyearday = kwargs["byyearday"]
+        byeaster = kwargs["byeaster"]
+        byweekno = kwargs["byweekno"]
+        byweekday = kwargs["byweekday"]
         if not (byweekno or byyearday or bymonthday or
                 byweekday is not None or byeaster is not None):
             if freq == YEARLY:
@@ -482,6 +595,11 @@ class rrule(rrulebase):
                 self._byweekday = None
             elif not self._bynweekday:
                 self._bynweekday = None
+
+    def _settimes(self, kwargs, freq, dtstart):
+        byhour = kwargs["byhour"]
+        byminute = kwargs["byminute"]
+        bysecond = kwargs["bysecond"]
         # byhour
         if byhour is None:
             if freq < HOURLY:
@@ -513,28 +631,215 @@ class rrule(rrulebase):
         else:
             self._bysecond = tuple(bysecond)
 
-        if self._freq >= HOURLY:
+        # Times of the day are (hour, minute, second) tuples. For
+        # smaller frequencies, they're computed on demand, and kept
+        # by hour or by (hour, minute).
+        self._timesets = {}
+        if freq >= HOURLY:
             self._timeset = None
         else:
+            # Check they're valid times, each field on its own.
+            for hour in self._byhour:
+                datetime.time(hour)
+            for minute in self._byminute:
+                datetime.time(0, minute)
+            for second in self._bysecond:
+                datetime.time(0, 0, second)
             self._timeset = []
             for hour in self._byhour:
                 for minute in self._byminute:
                     for second in self._bysecond:
-                        self._timeset.append(
-                                datetime.time(hour, minute, second,
-                                                    tzinfo=self._tzinfo))
+                        self._timeset.append((hour, minute, second))
             self._timeset.sort()
             self._timeset = tuple(self._timeset)
-        if normalized_start:
-            self.normalize_start()
             
+    def replace(self, **changes):
+        """
+        Return a copy of this rule with the given constructor arguments
+        changed, deriving only the parts which depend on them again.
+        """
+        kwargs = self._params.copy()
+        for name in changes:
+            if name not in kwargs:
+                raise TypeError("replace() got an unexpected keyword "
+                                "argument '%s'" % name)
+        kwargs.update(changes)
+        rule = self._copy(kwargs["cache"])
+        rule._original_str = ''
+        if (kwargs["normalized_start"] or
+            "freq" in changes or "dtstart" in changes):
+            rule._setparams(kwargs)
+        else:
+            rule._setparams(kwargs, set(changes))
+        if kwargs["normalized_start"]:
+            rule.normalize_start()
+        return rule
+
+    def _copy(self, cache):
+        # Same as copy.copy(), at a third of the cost, with a cache of
+        # its own.
+        rule = types.InstanceType(self.__class__, self.__dict__.copy())
+        rrulebase.__init__(rule, cache)
+        return rule
+
     def normalize_start(self):
         # resets dtstart to match the first instance
         # should this be the default?
-        self._dtstart = self.after(self._dtstart, inc=True)
+        # Rules are hashed by their start, so this must not be used
+        # on rules already in a dict, a set, or interned.
+        self._setdtstart(self.after(self._dtstart, inc=True))
+
+    def _setdtstart(self, dtstart):
+        # Everything computed from the old start goes with it.
+        self._dtstart = dtstart
+        self._countinfo = None
+        self._optimized = None
+        self._key = None
+        rrulebase.__init__(self, self._cache is not None)
         
+    def optimized(self):
+        """
+        Return an rrule with the same occurrences as this one, with the
+        largest frequency giving them, and its by* parts sorted, or
+        this same rule when there's nothing better.
+        """
+        if self._bysetpos:
+            # Positions depend on the periods.
+            return self
+        freq = self._freq
+        interval = self._interval
+        dtstart = self._dtstart
+        byhour = self._byhour
+        byminute = self._byminute
+        bysecond = self._bysecond
+        # A sub-daily rule which steps by an interval dividing its
+        # field, and restricts that field, is the rule one frequency
+        # up, with every unit of the field it reaches and allows.
+        fields = [(byhour, dtstart.hour, 24),
+                  (byminute, dtstart.minute, 60),
+                  (bysecond, dtstart.second, 60)]
+        while freq >= HOURLY:
+            values, first, size = fields[freq-HOURLY]
+            if not values or size%interval:
+                break
+            # The field was a filter, and becomes part of the times
+            # of the day, so repeated values must go.
+            values = [x for x in set(values)
+                      if 0 <= x < size and (x-first)%interval == 0]
+            if not values:
+                break
+            fields[freq-HOURLY] = values, first, size
+            freq -= 1
+            interval = 1
+        # Every day of a daily rule, or of a weekly or monthly one
+        # stepping by a single period, goes through the by* filters, so
+        # the largest period those filters select days from will do.
+        if (interval == 1 and freq in (MONTHLY, WEEKLY, DAILY) and
+            not self._bynweekday):
+            if self._byyearday or self._byweekno or self._byeaster:
+                freq = YEARLY
+            elif self._bymonthday or self._bynmonthday:
+                freq = min(freq, MONTHLY)
+            elif self._byweekday:
+                freq = min(freq, WEEKLY)
+        if freq == self._freq:
+            return self
+        def parts(values, unique=True):
+            if values:
+                if unique:
+                    values = set(values)
+                values = list(values)
+                values.sort()
+                return values
+            return None
+        byweekday = list(self._byweekday or ())
+        for wday, n in self._bynweekday or ():
+            byweekday.append(weekdays[wday](n))
+        rule = rrule(freq, dtstart=dtstart, interval=interval,
+                     wkst=self._wkst, count=self._count, until=self._until,
+                     bymonth=parts(self._bymonth),
+                     bymonthday=parts(self._bymonthday+self._bynmonthday),
+                     byyearday=parts(self._byyearday),
+                     byeaster=parts(self._byeaster),
+                     byweekno=parts(self._byweekno),
+                     byweekday=parts(byweekday),
+                     # Repeated times of the day give repeated
+                     # occurrences, so they're kept.
+                     byhour=parts(fields[0][0], False),
+                     byminute=parts(fields[1][0], False),
+                     bysecond=parts(fields[2][0], False))
+        rule._optimized = False
+        return rule
+
+    def __eq__(self, other):
+        if not isinstance(other, rrule):
+            return False
+        # tzinfo classes may compare equal without hashing alike, so
+        # they're compared here rather than in the key.
+        return (self._getkey() == other._getkey() and
+                self._tzinfo == other._tzinfo)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._getkey())
+
+    def _getkey(self):
+        if self._key is None:
+            # The resolved parts, with lists sorted and deduplicated,
+            # since their order doesn't change the occurrences.
+            parts = []
+            for values in (self._bysetpos, self._bymonth,
+                           self._bymonthday, self._bynmonthday,
+                           self._byyearday, self._byeaster,
+                           self._byweekno, self._byweekday,
+                           self._bynweekday, self._byhour,
+                           self._byminute, self._bysecond):
+                if values:
+                    values = list(set(values))
+                    values.sort()
+                    values = tuple(values)
+                else:
+                    values = None
+                parts.append(values)
+            self._key = ((self._freq, self._interval, self._count or None,
+                          self._wkst)+tuple(parts)+
+                         (self._dtstart.replace(tzinfo=None), self._until))
+        return self._key
+
+    def interned(self):
+        """
+        Return the first rule interned which is equal to this one, or
+        intern this one, with its cache enabled, so that all of them
+        share the occurrences computed.
+        """
+        key = self._getkey()
+        _internlock.acquire()
+        try:
+            rule = _interned.get(key)
+            if rule is None:
+                if self._cache is None:
+                    rrulebase.__init__(self, cache=True)
+                _interned[key] = rule = self
+            elif rule._tzinfo != self._tzinfo:
+                # Only one zone gets the key.
+                return self
+            return rule
+        finally:
+            _internlock.release()
+
     def compare_rrules(self, other):
-        return self.repetition_str() == other.repetition_str()
+        if not isinstance(other, rrule):
+            return self.repetition_str() == other.repetition_str()
+        return self._getpattern() == other._getpattern()
+
+    def _getpattern(self):
+        # The key without dtstart and until, and without the parts
+        # implied by dtstart, as repetition_str() leaves them out.
+        params = self.original_params
+        return tuple([(name is None or name in params) and value or None
+                      for name, value in zip(_keyparams, self._getkey())])
 
     def repetition_str(self, context=None, original_str=False):
         return self.__unicode__(context=context, mode=REPETITION_ONLY, original_str=original_str)
@@ -584,9 +889,33 @@ class rrule(rrulebase):
     def __unicode__(self, context=None, original_str=False, mode=NORMAL):
         return unicode(self.__str__(context=context, original_str=original_str, mode=mode))
 
-    def _iter(self):
+    def _iter(self, resume=None):
+        rule = self._getoptimized()
+        if rule is not self:
+            # Walk the periods of the cheaper rule instead.
+            for res in rule._iter(resume):
+                yield res
+            self._len = rule._len
+            return
         year, month, day, hour, minute, second, weekday, yearday, _ = \
             self._dtstart.timetuple()
+        first = self._dtstart
+        total = 0
+        count = self._count
+        if resume:
+            # Continue after the given (occurrence, total) pair, from
+            # the period containing that occurrence.
+            last, total = resume
+            if count:
+                if total >= count:
+                    self._len = total
+                    return
+                count -= total
+            first = last+datetime.timedelta(microseconds=1)
+            year, month, day, hour, minute, second = \
+                self._periodstart(last)
+            if self._freq == WEEKLY:
+                weekday = datetime.date(year, month, day).weekday()
 
         # Some local variables to speed things up a bit
         freq = self._freq
@@ -604,17 +933,18 @@ class rrule(rrulebase):
         byhour = self._byhour
         byminute = self._byminute
         bysecond = self._bysecond
+        tzinfo = self._tzinfo
 
         ii = _iterinfo(self)
         ii.rebuild(year, month)
 
-        getdayset = {YEARLY:ii.ydayset,
-                     MONTHLY:ii.mdayset,
-                     WEEKLY:ii.wdayset,
-                     DAILY:ii.ddayset,
-                     HOURLY:ii.ddayset,
-                     MINUTELY:ii.ddayset,
-                     SECONDLY:ii.ddayset}[freq]
+        getdayrange = {YEARLY:ii.ydayrange,
+                       MONTHLY:ii.mdayrange,
+                       WEEKLY:ii.wdayrange,
+                       DAILY:ii.ddayrange,
+                       HOURLY:ii.ddayrange,
+                       MINUTELY:ii.ddayrange,
+                       SECONDLY:ii.ddayrange}[freq]
         
         if freq < HOURLY:
             timeset = self._timeset
@@ -631,58 +961,65 @@ class rrule(rrulebase):
                 timeset = ()
             else:
                 timeset = gettimeset(hour, minute, second)
+            stepper = _timestepper(freq, interval, hour, minute, second,
+                                   byhour, byminute, bysecond)
+            if not stepper.possible:
+                # No step ever lands on an allowed time.
+                self._len = 0
+                return
+            table = stepper.table
 
-        total = 0
-        count = self._count
         while True:
-            # Get dayset with the right frequency
-            dayset, start, end = getdayset(year, month, day)
-
-            # Do the "hard" work ;-)
-            filtered = False
-            for i in dayset[start:end]:
-                if ((bymonth and ii.mmask[i] not in bymonth) or
-                    (byweekno and not ii.wnomask[i]) or
-                    (byweekday and ii.wdaymask[i] not in byweekday) or
-                    (ii.nwdaymask and not ii.nwdaymask[i]) or
-                    (byeaster and not ii.eastermask[i]) or
-                    ((bymonthday or bynmonthday) and
-                     ii.mdaymask[i] not in bymonthday and
-                     ii.nmdaymask[i] not in bynmonthday) or
-                    (byyearday and
-                     ((i < ii.yearlen and i+1 not in byyearday
-                                      and -ii.yearlen+i not in byyearday) or
-                      (i >= ii.yearlen and i+1-ii.yearlen not in byyearday
-                                       and -ii.nextyearlen+i-ii.yearlen
-                                           not in byyearday)))):
-                    dayset[i] = None
-                    filtered = True
+            # Get the days of the period with the right frequency,
+            # and the ones among them which pass every by* filter.
+            start, end = getdayrange(year, month, day)
+            full = (1<<(end-start))-1
+            bits = (ii.daymask>>start)&full
+            filtered = bits != full
 
             # Output results
             if bysetpos and timeset:
+                # Positions index the period's days times its timeset,
+                # which is in chronological order, so only the selected
+                # occurrences are built, already sorted.
+                ndays = bin(bits).count("1")
+                ntimes = len(timeset)
+                size = ndays*ntimes
                 poslist = []
                 for pos in bysetpos:
                     if pos < 0:
-                        daypos, timepos = divmod(pos, len(timeset))
+                        pos += size
                     else:
-                        daypos, timepos = divmod(pos-1, len(timeset))
-                    try:
-                        i = [x for x in dayset[start:end]
-                                if x is not None][daypos]
-                        time = timeset[timepos]
-                    except IndexError:
-                        pass
-                    else:
-                        date = datetime.date.fromordinal(ii.yearordinal+i)
-                        res = datetime.datetime.combine(date, time)
-                        if res not in poslist:
-                            poslist.append(res)
+                        pos -= 1
+                    if 0 <= pos < size:
+                        poslist.append(pos)
                 poslist.sort()
-                for res in poslist:
+                if len(poslist) > 2:
+                    dayset = []
+                    while bits:
+                        low = bits&-bits
+                        dayset.append(start+low.bit_length()-1)
+                        bits ^= low
+                last = None
+                for pos in poslist:
+                    daypos, timepos = divmod(pos, ntimes)
+                    if len(poslist) > 2:
+                        i = dayset[daypos]
+                    else:
+                        i = start+_nthbit(bits, daypos, ndays)
+                    time = timeset[timepos]
+                    res = datetime.datetime(ii.lastyear+(i>=ii.yearlen),
+                                            ii.mmask[i], ii.mdaymask[i],
+                                            time[0], time[1], time[2],
+                                            0, tzinfo)
+                    if res == last:
+                        # Repeated position, or repeated time.
+                        continue
+                    last = res
                     if until and res > until:
                         self._len = total
                         return
-                    elif res >= self._dtstart:
+                    elif res >= first:
                         total += 1
                         yield res
                         if count:
@@ -691,22 +1028,29 @@ class rrule(rrulebase):
                                 self._len = total
                                 return
             else:
-                for i in dayset[start:end]:
-                    if i is not None:
-                        date = datetime.date.fromordinal(ii.yearordinal+i)
-                        for time in timeset:
-                            res = datetime.datetime.combine(date, time)
-                            if until and res > until:
-                                self._len = total
-                                return
-                            elif res >= self._dtstart:
-                                total += 1
-                                yield res
-                                if count:
-                                    count -= 1
-                                    if not count:
-                                        self._len = total
-                                        return
+                dayset = []
+                while bits:
+                    low = bits&-bits
+                    dayset.append(start+low.bit_length()-1)
+                    bits ^= low
+                for i in dayset:
+                    # Days past the year's end are in january of the
+                    # next year.
+                    y = ii.lastyear+(i>=ii.yearlen)
+                    m, d = ii.mmask[i], ii.mdaymask[i]
+                    for hh, mm, ss in timeset:
+                        res = datetime.datetime(y, m, d, hh, mm, ss, 0, tzinfo)
+                        if until and res > until:
+                            self._len = total
+                            return
+                        elif res >= first:
+                            total += 1
+                            yield res
+                            if count:
+                                count -= 1
+                                if not count:
+                                    self._len = total
+                                    return
 
             # Handle frequency and interval
             fixday = False
@@ -743,7 +1087,13 @@ class rrule(rrulebase):
                 if filtered:
                     # Jump to one iteration before next day
                     hour += ((23-hour)//interval)*interval
-                while True:
+                if table:
+                    hour += stepper.steps(hour)*interval
+                    div, hour = divmod(hour, 24)
+                    if div:
+                        day += div
+                        fixday = True
+                while not table:
                     hour += interval
                     div, mod = divmod(hour, 24)
                     if div:
@@ -757,7 +1107,14 @@ class rrule(rrulebase):
                 if filtered:
                     # Jump to one iteration before next day
                     minute += ((1439-(hour*60+minute))//interval)*interval
-                while True:
+                if table:
+                    x = hour*60+minute
+                    div, x = divmod(x+stepper.steps(x)*interval, 1440)
+                    hour, minute = divmod(x, 60)
+                    if div:
+                        day += div
+                        fixday = True
+                while not table:
                     minute += interval
                     div, mod = divmod(minute, 60)
                     if div:
@@ -778,7 +1135,15 @@ class rrule(rrulebase):
                     # Jump to one iteration before next day
                     second += (((86399-(hour*3600+minute*60+second))
                                 //interval)*interval)
-                while True:
+                if table:
+                    x = hour*3600+minute*60+second
+                    div, x = divmod(x+stepper.steps(x)*interval, 86400)
+                    hour, x = divmod(x, 3600)
+                    minute, second = divmod(x, 60)
+                    if div:
+                        day += div
+                        fixday = True
+                while not table:
                     second += self._interval
                     div, mod = divmod(second, 60)
                     if div:
@@ -800,7 +1165,7 @@ class rrule(rrulebase):
                 timeset = gettimeset(hour, minute, second)
 
             if fixday and day > 28:
-                daysinmonth = calendar.monthrange(year, month)[1]
+                daysinmonth = monthdays(year, month)
                 if day > daysinmonth:
                     while day > daysinmonth:
                         day -= daysinmonth
@@ -811,14 +1176,814 @@ class rrule(rrulebase):
                             if year > datetime.MAXYEAR:
                                 self._len = total
                                 return
-                        daysinmonth = calendar.monthrange(year, month)[1]
+                        daysinmonth = monthdays(year, month)
                     ii.rebuild(year, month)
 
+    def count(self):
+        if self._len is None:
+            if not self._count and not self._until:
+                return -1
+            ci = self._getcountinfo()
+            if ci.possible:
+                until = self._until
+                if until is None:
+                    until = datetime.datetime.max.replace(tzinfo=self._tzinfo)
+                self._len = self._countupto(ci, until, True)
+            else:
+                for x in self: pass
+        return self._len
+
+    def count_between(self, after, before, inc=False):
+        """
+        Return the number of occurrences between after and before, the
+        same as len(self.between(after, before, inc)), computing it
+        without generating them when the rule's shape allows it.
+        """
+        ci = self._getcountinfo()
+        tzinfo = self._tzinfo
+        if (not ci.possible or
+            after.tzinfo is not tzinfo or before.tzinfo is not tzinfo):
+            return rrulebase.count_between(self, after, before, inc)
+        n = self._countupto(ci, before, inc)-self._countupto(ci, after,
+                                                             not inc)
+        return max(n, 0)
+
+    def _page(self, state, size):
+        if state is None:
+            state = [0]*8
+        elif len(state) != 8 or state[6] < 0:
+            raise ValueError, "invalid cursor"
+        last = self._loadlast(state)
+        items = list(itertools.islice(self._resume(state), size+1))
+        if len(items) <= size:
+            return items, None
+        del items[size:]
+        # Count the occurrences at the same time as the last one,
+        # including those in the pages before when they're all there.
+        same = 0
+        while same < size and items[-1-same] == items[-1]:
+            same += 1
+        if same == size and items[-1] == last:
+            same += state[7]
+        return items, self._dumpresume(items[-1], state[6]+size, same)
+
+    def _loadlast(self, state):
+        # The last occurrence given before the cursor, or None.
+        if not state[0]:
+            return None
+        return datetime.datetime(*(state[:6]+[0, self._tzinfo]))
+
+    def _resume(self, state):
+        # Generate the occurrences after those given before the cursor
+        # fields made by _dumpresume(): the total given, and the last
+        # one with how many were at its time, since rules with repeated
+        # times of the day repeat it.
+        last = self._loadlast(state)
+        if last is None:
+            return self._iter()
+        total, same = state[6], state[7]
+        if not 0 < same <= total:
+            raise ValueError, "invalid cursor"
+        if last <= self._dtstart:
+            resume = None
+        else:
+            # From just before the last one, skipping those given.
+            resume = (last-datetime.timedelta(microseconds=1), total-same)
+        return itertools.islice(self._iter(resume), same, None)
+
+    def _dumpresume(self, last, total, same):
+        if last is None:
+            return [0]*6+[total, 0]
+        return [last.year, last.month, last.day,
+                last.hour, last.minute, last.second, total, same]
+
+    def _periodstart(self, dt):
+        # The year, month, day, hour, minute and second _iter() is at
+        # when it gets to the period containing dt, which must not be
+        # before dtstart.
+        dtstart = self._dtstart
+        freq = self._freq
+        interval = self._interval
+        time = dtstart.hour, dtstart.minute, dtstart.second
+        if freq == YEARLY:
+            return ((dtstart.year+(dt.year-dtstart.year)//interval*interval,
+                     dtstart.month, dtstart.day)+time)
+        elif freq == MONTHLY:
+            monthindex = dtstart.year*12+dtstart.month-1
+            k = (dt.year*12+dt.month-1-monthindex)//interval
+            year, month = divmod(monthindex+k*interval, 12)
+            return (year, month+1, dtstart.day)+time
+        elif freq == WEEKLY:
+            ordinal = dtstart.toordinal()
+            weekstart = ordinal-(dtstart.weekday()-self._wkst)%7
+            k = (dt.toordinal()-weekstart)//(interval*7)
+            if k == 0:
+                return (dtstart.year, dtstart.month, dtstart.day)+time
+            date = datetime.date.fromordinal(weekstart+k*interval*7)
+            return (date.year, date.month, date.day)+time
+        elif freq == DAILY:
+            ordinal = dtstart.toordinal()
+            k = (dt.toordinal()-ordinal)//interval
+            date = datetime.date.fromordinal(ordinal+k*interval)
+            return (date.year, date.month, date.day)+time
+        # Smaller frequencies step from dtstart, a step per period.
+        step = interval*(3600, 60, 1)[freq-HOURLY]
+        delta = dt-dtstart
+        seconds = (delta.days*86400+delta.seconds)//step*step
+        dt = dtstart+datetime.timedelta(seconds=seconds)
+        return dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second
+
+    def _iter_after(self, dt, inc):
+        # Start from the period containing dt, rather than dtstart.
+        if dt.tzinfo is not self._tzinfo or dt <= self._dtstart:
+            return rrulebase._iter_after(self, dt, inc)
+        last = dt
+        if inc:
+            last -= datetime.timedelta(microseconds=1)
+        if not self._count:
+            return self._iterfrom(last)
+        ci = self._getcountinfo()
+        if not ci.possible:
+            return rrulebase._iter_after(self, dt, inc)
+        return self._iter((last, self._countupto(ci, last, True)))
+
+    def _iterfrom(self, last):
+        # The number of occurrences up to last isn't known, so the
+        # length _iter() sets when it's done is wrong, and is put back.
+        length = self._len
+        for res in self._iter((last, 0)):
+            yield res
+        self._len = length
+
+    def _getcountinfo(self):
+        if self._countinfo is None:
+            self._countinfo = _countinfo(self._getoptimized())
+        return self._countinfo
+
+    def _getoptimized(self):
+        # False when this rule is the optimized one, rather than a
+        # reference to itself, which would keep it from being freed.
+        if self._optimized is None:
+            rule = self.optimized()
+            self._optimized = rule is not self and rule
+        return self._optimized or self
+
+    def _countupto(self, ci, dt, inc):
+        # Number of occurrences before dt, or also at dt if inc is true.
+        until = self._until
+        if until and (dt > until or dt == until and not inc):
+            dt, inc = until, True
+        n = ci.countupto(dt, inc)
+        if self._count and n > self._count:
+            n = self._count
+        return n
+
+    def _iter_before(self, dt, inc):
+        if self._count:
+            # Only walking forwards tells which occurrences count.
+            return rrulebase._iter_before(self, dt, inc)
+        until = self._until
+        if dt is None or (until and (until < dt or until == dt and inc)):
+            if not until:
+                raise ValueError, "can't iterate backwards over an " \
+                                  "unbounded rule"
+            dt, inc = until, True
+        return self._iterback(dt, inc)
+
+    def _iterback(self, bound, inc):
+        # Walk the periods from the one containing bound back to the
+        # one containing dtstart. Periods are numbered from dtstart,
+        # so the one containing bound is found arithmetically.
+        dtstart = self._dtstart
+        if bound < dtstart or (bound == dtstart and not inc):
+            return
+        freq = self._freq
+        interval = self._interval
+        ii = _iterinfo(self)
+        if freq < HOURLY:
+            timeset = self._timeset
+            if freq == YEARLY:
+                k = (bound.year-dtstart.year)//interval
+            elif freq == MONTHLY:
+                monthindex = dtstart.year*12+dtstart.month-1
+                k = (bound.year*12+bound.month-1-monthindex)//interval
+            else:
+                ordinal = dtstart.toordinal()
+                if freq == WEEKLY:
+                    weekstart = ordinal-(dtstart.weekday()-self._wkst)%7
+                    k = (bound.toordinal()-weekstart)//(interval*7)
+                else:
+                    k = (bound.toordinal()-ordinal)//interval
+            while k >= 0:
+                if freq == YEARLY:
+                    ii.rebuild(dtstart.year+k*interval, dtstart.month)
+                    start, end = 0, ii.yearlen
+                elif freq == MONTHLY:
+                    year, month = divmod(monthindex+k*interval, 12)
+                    ii.rebuild(year, month+1)
+                    start, end = ii.mrange[month:month+2]
+                else:
+                    if freq == WEEKLY:
+                        first = weekstart+k*interval*7
+                        last = first+7
+                        if k == 0:
+                            first = ordinal
+                    else:
+                        first = ordinal+k*interval
+                        last = first+1
+                    date = datetime.date.fromordinal(first)
+                    ii.rebuild(date.year, date.month)
+                    start = first-ii.yearordinal
+                    end = last-ii.yearordinal
+                for res in reversed(self._periodset(ii, start, end, timeset)):
+                    if res < dtstart:
+                        return
+                    if res < bound or (res == bound and inc):
+                        yield res
+                k -= 1
+            return
+
+        # Smaller frequencies step through the times dtstart+k*interval,
+        # in units of the frequency, which are the periods themselves.
+        byhour = self._byhour
+        byminute = self._byminute
+        bysecond = self._bysecond
+        stepper = _timestepper(freq, interval, dtstart.hour, dtstart.minute,
+                               dtstart.second, byhour, byminute, bysecond)
+        if not stepper.possible:
+            return
+        table = stepper.table
+        if freq == HOURLY:
+            period, gettimeset = 24, ii.htimeset
+            first = dtstart.hour
+            last = bound.hour
+        elif freq == MINUTELY:
+            period, gettimeset = 1440, ii.mtimeset
+            first = dtstart.hour*60+dtstart.minute
+            last = bound.hour*60+bound.minute
+        else:
+            period, gettimeset = 86400, ii.stimeset
+            first = (dtstart.hour*60+dtstart.minute)*60+dtstart.second
+            last = (bound.hour*60+bound.minute)*60+bound.second
+        first += dtstart.toordinal()*period
+        last += bound.toordinal()*period
+        x = first+(last-first)//interval*interval
+        lastordinal = None
+        while x >= first:
+            ordinal, t = divmod(x, period)
+            if ordinal != lastordinal:
+                date = datetime.date.fromordinal(ordinal)
+                ii.rebuild(date.year, date.month)
+                i = ordinal-ii.yearordinal
+                dayok = ii.daymask>>i&1
+                lastordinal = ordinal
+            if not dayok:
+                # Jump to the last step of the previous day.
+                x -= (t//interval+1)*interval
+                continue
+            if freq == HOURLY:
+                hour, minute, second = t, dtstart.minute, dtstart.second
+            elif freq == MINUTELY:
+                (hour, minute), second = divmod(t, 60), dtstart.second
+            else:
+                hour, t = divmod(t, 3600)
+                minute, second = divmod(t, 60)
+            if ((not byhour or hour in byhour) and
+                (freq < MINUTELY or not byminute or minute in byminute) and
+                (freq < SECONDLY or not bysecond or second in bysecond)):
+                timeset = gettimeset(hour, minute, second)
+                for res in reversed(self._periodset(ii, i, i+1, timeset)):
+                    if res < dtstart:
+                        return
+                    if res < bound or (res == bound and inc):
+                        yield res
+            if table:
+                x -= stepper.backsteps(x%period)*interval
+            else:
+                x -= interval
+
+    def _periodset(self, ii, start, end, timeset):
+        # Occurrences within the yearday indexes from start up to end,
+        # in order, as _iter() finds them.
+        bits = (ii.daymask>>start)&((1<<(end-start))-1)
+        dayset = []
+        while bits:
+            low = bits&-bits
+            dayset.append(start+low.bit_length()-1)
+            bits ^= low
+        year, yearlen = ii.lastyear, ii.yearlen
+        mmask, mdaymask = ii.mmask, ii.mdaymask
+        tzinfo = self._tzinfo
+        if self._bysetpos and timeset:
+            ntimes = len(timeset)
+            size = len(dayset)*ntimes
+            poslist = []
+            for pos in self._bysetpos:
+                if pos < 0:
+                    pos += size
+                else:
+                    pos -= 1
+                if 0 <= pos < size:
+                    poslist.append(pos)
+            poslist.sort()
+            l = []
+            for pos in poslist:
+                daypos, timepos = divmod(pos, ntimes)
+                i = dayset[daypos]
+                hh, mm, ss = timeset[timepos]
+                res = datetime.datetime(year+(i>=yearlen), mmask[i],
+                                        mdaymask[i], hh, mm, ss, 0, tzinfo)
+                if not l or res != l[-1]:
+                    l.append(res)
+            return l
+        return [datetime.datetime(year+(i>=yearlen), mmask[i], mdaymask[i],
+                                  hh, mm, ss, 0, tzinfo)
+                for i in dayset for hh, mm, ss in timeset]
+
+# Each by* filter is compiled into a bitset of the days it accepts in
+# a given year, as an int where bit i stands for yearday index i. They
+# depend only on the year and on a few rule parameters, so they're
+# shared by every rule using the same ones, and the cache is simply
+# dropped when it fills up.
+MASKCACHESIZE = 1024
+_maskcache = {}
+
+# Bit i set for each i multiple of 7, enough to cover a year mask.
+WEEKREPEAT = sum([1<<(i*7) for i in range(54)])
+
+def _tobits(mask):
+    bits = 0
+    for i in range(len(mask)-1, -1, -1):
+        bits <<= 1
+        if mask[i]:
+            bits |= 1
+    return bits
+
+def _nthbit(bits, n, count):
+    # Index of the nth lowest set bit, counting from 0, out of count.
+    # Bits are dropped from the nearest end, so the first and last
+    # ones are found right away.
+    if n < count//2:
+        for i in range(n):
+            bits &= bits-1
+        return (bits&-bits).bit_length()-1
+    for i in range(count-1-n):
+        bits ^= 1<<(bits.bit_length()-1)
+    return bits.bit_length()-1
+
+def _storemask(key, bits):
+    if len(_maskcache) >= MASKCACHESIZE:
+        _maskcache.clear()
+    _maskcache[key] = bits
+    return bits
+
+def _monthbits(yearlen, bymonth):
+    key = ("month", yearlen, bymonth)
+    try:
+        return _maskcache[key]
+    except KeyError:
+        pass
+    if yearlen == 365:
+        mrange = M365RANGE
+    else:
+        mrange = M366RANGE
+    bits = 0
+    for month in bymonth:
+        if 1 <= month <= 12:
+            bits |= ((1<<(mrange[month]-mrange[month-1]))-1)<<mrange[month-1]
+    if 1 in bymonth:
+        # The days taken from next year are in january.
+        bits |= 0x7f<<yearlen
+    return _storemask(key, bits)
+
+def _weekdaybits(yearlen, yearweekday, byweekday):
+    week = 0
+    for wday in byweekday:
+        if 0 <= wday <= 6:
+            week |= 1<<((wday-yearweekday)%7)
+    return (week*WEEKREPEAT)&((1<<(yearlen+7))-1)
+
+def _mdaybits(yearlen, bymonthday, bynmonthday):
+    key = ("mday", yearlen, bymonthday, bynmonthday)
+    try:
+        return _maskcache[key]
+    except KeyError:
+        pass
+    if yearlen == 365:
+        mdaymask, nmdaymask = MDAY365MASK, NMDAY365MASK
+    else:
+        mdaymask, nmdaymask = MDAY366MASK, NMDAY366MASK
+    return _storemask(key, _tobits([mdaymask[i] in bymonthday or
+                                    nmdaymask[i] in bynmonthday
+                                    for i in range(yearlen+7)]))
+
+def _ydaybits(yearlen, nextyearlen, byyearday):
+    key = ("yday", yearlen, nextyearlen, byyearday)
+    try:
+        return _maskcache[key]
+    except KeyError:
+        pass
+    mask = []
+    for i in range(yearlen):
+        mask.append(i+1 in byyearday or -yearlen+i in byyearday)
+    for i in range(yearlen, yearlen+7):
+        mask.append(i+1-yearlen in byyearday or
+                    -nextyearlen+i-yearlen in byyearday)
+    return _storemask(key, _tobits(mask))
+
+def _wnomask(year, wkst, byweekno):
+    key = ("wno", year, wkst, byweekno)
+    try:
+        return _maskcache[key]
+    except KeyError:
+        pass
+    yearlen = 365+isleap(year)
+    wday = yearweekday(year)
+    wdaymask = WDAYMASK[wday:]
+    wnomask = [0]*(yearlen+7)
+    #no1wkst = firstwkst = wdaymask.index(wkst)
+    no1wkst = firstwkst = (7-wday+wkst)%7
+    if no1wkst >= 4:
+        no1wkst = 0
+        # Number of days in the year, plus the days we got
+        # from last year.
+        wyearlen = yearlen+(wday-wkst)%7
+    else:
+        # Number of days in the year, minus the days we
+        # left in last year.
+        wyearlen = yearlen-no1wkst
+    div, mod = divmod(wyearlen, 7)
+    numweeks = div+mod//4
+    for n in byweekno:
+        if n < 0:
+            n += numweeks+1
+        if not (0 < n <= numweeks):
+            continue
+        if n > 1:
+            i = no1wkst+(n-1)*7
+            if no1wkst != firstwkst:
+                i -= 7-firstwkst
+        else:
+            i = no1wkst
+        for j in range(7):
+            wnomask[i] = 1
+            i += 1
+            if wdaymask[i] == wkst:
+                break
+    if 1 in byweekno:
+        # Check week number 1 of next year as well
+        # TODO: Check -numweeks for next year.
+        i = no1wkst+numweeks*7
+        if no1wkst != firstwkst:
+            i -= 7-firstwkst
+        if i < yearlen:
+            # If week starts in next year, we
+            # don't care about it.
+            for j in range(7):
+                wnomask[i] = 1
+                i += 1
+                if wdaymask[i] == wkst:
+                    break
+    if no1wkst:
+        # Check last week number of last year as
+        # well. If no1wkst is 0, either the year
+        # started on week start, or week number 1
+        # got days from last year, so there are no
+        # days from last year's last week number in
+        # this year.
+        if -1 not in byweekno:
+            lyearweekday = yearweekday(year-1)
+            lno1wkst = (7-lyearweekday+wkst)%7
+            lyearlen = 365+isleap(year-1)
+            if lno1wkst >= 4:
+                lno1wkst = 0
+                lnumweeks = 52+(lyearlen+
+                               (lyearweekday-wkst)%7)%7//4
+            else:
+                lnumweeks = 52+(yearlen-no1wkst)%7//4
+        else:
+            lnumweeks = -1
+        if lnumweeks in byweekno:
+            for i in range(no1wkst):
+                wnomask[i] = 1
+    return _storemask(key, _tobits(wnomask))
+
+def _nwdaymask(year, month, freq, bymonth, bynweekday):
+    if freq == YEARLY:
+        month = None
+    elif freq == MONTHLY:
+        bymonth = None
+    else:
+        # Weekly and smaller frequencies don't have nth weekdays.
+        return None
+    key = ("nwday", year, month, freq, bymonth, bynweekday)
+    try:
+        return _maskcache[key]
+    except KeyError:
+        pass
+    yearlen = 365+isleap(year)
+    wdaymask = WDAYMASK[yearweekday(year):]
+    if yearlen == 365:
+        mrange = M365RANGE
+    else:
+        mrange = M366RANGE
+    ranges = []
+    if freq == YEARLY:
+        if bymonth:
+            for month in bymonth:
+                ranges.append(mrange[month-1:month+1])
+        else:
+            ranges = [(0, yearlen)]
+    else:
+        ranges = [mrange[month-1:month+1]]
+    # Weekly frequency won't get here, so we may not
+    # care about cross-year weekly periods.
+    nwdaymask = [0]*yearlen
+    for first, last in ranges:
+        last -= 1
+        for wday, n in bynweekday:
+            if n < 0:
+                i = last+(n+1)*7
+                i -= (wdaymask[i]-wday)%7
+            else:
+                i = first+(n-1)*7
+                i += (7-wdaymask[i]+wday)%7
+            if first <= i <= last:
+                nwdaymask[i] = 1
+    return _storemask(key, _tobits(nwdaymask))
+
+class _timestepper(object):
+    """
+    Finds how many steps of a sub-daily rule lead to the next time of
+    the day allowed by its byhour, byminute and bysecond, working in
+    units of the frequency. Stepping by interval from time x only
+    reaches the times congruent to x modulo gcd(interval, period),
+    which tells up front whether any allowed time is reachable, and
+    gives the position of each one in the cycle of reachable times.
+    """
+    __slots__ = ["possible", "table", "residue", "gcd", "cycle", "inverse"]
+
+    def __init__(self, freq, interval, hour, minute, second,
+                 byhour, byminute, bysecond):
+        if freq == HOURLY:
+            period, x = 24, hour
+            fields = [(byhour, 24, 1)]
+        elif freq == MINUTELY:
+            period, x = 1440, hour*60+minute
+            fields = [(byhour, 24, 60), (byminute, 60, 1)]
+        else:
+            period, x = 86400, hour*3600+minute*60+second
+            fields = [(byhour, 24, 3600), (byminute, 60, 60),
+                      (bysecond, 60, 1)]
+        self.table = None
+        restricted = False
+        for i, (values, size, weight) in enumerate(fields):
+            if values:
+                restricted = True
+                values = [v for v in values if 0 <= v < size]
+            else:
+                values = range(size)
+            fields[i] = values, weight
+        if not restricted:
+            # Every step is allowed.
+            self.possible = True
+            return
+        a, b = interval, period
+        while b:
+            a, b = b, a%b
+        self.gcd = g = a
+        self.residue = r = x%g
+        residues = set([0])
+        for values, weight in fields:
+            residues = set([(a+v*weight)%g for a in residues
+                                           for v in values])
+        self.possible = r in residues
+        count = 1
+        for values, weight in fields:
+            count *= len(values)
+        if not self.possible or count*16 > period:
+            # Allowed times are dense enough for plain stepping.
+            return
+        allowed = [0]
+        for values, weight in fields:
+            allowed = [a+v*weight for a in allowed for v in values]
+        self.cycle = n = period//g
+        # Inverse of interval//g modulo n, by the extended euclidean
+        # algorithm.
+        a, b, u, w = (interval//g)%n, n, 1, 0
+        while b:
+            q = a//b
+            a, b, u, w = b, a-q*b, w, u-q*w
+        self.inverse = u%n
+        self.table = [((v-r)//g*self.inverse)%n for v in allowed
+                      if v%g == r]
+        self.table.sort()
+
+    def steps(self, x):
+        # Steps from time x, at least one, to the next allowed time.
+        table = self.table
+        j = ((x-self.residue)//self.gcd*self.inverse)%self.cycle
+        i = bisect.bisect_right(table, j)
+        if i < len(table):
+            return table[i]-j
+        return table[0]+self.cycle-j
+
+    def backsteps(self, x):
+        # Steps back from time x, at least one, to the previous
+        # allowed time.
+        table = self.table
+        j = ((x-self.residue)//self.gcd*self.inverse)%self.cycle
+        i = bisect.bisect_left(table, j)
+        if i > 0:
+            return j-table[i-1]
+        return j-table[-1]+self.cycle
+
+def _crt(r1, m1, r2, m2):
+    # Solve n == r1 (mod m1) and n == r2 (mod m2) as n == r (mod m),
+    # returning (r, m), or None when there's no solution.
+    a, b, u, w = m1, m2, 1, 0
+    while b:
+        q = a//b
+        a, b, u, w = b, a-q*b, w, u-q*w
+    # Now a is gcd(m1, m2), and u*m1 == a (mod m2).
+    if (r2-r1)%a:
+        return None
+    m = m1//a*m2
+    return (r1+m1*((r2-r1)//a*u%(m2//a)))%m, m
+
+class _countinfo(object):
+    """
+    Counts the occurrences of an rrule up to a given time, when it has
+    a closed form. That's the case when the days of the rule are a
+    few congruence classes of day ordinals, as with plain daily and
+    weekly byweekday rules, or the days are picked by bymonthday from
+    the months in a few congruence classes of month indexes, as with
+    monthly and yearly bymonth rules, and every day has the same
+    times. Sub-daily rules are counted when they step plainly by
+    their interval.
+    """
+    __slots__ = ["possible", "dtstart", "step", "months", "terms",
+                 "daysets", "timeset", "base"]
+
+    def __init__(self, rrule):
+        self.possible = False
+        self.dtstart = dtstart = rrule._dtstart
+        freq = rrule._freq
+        interval = rrule._interval
+        if (rrule._byyearday or rrule._byweekno or rrule._byeaster or
+            rrule._bysetpos or rrule._bynweekday):
+            return
+        bymonthday = rrule._bymonthday or rrule._bynmonthday
+        if freq >= HOURLY:
+            if (rrule._bymonth or rrule._byweekday or bymonthday or
+                rrule._byhour or
+                rrule._byminute not in (None, (dtstart.minute,)) or
+                rrule._bysecond not in (None, (dtstart.second,)) or
+                freq == MINUTELY and rrule._byminute or
+                freq == SECONDLY and (rrule._byminute or rrule._bysecond)):
+                return
+            self.step = interval*(3600, 60, 1)[freq-HOURLY]*1000000
+            self.possible = True
+            return
+        self.step = None
+        self.timeset = rrule._timeset
+        self.months = None
+        if freq >= WEEKLY:
+            if rrule._bymonth or bymonthday:
+                return
+            ordinal = dtstart.toordinal()
+            if freq == DAILY:
+                if rrule._byweekday:
+                    return
+                classes = [(ordinal, interval)]
+            else:
+                wkst = rrule._wkst
+                weekstart = ordinal-(dtstart.weekday()-wkst)%7
+                classes = [(weekstart+(wday-wkst)%7, interval*7)
+                           for wday in set(rrule._byweekday)]
+            self.terms = [(r%m, m, 1) for r, m in classes]
+        else:
+            if rrule._byweekday or not bymonthday:
+                return
+            monthindex = dtstart.year*12+dtstart.month-1
+            months = set(range(1, 13))
+            if rrule._bymonth:
+                months &= set(rrule._bymonth)
+            if freq == YEARLY:
+                classes = [(dtstart.year*12+month-1, interval*12)
+                           for month in months]
+            else:
+                classes = [_crt(monthindex, interval, month-1, 12)
+                           for month in months]
+            classes = [x for x in classes if x]
+            # The days of each month depend only on its length.
+            self.daysets = daysets = {}
+            for length in (28, 29, 30, 31):
+                days = set([x for x in rrule._bymonthday if x <= length])
+                days.update([length+x+1 for x in rrule._bynmonthday
+                             if -x <= length])
+                days = list(days)
+                days.sort()
+                daysets[length] = days
+            # Count the days in the months of each class, split by
+            # month of the year, and by leap year for february, where
+            # years multiple of 4, 100 and 400 are the months 1 modulo
+            # 48, 1200 and 4800.
+            leapdays = len(daysets[29])-len(daysets[28])
+            self.terms = terms = []
+            for r, m in classes:
+                for month in range(12):
+                    x = _crt(r, m, month, 12)
+                    if not x:
+                        continue
+                    length = M366RANGE[month+1]-M366RANGE[month]
+                    if month == 1:
+                        length = 28
+                        if leapdays:
+                            for mod, sign in ((48, 1), (1200, -1),
+                                              (4800, 1)):
+                                y = _crt(x[0], x[1], 1, mod)
+                                if y:
+                                    terms.append((y[0], y[1],
+                                                  sign*leapdays))
+                    if daysets[length]:
+                        terms.append((x[0], x[1], len(daysets[length])))
+            self.months = [(r%m, m) for r, m in classes]
+        self.possible = True
+        self.base = self._upto(dtstart, False)
+
+    def _upto(self, dt, inc):
+        # Number of occurrences in the periods before dt, or also at
+        # dt if inc is true, up to a constant which cancels out when
+        # subtracting base.
+        if self.months is not None:
+            index = dt.year*12+dt.month-1
+            n = 0
+            for r, m, weight in self.terms:
+                n += ((index-1-r)//m+1)*weight
+            for r, m in self.months:
+                if (index-r)%m == 0:
+                    days = self.daysets[monthdays(dt.year, dt.month)]
+                    i = bisect.bisect_left(days, dt.day)
+                    n += i
+                    match = i < len(days) and days[i] == dt.day
+                    break
+            else:
+                match = False
+        else:
+            ordinal = dt.toordinal()
+            n = 0
+            match = False
+            for r, m, weight in self.terms:
+                n += (ordinal-1-r)//m+1
+                if (ordinal-r)%m == 0:
+                    match = True
+        n *= len(self.timeset)
+        if match:
+            key = (dt.hour, dt.minute, dt.second)
+            if inc or dt.microsecond:
+                n += bisect.bisect_right(self.timeset, key)
+            else:
+                n += bisect.bisect_left(self.timeset, key)
+        return n
+
+    def countupto(self, dt, inc):
+        # Number of occurrences before dt, or also at dt if inc is true.
+        dtstart = self.dtstart
+        if dt < dtstart or dt == dtstart and not inc:
+            return 0
+        if self.step:
+            delta = dt-dtstart
+            q, r = divmod((delta.days*86400+delta.seconds)*1000000+
+                          delta.microseconds, self.step)
+            if r or inc:
+                q += 1
+            return q
+        return self._upto(dt, inc)-self.base
+
+# Parameter names of the rrule key parts, or None for those always
+# present. The key ends with dtstart and until.
+_keyparams = (None, None, None, "WKST", "BYSETPOS", "BYMONTH",
+              "BYMONTHDAY", "BYMONTHDAY", "BYYEARDAY", "BYEASTER",
+              "BYWEEKNO", "BYDAY", "BYDAY", "BYHOUR", "BYMINUTE",
+              "BYSECOND")
+
+# Constructor arguments for the days and times in a period, derived
+# together by rrule._setdays() and rrule._settimes().
+_dayparams = ("bymonth", "bymonthday", "byyearday", "byeaster",
+              "byweekno", "byweekday")
+_timeparams = ("byhour", "byminute", "bysecond")
+
+# Interned rules, by key. See rrule.interned().
+_interned = weakref.WeakValueDictionary()
+_internlock = thread.allocate_lock()
+
 class _iterinfo(object):
     __slots__ = ["rrule", "lastyear", "lastmonth",
                  "yearlen", "nextyearlen", "yearordinal", "yearweekday",
                  "mmask", "mrange", "mdaymask", "nmdaymask",
-                 "wdaymask", "wnomask", "nwdaymask", "eastermask"]
+                 "wdaymask", "wnomask", "nwdaymask", "eastermask",
+                 "yearmask", "daymask"]
 
     def __init__(self, rrule):
         for attr in self.__slots__:
@@ -829,13 +1994,11 @@ class _iterinfo(object):
         # Every mask is 7 days longer to handle cross-year weekly periods.
         rr = self.rrule
         if year != self.lastyear:
-            self.yearlen = 365+calendar.isleap(year)
-            self.nextyearlen = 365+calendar.isleap(year+1)
-            firstyday = datetime.date(year, 1, 1)
-            self.yearordinal = firstyday.toordinal()
-            self.yearweekday = firstyday.weekday()
+            self.yearlen = 365+isleap(year)
+            self.nextyearlen = 365+isleap(year+1)
+            self.yearordinal = yearordinal(year)
+            self.yearweekday = wday = yearweekday(year)
 
-            wday = datetime.date(year, 1, 1).weekday()
             if self.yearlen == 365:
                 self.mmask = M365MASK
                 self.mdaymask = MDAY365MASK
@@ -852,161 +2015,100 @@ class _iterinfo(object):
             if not rr._byweekno:
                 self.wnomask = None
             else:
-                self.wnomask = [0]*(self.yearlen+7)
-                #no1wkst = firstwkst = self.wdaymask.index(rr._wkst)
-                no1wkst = firstwkst = (7-self.yearweekday+rr._wkst)%7
-                if no1wkst >= 4:
-                    no1wkst = 0
-                    # Number of days in the year, plus the days we got
-                    # from last year.
-                    wyearlen = self.yearlen+(self.yearweekday-rr._wkst)%7
-                else:
-                    # Number of days in the year, minus the days we
-                    # left in last year.
-                    wyearlen = self.yearlen-no1wkst
-                div, mod = divmod(wyearlen, 7)
-                numweeks = div+mod//4
-                for n in rr._byweekno:
-                    if n < 0:
-                        n += numweeks+1
-                    if not (0 < n <= numweeks):
-                        continue
-                    if n > 1:
-                        i = no1wkst+(n-1)*7
-                        if no1wkst != firstwkst:
-                            i -= 7-firstwkst
-                    else:
-                        i = no1wkst
-                    for j in range(7):
-                        self.wnomask[i] = 1
-                        i += 1
-                        if self.wdaymask[i] == rr._wkst:
-                            break
-                if 1 in rr._byweekno:
-                    # Check week number 1 of next year as well
-                    # TODO: Check -numweeks for next year.
-                    i = no1wkst+numweeks*7
-                    if no1wkst != firstwkst:
-                        i -= 7-firstwkst
-                    if i < self.yearlen:
-                        # If week starts in next year, we
-                        # don't care about it.
-                        for j in range(7):
-                            self.wnomask[i] = 1
-                            i += 1
-                            if self.wdaymask[i] == rr._wkst:
-                                break
-                if no1wkst:
-                    # Check last week number of last year as
-                    # well. If no1wkst is 0, either the year
-                    # started on week start, or week number 1
-                    # got days from last year, so there are no
-                    # days from last year's last week number in
-                    # this year.
-                    if -1 not in rr._byweekno:
-                        lyearweekday = datetime.date(year-1,1,1).weekday()
-                        lno1wkst = (7-lyearweekday+rr._wkst)%7
-                        lyearlen = 365+calendar.isleap(year-1)
-                        if lno1wkst >= 4:
-                            lno1wkst = 0
-                            lnumweeks = 52+(lyearlen+
-                                           (lyearweekday-rr._wkst)%7)%7//4
-                        else:
-                            lnumweeks = 52+(self.yearlen-no1wkst)%7//4
-                    else:
-                        lnumweeks = -1
-                    if lnumweeks in rr._byweekno:
-                        for i in range(no1wkst):
-                            self.wnomask[i] = 1
+                self.wnomask = _wnomask(year, rr._wkst, rr._byweekno)
 
         if (rr._bynweekday and
             (month != self.lastmonth or year != self.lastyear)):
-            ranges = []
-            if rr._freq == YEARLY:
-                if rr._bymonth:
-                    for month in rr._bymonth:
-                        ranges.append(self.mrange[month-1:month+1])
-                else:
-                    ranges = [(0, self.yearlen)]
-            elif rr._freq == MONTHLY:
-                ranges = [self.mrange[month-1:month+1]]
-            if ranges:
-                # Weekly frequency won't get here, so we may not
-                # care about cross-year weekly periods.
-                self.nwdaymask = [0]*self.yearlen
-                for first, last in ranges:
-                    last -= 1
-                    for wday, n in rr._bynweekday:
-                        if n < 0:
-                            i = last+(n+1)*7
-                            i -= (self.wdaymask[i]-wday)%7
-                        else:
-                            i = first+(n-1)*7
-                            i += (7-self.wdaymask[i]+wday)%7
-                        if first <= i <= last:
-                            self.nwdaymask[i] = 1
-
-        if rr._byeaster:
-            self.eastermask = [0]*(self.yearlen+7)
+            self.nwdaymask = _nwdaymask(year, month, rr._freq,
+                                        rr._bymonth, rr._bynweekday)
+
+        if rr._byeaster and year != self.lastyear:
+            # The mask only depends on the year, so periods within
+            # the same year share it.
+            eastermask = [0]*(self.yearlen+7)
             eyday = easter.easter(year).toordinal()-self.yearordinal
             for offset in rr._byeaster:
-                self.eastermask[eyday+offset] = 1
+                eastermask[eyday+offset] = 1
+            self.eastermask = _tobits(eastermask)
+
+        if year != self.lastyear:
+            # Days passing every by* filter but the nth weekday one,
+            # which may change every month.
+            yearlen = self.yearlen
+            mask = (1<<(yearlen+7))-1
+            if rr._bymonth:
+                mask &= _monthbits(yearlen, rr._bymonth)
+            if rr._byweekno:
+                mask &= self.wnomask
+            if rr._byweekday:
+                mask &= _weekdaybits(yearlen, self.yearweekday,
+                                     rr._byweekday)
+            if rr._byeaster:
+                mask &= self.eastermask
+            if rr._bymonthday or rr._bynmonthday:
+                mask &= _mdaybits(yearlen, rr._bymonthday, rr._bynmonthday)
+            if rr._byyearday:
+                mask &= _ydaybits(yearlen, self.nextyearlen, rr._byyearday)
+            self.yearmask = self.daymask = mask
+        if self.nwdaymask is not None:
+            self.daymask = self.yearmask&self.nwdaymask
 
         self.lastyear = year
         self.lastmonth = month
 
-    def ydayset(self, year, month, day):
-        return range(self.yearlen), 0, self.yearlen
+    # The days of each period are the yearday indexes from start
+    # up to, but not including, end.
 
-    def mdayset(self, year, month, day):
-        set = [None]*self.yearlen
-        start, end = self.mrange[month-1:month+1]
-        for i in range(start, end):
-            set[i] = i
-        return set, start, end
+    def ydayrange(self, year, month, day):
+        return 0, self.yearlen
 
-    def wdayset(self, year, month, day):
+    def mdayrange(self, year, month, day):
+        return self.mrange[month-1], self.mrange[month]
+
+    def wdayrange(self, year, month, day):
         # We need to handle cross-year weeks here.
-        set = [None]*(self.yearlen+7)
-        i = datetime.date(year, month, day).toordinal()-self.yearordinal
-        start = i
+        i = start = self.mrange[month-1]+day-1
         for j in range(7):
-            set[i] = i
             i += 1
             #if (not (0 <= i < self.yearlen) or
             #    self.wdaymask[i] == self.rrule._wkst):
             # This will cross the year boundary, if necessary.
             if self.wdaymask[i] == self.rrule._wkst:
                 break
-        return set, start, i
+        return start, i
 
-    def ddayset(self, year, month, day):
-        set = [None]*self.yearlen
-        i = datetime.date(year, month, day).toordinal()-self.yearordinal
-        set[i] = i
-        return set, i, i+1
+    def ddayrange(self, year, month, day):
+        i = self.mrange[month-1]+day-1
+        return i, i+1
 
     def htimeset(self, hour, minute, second):
+        timesets = self.rrule._timesets
+        try:
+            return timesets[hour]
+        except KeyError:
+            pass
         set = []
         rr = self.rrule
         for minute in rr._byminute:
             for second in rr._bysecond:
-                set.append(datetime.time(hour, minute, second,
-                                         tzinfo=rr._tzinfo))
+                set.append((hour, minute, second))
         set.sort()
+        set = timesets[hour] = tuple(set)
         return set
 
     def mtimeset(self, hour, minute, second):
-        set = []
-        rr = self.rrule
-        for second in rr._bysecond:
-            set.append(datetime.time(hour, minute, second, tzinfo=rr._tzinfo))
-        set.sort()
+        timesets = self.rrule._timesets
+        try:
+            return timesets[hour, minute]
+        except KeyError:
+            pass
+        set = tuple([(hour, minute, second)
+                     for second in sorted(self.rrule._bysecond)])
+        timesets[hour, minute] = set
         return set
 
     def stimeset(self, hour, minute, second):
-        return (datetime.time(hour, minute, second,
-                tzinfo=self.rrule._tzinfo),)
+        return ((hour, minute, second),)
 
 
 class DatesHumanizer(HumanizerBase):
@@ -1046,6 +2148,50 @@ class rruleset(rrulebase):
         def __cmp__(self, other):
             return cmp(self.dt, other.dt)
 
+    class _revgenitem(_genitem):
+        # Newest first, for walking backwards.
+        def __cmp__(self, other):
+            return cmp(other.dt, self.dt)
+
+    class _pageitem(_genitem):
+        # Keeps track of how far its generator went, for cursors. The
+        # source is a sorted list of dates, or a rule, with state as
+        # made by dump().
+        def __init__(self, genlist, source, state):
+            self.source = source
+            self.last = None
+            self.same = 0
+            if type(source) is list:
+                self.total = state[0]
+                gen = iter(source[self.total:]).next
+            elif state[6] < 0:
+                # Exhausted.
+                self.total = -1
+                gen = iter(()).next
+            else:
+                self.last = source._loadlast(state)
+                self.total = state[6]
+                self.same = state[7]
+                gen = source._resume(state).next
+            rruleset._genitem.__init__(self, genlist, gen)
+
+        def next(self):
+            if self.dt == self.last:
+                self.same += 1
+            else:
+                self.same = 1
+            self.last = self.dt
+            self.total += 1
+            rruleset._genitem.next(self)
+
+        def dump(self, alive):
+            if type(self.source) is list:
+                return [self.total]
+            elif id(self) not in alive:
+                return [0]*6+[-1, 0]
+            return self.source._dumpresume(self.last, self.total,
+                                           self.same)
+
     def __init__(self, cache=False, original_str='', match_dtstarts=False):
         rrulebase.__init__(self, cache)
         self._rrule = []
@@ -1058,6 +2204,9 @@ class rruleset(rrulebase):
         self._match_dtstarts = match_dtstarts
 
     def rrule(self, rrule):
+        # The rule may be hashed somewhere already, so a copy of it is
+        # normalized instead.
+        rrule = rrule._copy(rrule._cache is not None)
         rrule.normalize_start() # this is not an elegant place to enforce this - needs some design thought
         self._rrule.append(rrule)
         if not self.first or rrule._dtstart < self.first:
@@ -1171,16 +2320,134 @@ class rruleset(rrulebase):
             if rlist and rlist[0] is ritem:
                 heapq.heapreplace(rlist, ritem)
         self._len = total
-        
+
+    def _page(self, state, size):
+        # Same as _iter(), stopping before the occurrence after the
+        # page, with the state of every generator in the cursor: how
+        # many rdates and exdates were used, and where each rrule and
+        # exrule stopped, in that order.
+        rules = self._rrule+self._exrule
+        if state is None:
+            state = [0, 0]+[0]*8*len(rules)
+        elif len(state) != 2+8*len(rules):
+            raise ValueError, "invalid cursor"
+        self._rdate.sort()
+        self._exdate.sort()
+        rlist = []
+        exlist = []
+        items = [self._pageitem(rlist, self._rdate, state[:1]),
+                 self._pageitem(exlist, self._exdate, state[1:2])]
+        for i, rr in enumerate(rules):
+            if i < len(self._rrule):
+                genlist = rlist
+            else:
+                genlist = exlist
+            items.append(self._pageitem(genlist, rr,
+                                        state[2+i*8:10+i*8]))
+        heapq.heapify(rlist)
+        heapq.heapify(exlist)
+        result = []
+        while rlist:
+            ritem = rlist[0]
+            dt = ritem.dt
+            while exlist and exlist[0] < ritem:
+                exitem = exlist[0]
+                exitem.next()
+                if exlist and exlist[0] is exitem:
+                    heapq.heapreplace(exlist, exitem)
+            if not exlist or ritem != exlist[0]:
+                if len(result) == size:
+                    break
+                result.append(dt)
+            while rlist and rlist[0].dt == dt:
+                ritem = rlist[0]
+                ritem.next()
+                if rlist and rlist[0] is ritem:
+                    heapq.heapreplace(rlist, ritem)
+        else:
+            return result, None
+        alive = set([id(x) for x in rlist+exlist])
+        state = []
+        for item in items:
+            state.extend(item.dump(alive))
+        return result, state
+
+    def _iter_before(self, dt, inc):
+        # Same as _iter(), walking backwards from dt, or from the end
+        # of the latest rule when dt is None.
+        def before(x, dt):
+            if dt is None:
+                return iter(reversed(x)).next
+            return iter(x.iter_before(dt, inc)).next
+        rdate = [x for x in self._rdate
+                 if dt is None or x < dt or (x == dt and inc)]
+        rdate.sort(reverse=True)
+        rlist = []
+        self._revgenitem(rlist, iter(rdate).next)
+        for rr in self._rrule:
+            self._revgenitem(rlist, before(rr, dt))
+        heapq.heapify(rlist)
+        if not rlist:
+            return iter(())
+        # Exclusions only matter from the newest item down.
+        top = rlist[0].dt
+        exdate = [x for x in self._exdate if x <= top]
+        exdate.sort(reverse=True)
+        exlist = []
+        self._revgenitem(exlist, iter(exdate).next)
+        for rr in self._exrule:
+            self._revgenitem(exlist, iter(rr.iter_before(top, True)).next)
+        heapq.heapify(exlist)
+        return self._merge(rlist, exlist)
+
+    def _iter_after(self, dt, inc):
+        # Same as _iter(), starting every generator at dt.
+        rdate = [x for x in self._rdate if x > dt or (x == dt and inc)]
+        rdate.sort()
+        rlist = []
+        self._genitem(rlist, iter(rdate).next)
+        for rr in self._rrule:
+            self._genitem(rlist, iter(rr.iter_after(dt, inc)).next)
+        heapq.heapify(rlist)
+        exdate = [x for x in self._exdate if x >= dt]
+        exdate.sort()
+        exlist = []
+        self._genitem(exlist, iter(exdate).next)
+        for rr in self._exrule:
+            self._genitem(exlist, iter(rr.iter_after(dt, True)).next)
+        heapq.heapify(exlist)
+        return self._merge(rlist, exlist)
+
+    def _merge(self, rlist, exlist):
+        # Merge the generators of rlist, dropping the dates found in
+        # the ones of exlist, in the order their items compare in.
+        lastdt = None
+        while rlist:
+            ritem = rlist[0]
+            if not lastdt or lastdt != ritem.dt:
+                while exlist and exlist[0] < ritem:
+                    exitem = exlist[0]
+                    exitem.next()
+                    if exlist and exlist[0] is exitem:
+                        heapq.heapreplace(exlist, exitem)
+                if not exlist or ritem != exlist[0]:
+                    yield ritem.dt
+                lastdt = ritem.dt
+            ritem.next()
+            if rlist and rlist[0] is ritem:
+                heapq.heapreplace(rlist, ritem)
+
     def remove_instance(self, dt):
         if dt in self:
             if dt in self._rdate:
                 self._rdate.remove(dt)
             else:
-                for r in self._rrule:
+                for i, r in enumerate(self._rrule):
                     if dt == r._dtstart:
                         next = r[1]
-                        r._dtstart = next
+                        # Copied rather than changed, as for rrule().
+                        r = self._rrule[i] = r._copy(r._cache is not None)
+                        r._setdtstart(next)
                         return
                 self._exdate.append(dt)
                 
@@ -1412,4 +2679,204 @@ class _rrulestr:
 
 rrulestr = _rrulestr()
 
+def freebusy(rules, window):
+    """
+    Generate the free and busy periods within window, a (start, end)
+    tuple, out of an iterable of (rule, duration) tuples, where rule
+    is an rrule or rruleset instance, and each of its occurrences
+    keeps busy for the timedelta duration. Periods are (start, end,
+    busy) tuples, in order, covering the window.
+
+    The occurrences of every rule are merged with a heap, as rruleset
+    does, and overlapping ones are joined as they come, so only the
+    next occurrence of each rule is kept around.
+    """
+    start, end = window
+    heap = []
+    for i, (rule, duration) in enumerate(rules):
+        if duration <= datetime.timedelta(0):
+            continue
+        # Occurrences from before start may still be going on.
+        gen = iter(rule.iter_after(start-duration)).next
+        try:
+            dt = gen()
+        except StopIteration:
+            continue
+        if dt < end:
+            heap.append((dt, i, gen, duration))
+    heapq.heapify(heap)
+    free = start
+    busystart = busyend = None
+    while heap:
+        dt, i, gen, duration = heap[0]
+        if busyend is None or dt > busyend:
+            if busyend is not None:
+                yield busystart, busyend, True
+                free = busyend
+            busystart = max(dt, start)
+            if busystart > free:
+                yield free, busystart, False
+            busyend = dt+duration
+        elif dt+duration > busyend:
+            busyend = dt+duration
+        try:
+            dt = gen()
+        except StopIteration:
+            heapq.heappop(heap)
+            continue
+        if dt < end:
+            heapq.heapreplace(heap, (dt, i, gen, duration))
+        else:
+            heapq.heappop(heap)
+    if busyend is not None:
+        # Only the last busy period may go past the window.
+        busyend = min(busyend, end)
+        yield busystart, busyend, True
+        free = busyend
+    if free < end:
+        yield free, end, False
+
+def _rulespan(rule):
+    # The frequency of rule, its first possible occurrence, and its
+    # last one, or None when there's no bound.
+    if isinstance(rule, rrule):
+        return rule._freq, rule._dtstart, rule._until
+    starts = [x._dtstart for x in rule._rrule if x._dtstart]
+    ends = [x._until for x in rule._rrule]
+    freq = None
+    if rule._rrule:
+        freq = min([x._freq for x in rule._rrule])
+    start = min(starts+rule._rdate or [None])
+    if None in ends:
+        return freq, start, None
+    return freq, start, max(ends+rule._rdate or [None])
+
+class _indexbucket(object):
+    __slots__ = ["start", "end", "rules", "heap", "mark"]
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        # Key -> (rule, sequence). Heap entries are [next occurrence,
+        # sequence, key], and the ones whose sequence isn't in rules
+        # anymore are dropped as they're found.
+        self.rules = {}
+        self.heap = []
+        self.mark = None
+
+    def add(self, key, rule, seq, start, end):
+        self.rules[key] = rule, seq
+        if start < self.start:
+            self.start = start
+        if end is None or self.end is not None and end > self.end:
+            self.end = end
+        if self.mark is not None:
+            dt = rule.after(self.mark, inc=True)
+            if dt is not None:
+                heapq.heappush(self.heap, [dt, seq, key])
+
+    def query(self, start, end, result):
+        rules = self.rules
+        heap = self.heap
+        if self.mark is None or start < self.mark:
+            # Going back in time, so find every next occurrence.
+            self.heap = heap = []
+            for key, (rule, seq) in rules.iteritems():
+                dt = rule.after(start, inc=True)
+                if dt is not None:
+                    heap.append([dt, seq, key])
+            heapq.heapify(heap)
+        else:
+            # Only the rules whose next occurrence is before start
+            # need a new one.
+            while heap and heap[0][0] < start:
+                entry = heap[0]
+                rule, seq = rules.get(entry[2], (None, None))
+                if seq == entry[1]:
+                    entry[0] = rule.after(start, inc=True)
+                if seq != entry[1] or entry[0] is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, entry)
+        self.mark = start
+        # The entries before end are a subtree at the top of the heap.
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i < len(heap) and heap[i][0] < end:
+                dt, seq, key = heap[i]
+                if rules.get(key, (None, None))[1] == seq:
+                    result.append(key)
+                stack.append(2*i+1)
+                stack.append(2*i+2)
+
+class RuleIndex(object):
+    """
+    Index over many rrule and rruleset instances, telling which of them
+    have an occurrence in a window of time.
+
+    Rules are kept in buckets by frequency and by the years of their
+    first and last possible occurrences, so that queries skip the
+    buckets out of the window. Each bucket keeps a heap with the next
+    occurrence of each of its rules since the start of the last query,
+    and a query moving forwards in time only refreshes the ones which
+    are before its start, and looks at the ones before its end.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._where = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def add(self, rule, key=None):
+        """
+        Add rule to the index, under key, or a new integer key if key
+        is None, replacing what was there with the same key. Returns key.
+        """
+        if key is None:
+            # Not the rule itself, as equal rules would share it.
+            key = self._seq.next()
+        if key in self._where:
+            self.remove(key)
+        freq, start, end = _rulespan(rule)
+        if start is None:
+            # Never happens.
+            self._where[key] = None
+            return key
+        bucketkey = freq, start.year, end and end.year
+        bucket = self._buckets.get(bucketkey)
+        if bucket is None:
+            bucket = self._buckets[bucketkey] = _indexbucket(start, end)
+        bucket.add(key, rule, self._seq.next(), start, end)
+        self._where[key] = bucketkey
+        return key
+
+    def remove(self, key):
+        """Remove the rule under key from the index."""
+        bucketkey = self._where.pop(key)
+        if bucketkey is not None:
+            bucket = self._buckets[bucketkey]
+            del bucket.rules[key]
+            if not bucket.rules:
+                del self._buckets[bucketkey]
+
+    def query(self, start, end):
+        """
+        Return a list with the keys of the rules which have an
+        occurrence at start or after it, and before end, in no
+        particular order.
+        """
+        result = []
+        for bucket in self._buckets.itervalues():
+            if (bucket.start < end and
+                (bucket.end is None or bucket.end >= start)):
+                bucket.query(start, end, result)
+        return result
+
 # vim:ts=4:sw=4:et
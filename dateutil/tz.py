@@ -502,6 +502,9 @@ class tzrange(datetime.tzinfo):
                     hours=+1, month=10, day=31, weekday=relativedelta.SU(-1))
         else:
             self._end_delta = end
+        # Year -> (ordinal of january 1st, start and end of DST in
+        # seconds since then), filled lazily by _isdst().
+        self._transitions = {}
 
     def utcoffset(self, dt):
         if self._isdst(dt):
@@ -524,10 +527,23 @@ class tzrange(datetime.tzinfo):
     def _isdst(self, dt):
         if not self._start_delta:
             return False
-        year = datetime.datetime(dt.year,1,1)
-        start = year+self._start_delta
-        end = year+self._end_delta
-        dt = dt.replace(tzinfo=None)
+        # Instances unpickled from before, or made by subclasses which
+        # don't call __init__(), have no transitions yet.
+        transitions = self.__dict__.setdefault("_transitions", {})
+        try:
+            yearordinal, start, end = transitions[dt.year]
+        except KeyError:
+            year = datetime.datetime(dt.year,1,1)
+            start = year+self._start_delta-year
+            end = year+self._end_delta-year
+            yearordinal = year.toordinal()
+            start = start.days*86400+start.seconds
+            end = end.days*86400+end.seconds
+            transitions[dt.year] = yearordinal, start, end
+        # Transitions fall on whole seconds, so microseconds may
+        # be ignored.
+        dt = ((dt.toordinal()-yearordinal)*86400+
+              dt.hour*3600+dt.minute*60+dt.second)
         if start < end:
             return dt >= start and dt < end
         else:
@@ -551,6 +567,9 @@ class tzrange(datetime.tzinfo):
 
     __reduce__ = object.__reduce__
 
+TZSTRCACHESIZE = 256
+_tzstrcache = {}
+
 class tzstr(tzrange):
     
     def __init__(self, s):
@@ -559,6 +578,13 @@ class tzstr(tzrange):
             from dateutil import parser
         self._s = s
 
+        # Devices tend to send the same few strings over and over,
+        # so reuse the state built for an earlier instance.
+        state = _tzstrcache.get(s)
+        if state is not None:
+            self.__dict__.update(state)
+            return
+
         res = parser._parsetz(s)
         if res is None:
             raise ValueError, "unknown string format"
@@ -583,6 +609,10 @@ class tzstr(tzrange):
             if self._start_delta:
                 self._end_delta = self._delta(res.end, isend=1)
 
+        if len(_tzstrcache) >= TZSTRCACHESIZE:
+            _tzstrcache.clear()
+        _tzstrcache[s] = self.__dict__.copy()
+
     def _delta(self, x, isend=0):
         kwargs = {}
         if x.month is not None:
@@ -0,0 +1,275 @@
+"""
+Microbenchmarks for dateutil's hot paths.
+
+Run as "python sandbox/bench.py [name ...]" from the source tree,
+where each name is one of the bench_* functions below, without the
+prefix. All of them are run when no name is given.
+"""
+import calendar
+import datetime
+import itertools
+import timeit
+import sys
+
+from dateutil import _calendar
+from dateutil import easter
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import *
+
+def timed(func, number):
+    """Best of three runs, in microseconds per call."""
+    return min(timeit.repeat(func, number=number, repeat=3))/number*1e6
+
+def report(name, *results):
+    print "%-40s" % name, " ".join(["%10.3fus" % x for x in results])
+
+def bench_calendar():
+    print "calendar module vs. dateutil._calendar:"
+    report("monthrange()[1] / monthdays()",
+           timed(lambda: calendar.monthrange(2003, 2)[1], 100000),
+           timed(lambda: _calendar.monthdays(2003, 2), 100000))
+    report("isleap()",
+           timed(lambda: calendar.isleap(2003), 100000),
+           timed(lambda: _calendar.isleap(2003), 100000))
+    report("date(y,1,1).toordinal() / yearordinal()",
+           timed(lambda: datetime.date(2003, 1, 1).toordinal(), 100000),
+           timed(lambda: _calendar.yearordinal(2003), 100000))
+    report("date(y,1,1).weekday() / yearweekday()",
+           timed(lambda: datetime.date(2003, 1, 1).weekday(), 100000),
+           timed(lambda: _calendar.yearweekday(2003), 100000))
+    print "hot paths using it:"
+    dt = datetime.datetime(2003, 1, 31, 10)
+    rd = relativedelta(months=+1, leapdays=-1)
+    report("datetime+relativedelta", timed(lambda: dt+rd, 100000))
+    dtstart = datetime.datetime(1900, 1, 1)
+    report("rrule(YEARLY, byweekno=20), 100 years",
+           timed(lambda: list(rrule(YEARLY, byweekno=20, byweekday=MO,
+                                    count=100, dtstart=dtstart)), 100))
+    report("rrule(HOURLY, interval=25), 1000",
+           timed(lambda: list(rrule(HOURLY, interval=25, count=1000,
+                                    dtstart=dtstart)), 10))
+
+def bench_easter():
+    report("easter()", timed(lambda: easter.easter(2003), 100000))
+    report("easter() for 100 years / easter_range()",
+           timed(lambda: [easter.easter(y) for y in range(1900, 2000)], 1000),
+           timed(lambda: easter.easter_range(1900, 1999), 1000))
+    dtstart = datetime.datetime(1900, 1, 1)
+    report("rrule(MONTHLY, byeaster=0), 100 years",
+           timed(lambda: list(rrule(MONTHLY, byeaster=0, count=100,
+                                    dtstart=dtstart)), 100))
+
+def bench_masks():
+    from dateutil import rrule as rrulemodule
+    dtstart = datetime.datetime(1997, 1, 1)
+    rules = [rrule(YEARLY, byweekno=range(1, 54, 2), byweekday=MO,
+                   dtstart=dtstart),
+             rrule(MONTHLY, byweekday=(FR(-1), MO(1), TU(2)),
+                   dtstart=dtstart)]
+    def rebuild():
+        for rr in rules:
+            ii = rrulemodule._iterinfo(rr)
+            for year in range(1997, 2017):
+                for month in range(1, 13):
+                    ii.rebuild(year, month)
+    report("_iterinfo.rebuild(), 2 rules, 240 months", timed(rebuild, 20))
+
+def bench_filters():
+    dtstart = datetime.datetime(1997, 1, 1)
+    report("rrule(YEARLY, 5 by* parts), 50",
+           timed(lambda: list(rrule(YEARLY, bymonth=(1, 3, 6, 9, 12),
+                                    bymonthday=(1, 13, -1),
+                                    byweekday=(MO, FR),
+                                    byyearday=range(1, 366, 3),
+                                    byweekno=range(1, 53, 2),
+                                    count=50, dtstart=dtstart)), 10))
+    report("rrule(MONTHLY, friday 13th), 100",
+           timed(lambda: list(rrule(MONTHLY, bymonthday=13, byweekday=FR,
+                                    count=100, dtstart=dtstart)), 10))
+    report("rrule(DAILY, bymonth=(1, 7)), 2000",
+           timed(lambda: list(rrule(DAILY, bymonth=(1, 7), count=2000,
+                                    dtstart=dtstart)), 10))
+
+def bench_subdaily():
+    dtstart = datetime.datetime(1997, 1, 1)
+    report("rrule(SECONDLY), 10000",
+           timed(lambda: list(rrule(SECONDLY, count=10000,
+                                    dtstart=dtstart)), 3))
+    report("rrule(MINUTELY, bysecond=(0, 30)), 5000",
+           timed(lambda: list(rrule(MINUTELY, bysecond=(0, 30), count=5000,
+                                    dtstart=dtstart)), 3))
+    report("rrule(HOURLY, 4 minutes), 5000",
+           timed(lambda: list(rrule(HOURLY, byminute=(0, 15, 30, 45),
+                                    count=5000, dtstart=dtstart)), 3))
+
+def bench_skip():
+    dtstart = datetime.datetime(1997, 1, 1)
+    report("rrule(SECONDLY, byhour=3, byminute=0), 120",
+           timed(lambda: list(rrule(SECONDLY, byhour=3, byminute=0,
+                                    count=120, dtstart=dtstart)), 10))
+    report("rrule(MINUTELY, interval=7, 2x2 by*), 100",
+           timed(lambda: list(rrule(MINUTELY, interval=7, byhour=(6, 18),
+                                    byminute=(0, 30), count=100,
+                                    dtstart=dtstart)), 10))
+
+def bench_setpos():
+    dtstart = datetime.datetime(1997, 1, 1)
+    report("rrule(MONTHLY, last weekday), 240",
+           timed(lambda: list(rrule(MONTHLY, byweekday=(MO, TU, WE, TH, FR),
+                                    bysetpos=-1, count=240,
+                                    dtstart=dtstart)), 10))
+    report("rrule(MONTHLY, 10 positions), 500",
+           timed(lambda: list(rrule(MONTHLY, byweekday=(MO, TU, WE, TH, FR),
+                                    byhour=(9, 17),
+                                    bysetpos=(1, 2, 3, 4, 5,
+                                              -1, -2, -3, -4, -5),
+                                    count=500, dtstart=dtstart)), 10))
+
+def bench_reverse():
+    dtstart = datetime.datetime(1997, 1, 1)
+    rr = rrule(DAILY, byweekday=(MO, WE, FR), dtstart=dtstart,
+               until=datetime.datetime(2097, 1, 1))
+    report("rrule(DAILY, 100 years)[-10:]",
+           timed(lambda: list(rr)[-10:], 3))
+    report("10 items from reversed(rrule(DAILY, 100 years))",
+           timed(lambda: list(itertools.islice(reversed(rr), 10)), 1000))
+    report("rrule(DAILY, unbounded).before(2097)",
+           timed(lambda: rrule(DAILY, dtstart=dtstart)
+                             .before(datetime.datetime(2097, 1, 1)), 1000))
+
+def bench_count():
+    dtstart = datetime.datetime(1997, 1, 1)
+    after = datetime.datetime(2010, 1, 1)
+    before = datetime.datetime(2020, 1, 1)
+    rules = [rrule(WEEKLY, byweekday=(MO, WE, FR), byhour=(9, 17),
+                   dtstart=dtstart),
+             rrule(MONTHLY, bymonthday=(1, 15, -1), dtstart=dtstart),
+             rrule(HOURLY, interval=5, dtstart=dtstart)]
+    for rr in rules:
+        rr.count_between(after, before)
+    report("len(between()), 3 rules, 10 years",
+           timed(lambda: [len(rr.between(after, before)) for rr in rules],
+                 3))
+    report("count_between(), 3 rules, 10 years",
+           timed(lambda: [rr.count_between(after, before) for rr in rules],
+                 10000))
+
+def bench_page():
+    dtstart = datetime.datetime(1997, 1, 1)
+    rr = rrule(DAILY, byweekday=(MO, WE, FR), byhour=(9, 17),
+               dtstart=dtstart)
+    items, cursor = rr.page(size=50*99)
+    report("page 100 by islice() / page(cursor)",
+           timed(lambda: list(itertools.islice(rr, 50*99, 50*100)), 3),
+           timed(lambda: rr.page(cursor), 100))
+
+def bench_index():
+    import random
+    rnd = random.Random(0)
+    rules = []
+    for i in range(1000):
+        dtstart = datetime.datetime(rnd.randint(1995, 2005),
+                                    rnd.randint(1, 12), rnd.randint(1, 28),
+                                    rnd.randint(8, 18))
+        until = None
+        if rnd.random() < .5:
+            until = dtstart+datetime.timedelta(days=rnd.randint(30, 3000))
+        freq = rnd.choice((YEARLY, MONTHLY, WEEKLY, DAILY))
+        rules.append(rrule(freq, interval=rnd.choice((1, 2, 4)),
+                           until=until, dtstart=dtstart))
+    index = RuleIndex()
+    for rr in rules:
+        index.add(rr)
+    start = datetime.datetime(2006, 1, 1)
+    week = datetime.timedelta(days=7)
+    second = datetime.timedelta(seconds=1)
+    def brute():
+        for i in range(5):
+            a = start+i*week
+            [rr for rr in rules if rr.between(a-second, a+week)]
+    def indexed():
+        for i in range(5):
+            a = start+i*week
+            index.query(a, a+week)
+    report("1000 rules, 5 weeks, between() / index",
+           timed(brute, 1), timed(indexed, 1))
+
+def bench_freebusy():
+    import random
+    rnd = random.Random(0)
+    rules = []
+    for i in range(200):
+        dtstart = datetime.datetime(2005, 1, rnd.randint(1, 28),
+                                    rnd.randint(8, 18), rnd.choice((0, 30)))
+        rr = rrule(rnd.choice((WEEKLY, DAILY)), interval=rnd.randint(1, 3),
+                   dtstart=dtstart)
+        rules.append((rr, datetime.timedelta(minutes=rnd.choice((30, 60)))))
+    window = datetime.datetime(2006, 1, 1), datetime.datetime(2006, 2, 1)
+    def expand():
+        start, end = window
+        busy = []
+        for rr, duration in rules:
+            for dt in rr.between(start-duration, end):
+                busy.append((max(dt, start), min(dt+duration, end)))
+        busy.sort()
+        merged = []
+        for a, b in busy:
+            if merged and a <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        return merged
+    report("200 rules, a month, expand and merge",
+           timed(expand, 1))
+    report("200 rules, a month, freebusy()",
+           timed(lambda: list(freebusy(rules, window)), 10))
+
+def bench_optimized():
+    dtstart = datetime.datetime(1997, 1, 1)
+    for name, freq, kwargs, count in [
+        ("rrule(DAILY, byweekday=MO), 500", DAILY,
+         dict(byweekday=MO), 500),
+        ("rrule(HOURLY, byhour=9), 500", HOURLY,
+         dict(byhour=9, byminute=0), 500)]:
+        def run(optimize):
+            rr = rrule(freq, count=count, dtstart=dtstart, **kwargs)
+            if not optimize:
+                rr._optimized = False
+            return list(rr)
+        report(name+" / optimized",
+               timed(lambda: run(False), 10), timed(lambda: run(True), 10))
+
+def bench_intern():
+    dtstart = datetime.datetime(1997, 1, 1)
+    def build():
+        return [rrule(WEEKLY, byweekday=(MO, WE, FR), count=100,
+                      dtstart=dtstart) for i in range(100)]
+    report("100 equal rules, list() / interned()",
+           timed(lambda: [list(rr) for rr in build()], 3),
+           timed(lambda: [list(rr.interned()) for rr in build()], 3))
+    rules = [rrule(WEEKLY, byweekday=(MO, WE, FR), dtstart=dtstart)
+             for i in range(2)]
+    report("repetition_str() == / compare_rrules()",
+           timed(lambda: rules[0].repetition_str() ==
+                         rules[1].repetition_str(), 10000),
+           timed(lambda: rules[0].compare_rrules(rules[1]), 10000))
+
+def bench_template():
+    dtstart = datetime.datetime(1997, 1, 1)
+    template = rrule(WEEKLY, byweekday=(MO, WE, FR), byhour=(9, 17),
+                     dtstart=dtstart)
+    def build():
+        for i in xrange(1000000):
+            rrule(WEEKLY, byweekday=(MO, WE, FR), byhour=(9, 17),
+                  count=i, dtstart=dtstart)
+    def replace():
+        for i in xrange(1000000):
+            template.replace(count=i)
+    report("1M rules, rrule() / replace(), per rule",
+           timed(build, 1)/1e6, timed(replace, 1)/1e6)
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or sorted([x[6:] for x in globals().keys()
+                                    if x.startswith("bench_")])
+    for name in names:
+        globals()["bench_"+name]()
@@ -2,9 +2,7 @@ from rrule import *
 
 class rrulewrapper:
     def __init__(self, freq, **kwargs):
-        self._construct = kwargs.copy()
-        self._construct["freq"] = freq
-        self._rrule = rrule(**self._construct)
+        self._rrule = rrule(freq, **kwargs)
 
     def __getattr__(self, name):
         if name in self.__dict__:
@@ -12,5 +10,4 @@ class rrulewrapper:
         return getattr(self._rrule, name)
     
     def set(self, **kwargs):
-        self._construct.update(kwargs)
-        self._rrule = rrule(**self._construct)
+        self._rrule = self._rrule.replace(**kwargs)
@@ -3,6 +3,7 @@
 from cStringIO import StringIO
 import unittest
 import calendar
+import itertools
 import time
 import base64
 import os
@@ -129,6 +130,198 @@ class RelativeDeltaTest(unittest.TestCase):
                          relativedelta(years=+25, months=+5, days=+11,
                                        hours=+12))
 
+    def testDiffMonthEnds(self):
+        self.assertEqual(relativedelta(date(2003, 2, 28), date(2003, 1, 31)),
+                         relativedelta(months=+1))
+        self.assertEqual(relativedelta(date(2003, 1, 31), date(2003, 2, 28)),
+                         relativedelta(days=-28))
+        self.assertEqual(relativedelta(datetime(2004, 2, 29, 1),
+                                       datetime(2003, 3, 31, 2)),
+                         relativedelta(months=+10, days=+28, hours=+23))
+        self.assertEqual(relativedelta(datetime(2003, 3, 1),
+                                       datetime(2003, 3, 31, 0, 0, 0, 1)),
+                         relativedelta(days=-30, seconds=-1,
+                                       microseconds=+999999))
+
+    def testDiffTZ(self):
+        self.assertEqual(relativedelta(datetime(2003, 9, 17, 1,
+                                                tzinfo=tzoffset(None, 3600)),
+                                       datetime(2003, 8, 17, tzinfo=tzutc())),
+                         relativedelta(months=+1))
+
+    def testDiffRandom(self):
+        # Compare with the result of searching for the month delta.
+        import random
+        rnd = random.Random(1)
+        for i in range(2000):
+            dt1 = datetime(2000, 1, 1)+timedelta(days=rnd.randint(0, 1500),
+                                                 seconds=rnd.randint(0, 3)*3600,
+                                                 microseconds=rnd.randint(0, 1))
+            dt2 = datetime(2000, 1, 1)+timedelta(days=rnd.randint(0, 1500),
+                                                 seconds=rnd.randint(0, 3)*3600,
+                                                 microseconds=rnd.randint(0, 1))
+            months = (dt1.year*12+dt1.month)-(dt2.year*12+dt2.month)
+            while dt1 >= dt2 and dt2+relativedelta(months=months) > dt1:
+                months -= 1
+            while dt1 < dt2 and dt2+relativedelta(months=months) < dt1:
+                months += 1
+            delta = dt1-(dt2+relativedelta(months=months))
+            self.assertEqual(relativedelta(dt1, dt2),
+                             relativedelta(months=months,
+                                           seconds=delta.days*86400+
+                                                   delta.seconds,
+                                           microseconds=delta.microseconds))
+
+    def testApplyMany(self):
+        dates = [date(2003, 1, 31), datetime(2004, 2, 29, 23, 30),
+                 datetime(2003, 9, 17, 20, 54, 47, 282310, tzinfo=tzutc())]
+        for rd in [relativedelta(months=+1, day=31),
+                   relativedelta(years=-1, leapdays=1, weekday=FR(-2)),
+                   relativedelta(hours=+30, minute=5, weekday=MO),
+                   relativedelta(nlyearday=100, microseconds=-1)]:
+            self.assertEqual(rd.apply_many(dates), [dt+rd for dt in dates])
+            self.assertEqual(rd.apply_many(iter(dates)),
+                             [dt+rd for dt in dates])
+
+    def testApplyManyOrdinals(self):
+        import array
+        ordinals = array.array("l", [date(2003, 1, 31).toordinal(),
+                                     date(2004, 2, 29).toordinal()])
+        self.assertEqual(relativedelta(months=+1).apply_many(ordinals),
+                         array.array("l", [date(2003, 2, 28).toordinal(),
+                                           date(2004, 3, 29).toordinal()]))
+        self.assertRaises(ValueError,
+                          relativedelta(hours=+1).apply_many, ordinals)
+
+    def testApplyManyInvalid(self):
+        self.assertRaises(TypeError, relativedelta(days=1).apply_many, [1])
+
+    def testImmutable(self):
+        rd = relativedelta(months=+1)
+        self.assertRaises(AttributeError, setattr, rd, "months", 2)
+        self.assertRaises(AttributeError, setattr, rd, "foo", 2)
+        self.assertRaises(AttributeError, delattr, rd, "months")
+        self.assertEqual(rd, relativedelta(months=+1))
+
+    def testHash(self):
+        d = {relativedelta(months=+1, weekday=FR): 1}
+        self.assertEqual(d[relativedelta(months=+1, weekday=FR(+1))], 1)
+        self.assertEqual(hash(relativedelta(hours=+25)),
+                         hash(relativedelta(days=+1, hours=+1)))
+        self.assertNotEqual(relativedelta(microseconds=+1), relativedelta())
+
+    def testPickle(self):
+        import pickle
+        rd = relativedelta(years=+1, day=31, weekday=MO(-1), hour=10)
+        for protocol in range(3):
+            self.assertEqual(pickle.loads(pickle.dumps(rd, protocol)), rd)
+
+    def testMutable(self):
+        rd = mutablerelativedelta(months=+1)
+        rd.days = 7
+        self.assertEqual(rd, relativedelta(months=+1, days=+7))
+        self.assertEqual(date(2003, 9, 17)+rd, date(2003, 10, 24))
+        rd = -rd
+        self.assertTrue(isinstance(rd, mutablerelativedelta))
+        rd.months = 0
+        self.assertEqual(date(2003, 9, 17)+rd, date(2003, 9, 10))
+        self.assertRaises(TypeError, hash, rd)
+
+    def testAddAbsoluteMicrosecond(self):
+        self.assertEqual(relativedelta(second=1)+relativedelta(microsecond=5),
+                         relativedelta(second=1, microsecond=5))
+        self.assertEqual(relativedelta(microsecond=5)-relativedelta(second=1),
+                         relativedelta(second=1, microsecond=5))
+
+    def testCompose(self):
+        deltas = [relativedelta(months=+1, day=31), relativedelta(days=+1),
+                  relativedelta(hour=10)]
+        self.assertEqual(relativedelta.compose(*deltas),
+                         [relativedelta(months=+1, day=31, days=+1, hour=10)])
+        dt = self.now
+        for delta in deltas:
+            dt += delta
+        self.assertEqual(dt, datetime(2003, 11, 1, 10, 54, 47, 282310))
+        self.assertEqual(self.now+relativedelta.compose(*deltas)[0], dt)
+
+    def testComposeUnfusable(self):
+        deltas = [relativedelta(months=+1), relativedelta(months=+1),
+                  relativedelta(weekday=FR), relativedelta(days=+1),
+                  relativedelta()]
+        self.assertEqual(relativedelta.compose(*deltas), deltas[:4])
+        deltas = [relativedelta(hours=+12), relativedelta(hours=+12)]
+        self.assertEqual(relativedelta.compose(*deltas), deltas)
+        deltas = [relativedelta(hours=+2), relativedelta(hour=10)]
+        self.assertEqual(relativedelta.compose(*deltas), deltas)
+        self.assertEqual(relativedelta.compose(), [])
+
+    def testCompile(self):
+        for rd in [relativedelta(months=+1, day=31),
+                   relativedelta(days=+1, hours=+2),
+                   relativedelta(years=-1, leapdays=-1, weekday=FR(-2)),
+                   relativedelta(day=31, weekday=FR(-1), hour=9)]:
+            add = rd.compile()
+            for dt in [self.now, self.today, date(2004, 2, 29)]:
+                self.assertEqual(add(dt), dt+rd)
+                self.assertEqual(type(add(dt)), type(dt+rd))
+            self.assertRaises(TypeError, add, 1)
+
+    def testRange(self):
+        rd = relativedelta(months=+1)
+        self.assertEqual(list(rd.range(date(2003, 1, 31), count=4)),
+                         [date(2003, 1, 31), date(2003, 2, 28),
+                          date(2003, 3, 31), date(2003, 4, 30)])
+        self.assertEqual(list(rd.range(date(2003, 1, 31),
+                                       date(2003, 3, 31))),
+                         [date(2003, 1, 31), date(2003, 2, 28)])
+        self.assertEqual(list(relativedelta(months=-1).range(
+                                    date(2003, 3, 31), date(2003, 1, 1))),
+                         [date(2003, 3, 31), date(2003, 2, 28),
+                          date(2003, 1, 31)])
+
+    def testRangeMultiply(self):
+        for rd in [relativedelta(years=+1, months=+5, day=31),
+                   relativedelta(days=+3, hours=+7, microseconds=+10),
+                   relativedelta(months=-2, leapdays=-1, weekday=FR(-1))]:
+            for dt in [self.now, datetime(2004, 2, 29, 10)]:
+                self.assertEqual(list(rd.range(dt, count=30)),
+                                 [dt+rd*n for n in range(30)])
+
+    def testRangeTime(self):
+        self.assertEqual(list(relativedelta(hours=+12).range(
+                                        date(2003, 1, 1), count=3)),
+                         [datetime(2003, 1, 1), datetime(2003, 1, 1, 12),
+                          datetime(2003, 1, 2)])
+
+    def testRangeMaxYear(self):
+        self.assertEqual(list(relativedelta(years=+1).range(
+                                        date(9998, 1, 1))),
+                         [date(9998, 1, 1), date(9999, 1, 1)])
+
+    def testRangeNoProgress(self):
+        for rd in [relativedelta(), relativedelta(day=31),
+                   relativedelta(month=2, weekday=MO, leapdays=-1)]:
+            self.assertRaises(ValueError, rd.range, date(2003, 1, 1),
+                              date(2004, 1, 1))
+            self.assertRaises(ValueError, rd.range, date(2003, 1, 1),
+                              date(2004, 1, 1), output="array")
+        self.assertEqual(list(relativedelta(day=31).range(
+                                    date(2003, 1, 1), date(2004, 1, 1),
+                                    count=2)),
+                         [date(2003, 1, 31), date(2003, 1, 31)])
+
+    def testRangeArray(self):
+        import array
+        self.assertEqual(relativedelta(months=+1).range(
+                            date(2003, 1, 31), count=3, output="array"),
+                         array.array("l", [date(2003, 1, 31).toordinal(),
+                                           date(2003, 2, 28).toordinal(),
+                                           date(2003, 3, 31).toordinal()]))
+        self.assertRaises(ValueError, relativedelta(hours=+1).range,
+                          date(2003, 1, 1), count=3, output="array")
+        self.assertRaises(ValueError, relativedelta(days=+1).range,
+                          date(2003, 1, 1), output="array")
+
     def testYearDay(self):
         self.assertEqual(date(2003, 1, 1)+relativedelta(yearday=260),
                          date(2003, 9, 17))
@@ -836,6 +1029,28 @@ class RRuleTest(unittest.TestCase):
                           datetime(1997, 9, 17, 6, 0),
                           datetime(1997, 10, 13, 18, 0)])
 
+    def testMonthlyBySetPosLastWeekday(self):
+        self.assertEqual(list(rrule(MONTHLY,
+                              count=3,
+                              byweekday=(MO,TU,WE,TH,FR),
+                              bysetpos=-1,
+                              dtstart=parse("19970902T090000"))),
+                         [datetime(1997, 9, 30, 9, 0),
+                          datetime(1997, 10, 31, 9, 0),
+                          datetime(1997, 11, 28, 9, 0)])
+
+    def testMonthlyBySetPosRepeated(self):
+        self.assertEqual(list(rrule(MONTHLY,
+                              count=4,
+                              bymonthday=(1,2),
+                              byhour=(9,9),
+                              bysetpos=(1,2,-1,-4,5),
+                              dtstart=parse("19970902T090000"))),
+                         [datetime(1997, 9, 2, 9, 0),
+                          datetime(1997, 10, 1, 9, 0),
+                          datetime(1997, 10, 2, 9, 0),
+                          datetime(1997, 11, 1, 9, 0)])
+
     def testWeekly(self):
         self.assertEqual(list(rrule(WEEKLY,
                               count=3,
@@ -2522,6 +2737,427 @@ class RRuleTest(unittest.TestCase):
                                dtstart=parse("19970902T090000")).count(),
                          3)
 
+    def testCountUntil(self):
+        self.assertEqual(rrule(WEEKLY,
+                               byweekday=(TU, TH),
+                               until=parse("19971231T090000"),
+                               dtstart=parse("19970902T090000")).count(),
+                         35)
+
+    def testCountUnbounded(self):
+        self.assertEqual(rrule(DAILY,
+                               dtstart=parse("19970902T090000")).count(),
+                         -1)
+
+    def testCountBetween(self):
+        rr = rrule(MONTHLY, bymonthday=(1, -1),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(rr.count_between(parse("19970901"),
+                                          parse("19980301")),
+                         11)
+
+    def testCountBetweenInc(self):
+        rr = rrule(HOURLY, interval=5,
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(rr.count_between(parse("19970902T090000"),
+                                          parse("19970903T050000")),
+                         3)
+        self.assertEqual(rr.count_between(parse("19970902T090000"),
+                                          parse("19970903T050000"),
+                                          inc=True),
+                         5)
+
+    def testCountBetweenLeapDays(self):
+        rr = rrule(YEARLY, bymonth=2, bymonthday=29,
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(rr.count_between(parse("19970902T090000"),
+                                          parse("21000101T000000")),
+                         25)
+
+    def testCountBetweenCount(self):
+        rr = rrule(DAILY, count=10, byhour=(9, 18),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(rr.count_between(parse("19970904T000000"),
+                                          parse("19971231T000000")),
+                         6)
+
+    def testCountBetweenSetPos(self):
+        rr = rrule(MONTHLY, byweekday=(MO, TU, WE, TH, FR), bysetpos=-1,
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(rr.count_between(parse("19970902T090000"),
+                                          parse("19980101T000000")),
+                         4)
+
+    def testPage(self):
+        rr = rrule(WEEKLY, byweekday=(TU, TH), count=5,
+                   dtstart=parse("19970902T090000"))
+        items, cursor = rr.page(size=2)
+        self.assertEqual(items, [datetime(1997, 9, 2, 9, 0),
+                                 datetime(1997, 9, 4, 9, 0)])
+        items, cursor = rr.page(cursor, size=2)
+        self.assertEqual(items, [datetime(1997, 9, 9, 9, 0),
+                                 datetime(1997, 9, 11, 9, 0)])
+        self.assertEqual(rr.page(cursor, size=2),
+                         ([datetime(1997, 9, 16, 9, 0)], None))
+
+    def testPageOtherInstance(self):
+        items, cursor = rrule(MONTHLY, bymonthday=31,
+                              dtstart=parse("19970902T090000")).page(size=3)
+        self.assertEqual(rrule(MONTHLY, bymonthday=31,
+                               dtstart=parse("19970902T090000"))
+                               .page(cursor, size=2)[0],
+                         [datetime(1998, 3, 31, 9, 0),
+                          datetime(1998, 5, 31, 9, 0)])
+
+    def testPageMinutely(self):
+        rr = rrule(MINUTELY, interval=7, byhour=(6, 18), byminute=(0, 30),
+                   dtstart=parse("19970902T090000"))
+        items, cursor = rr.page(size=1)
+        self.assertEqual(rr.page(cursor, size=2)[0],
+                         [datetime(1997, 9, 4, 6, 30),
+                          datetime(1997, 9, 6, 18, 0)])
+
+    def testPageRepeatedTimes(self):
+        # Pages may end between occurrences at the same time.
+        rr = rrule(DAILY, count=12, byhour=(7, 7), bysecond=(39, 46, 10),
+                   dtstart=parse("19970902T090000"))
+        for size in (1, 2, 4, 5):
+            items, cursor = rr.page(size=size)
+            while cursor:
+                more, cursor = rr.page(cursor, size=size)
+                items.extend(more)
+            self.assertEqual(items, list(rr))
+
+    def testPageInvalidCursor(self):
+        rr = rrule(DAILY, dtstart=parse("19970902T090000"))
+        self.assertRaises(ValueError, rr.page, "garbage")
+        self.assertRaises(ValueError, rr.page, "1997.9.2")
+
+    def testIterAfter(self):
+        rr = rrule(HOURLY, interval=5, dtstart=parse("19970902T090000"))
+        self.assertEqual(list(itertools.islice(
+                             rr.iter_after(parse("19971001T000000")), 3)),
+                         [datetime(1997, 10, 1, 3, 0),
+                          datetime(1997, 10, 1, 8, 0),
+                          datetime(1997, 10, 1, 13, 0)])
+
+    def testIterAfterCount(self):
+        rr = rrule(DAILY, count=10, dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr.iter_after(parse("19970909T090000"),
+                                            inc=True)),
+                         [datetime(1997, 9, 9, 9, 0),
+                          datetime(1997, 9, 10, 9, 0),
+                          datetime(1997, 9, 11, 9, 0)])
+        self.assertEqual(rr.count(), 10)
+
+    def testRuleIndex(self):
+        index = RuleIndex()
+        index.add(rrule(YEARLY, bymonth=12, bymonthday=25,
+                        dtstart=parse("19970101T000000")), "christmas")
+        index.add(rrule(MONTHLY, bymonthday=1,
+                        dtstart=parse("19970101T090000")), "rent")
+        index.add(rrule(WEEKLY, byweekday=FR,
+                        until=parse("19971231T000000"),
+                        dtstart=parse("19970101T170000")), "friday")
+        self.assertEqual(sorted(index.query(parse("19971222"),
+                                            parse("19971227"))),
+                         ["christmas", "friday"])
+        self.assertEqual(index.query(parse("19971229"), parse("19980105")),
+                         ["rent"])
+        # Going back in time.
+        self.assertEqual(index.query(parse("19971201"), parse("19971202")),
+                         ["rent"])
+        self.assertEqual(index.query(parse("19970101"),
+                                     parse("19970101T090000")),
+                         [])
+
+    def testRuleIndexRemove(self):
+        index = RuleIndex()
+        rr = rrule(MONTHLY, bymonthday=1, dtstart=parse("19970101T090000"))
+        key = index.add(rr)
+        index.add(rrule(DAILY, dtstart=parse("19970101T090000")), "daily")
+        index.remove(key)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.query(parse("19971229"), parse("19980105")),
+                         ["daily"])
+
+    def testRuleIndexEqualRules(self):
+        # Equal rules added without a key don't replace each other.
+        index = RuleIndex()
+        key1 = index.add(rrule(MONTHLY, bymonthday=1,
+                               dtstart=parse("19970101T090000")))
+        key2 = index.add(rrule(MONTHLY, bymonthday=1,
+                               dtstart=parse("19970101T090000")))
+        self.assertNotEqual(key1, key2)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(sorted(index.query(parse("19971229"),
+                                            parse("19980105"))),
+                         sorted([key1, key2]))
+
+    def testFreeBusy(self):
+        rules = [(rrule(DAILY, byhour=(9, 14),
+                        dtstart=parse("19970902T090000")),
+                  timedelta(hours=1)),
+                 (rrule(WEEKLY, byweekday=WE,
+                        dtstart=parse("19970902T093000")),
+                  timedelta(hours=2))]
+        self.assertEqual(list(freebusy(rules, (parse("19970903T080000"),
+                                               parse("19970903T160000")))),
+                         [(datetime(1997, 9, 3, 8, 0),
+                           datetime(1997, 9, 3, 9, 0), False),
+                          (datetime(1997, 9, 3, 9, 0),
+                           datetime(1997, 9, 3, 11, 30), True),
+                          (datetime(1997, 9, 3, 11, 30),
+                           datetime(1997, 9, 3, 14, 0), False),
+                          (datetime(1997, 9, 3, 14, 0),
+                           datetime(1997, 9, 3, 15, 0), True),
+                          (datetime(1997, 9, 3, 15, 0),
+                           datetime(1997, 9, 3, 16, 0), False)])
+
+    def testFreeBusyOverlapWindow(self):
+        set = rruleset()
+        set.rrule(rrule(DAILY, byhour=23,
+                        dtstart=parse("19970902T090000")))
+        set.rdate(datetime(1997, 9, 3, 10))
+        self.assertEqual(list(freebusy([(set, timedelta(hours=12))],
+                                       (parse("19970903T080000"),
+                                        parse("19970903T160000")))),
+                         [(datetime(1997, 9, 3, 8, 0),
+                           datetime(1997, 9, 3, 16, 0), True)])
+
+    def testFreeBusyNothing(self):
+        self.assertEqual(list(freebusy([], (parse("19970903T080000"),
+                                            parse("19970903T160000")))),
+                         [(datetime(1997, 9, 3, 8, 0),
+                           datetime(1997, 9, 3, 16, 0), False)])
+
+    def testOptimizedDaily(self):
+        rr = rrule(DAILY, byweekday=(FR, MO, FR),
+                   dtstart=parse("19970902T090000"))
+        opt = rr.optimized()
+        self.assertEqual(opt._freq, WEEKLY)
+        self.assertEqual(opt._byweekday, (MO.weekday, FR.weekday))
+        self.assertEqual(list(itertools.islice(rr, 3)),
+                         [datetime(1997, 9, 5, 9, 0),
+                          datetime(1997, 9, 8, 9, 0),
+                          datetime(1997, 9, 12, 9, 0)])
+
+    def testOptimizedHourly(self):
+        rr = rrule(HOURLY, interval=2, byhour=(9, 10, 11),
+                   byweekday=MO, dtstart=parse("19970902T090000"))
+        opt = rr.optimized()
+        self.assertEqual(opt._freq, WEEKLY)
+        self.assertEqual(opt._byhour, (9, 11))
+        self.assertEqual(opt._interval, 1)
+
+    def testOptimizedNothing(self):
+        for rr in [rrule(DAILY, dtstart=parse("19970902T090000")),
+                   rrule(DAILY, interval=2, byweekday=MO,
+                         dtstart=parse("19970902T090000")),
+                   rrule(HOURLY, interval=5, byhour=9,
+                         dtstart=parse("19970902T090000")),
+                   rrule(MONTHLY, byweekday=FR, bysetpos=-1,
+                         dtstart=parse("19970902T090000"))]:
+            self.assertTrue(rr.optimized() is rr)
+
+    def testOptimizedSame(self):
+        # The optimized rules give the same occurrences as the
+        # unoptimized ones, which don't know any better.
+        dtstart = parse("19970902T093015")
+        for freq, kwargs in [
+            (DAILY, dict(byweekday=(TU, SA))),
+            (DAILY, dict(bymonthday=(1, -1), count=30)),
+            (DAILY, dict(byyearday=(1, 100, -1), count=10)),
+            (WEEKLY, dict(byweekno=(1, 20), byweekday=SU, count=10)),
+            (MONTHLY, dict(byeaster=(0, 1), count=10)),
+            (HOURLY, dict(byhour=(9, 17), until=parse("19971001"))),
+            (HOURLY, dict(interval=3, byhour=range(24), count=20)),
+            (MINUTELY, dict(byhour=12, byminute=(0, 30),
+                            byweekday=WE, count=10)),
+            (MINUTELY, dict(interval=15, byminute=(0, 30, 45),
+                            bysecond=15, count=20)),
+            (SECONDLY, dict(bysecond=(0, 15), byminute=(0, 30),
+                            byhour=6, count=10)),
+            (DAILY, dict(byweekday=MO, byhour=(9, 9), count=10)),
+            (HOURLY, dict(byhour=(9, 9), byminute=(44, 43, 44),
+                          count=10))]:
+            rr = rrule(freq, dtstart=dtstart, **kwargs)
+            plain = rrule(freq, dtstart=dtstart, **kwargs)
+            plain._optimized = False
+            self.assertTrue(rr.optimized() is not rr)
+            self.assertEqual(list(itertools.islice(rr, 50)),
+                             list(itertools.islice(plain, 50)))
+            self.assertEqual(rr.count(), plain.count())
+
+    def testEqual(self):
+        rr = rrule(WEEKLY, byweekday=(MO, FR), byhour=(9, 17),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(rr, rrule(WEEKLY, byweekday=(FR, MO, MO),
+                                   byhour=(17, 9),
+                                   dtstart=parse("19970902T090000")))
+        self.assertEqual(hash(rr),
+                         hash(rrule(WEEKLY, byweekday=(FR, MO),
+                                    byhour=(17, 9),
+                                    dtstart=parse("19970902T090000"))))
+        # The implied parts are resolved.
+        self.assertEqual(rrule(MONTHLY, dtstart=parse("19970902T090000")),
+                         rrule(MONTHLY, bymonthday=2, byhour=9,
+                               dtstart=parse("19970902T090000")))
+
+    def testNotEqual(self):
+        rr = rrule(WEEKLY, byweekday=(MO, FR),
+                   dtstart=parse("19970902T090000"))
+        for other in [rrule(WEEKLY, byweekday=(MO, FR), count=3,
+                            dtstart=parse("19970902T090000")),
+                      rrule(WEEKLY, byweekday=(MO, FR), interval=2,
+                            dtstart=parse("19970902T090000")),
+                      rrule(WEEKLY, byweekday=(MO, FR),
+                            dtstart=parse("19970902T100000")),
+                      rrule(WEEKLY, byweekday=(MO, FR),
+                            dtstart=parse("19970902T090000+0100")),
+                      rruleset(), None]:
+            self.assertNotEqual(rr, other)
+        self.assertNotEqual(rrule(MONTHLY, byweekday=FR(1),
+                                  dtstart=parse("19970902T090000")),
+                            rrule(MONTHLY, byweekday=FR,
+                                  dtstart=parse("19970902T090000")))
+
+    def testEqualSet(self):
+        rules = set([rrule(DAILY, byhour=(9, 10),
+                           dtstart=parse("19970902T090000")),
+                     rrule(DAILY, byhour=(10, 9),
+                           dtstart=parse("19970902T090000")),
+                     rrule(DAILY, dtstart=parse("19970902T090000"))])
+        self.assertEqual(len(rules), 2)
+
+    def testCompareRules(self):
+        rr = rrule(WEEKLY, byweekday=(MO, FR), count=3,
+                   dtstart=parse("19970902T090000"))
+        self.assertTrue(rr.compare_rrules(
+            rrule(WEEKLY, byweekday=(FR, MO), count=3,
+                  dtstart=parse("20000101T100000"))))
+        self.assertFalse(rr.compare_rrules(
+            rrule(WEEKLY, byweekday=(FR, MO), count=3, byhour=9,
+                  dtstart=parse("19970902T090000"))))
+        self.assertFalse(rr.compare_rrules(
+            rrule(WEEKLY, byweekday=MO, count=3,
+                  dtstart=parse("19970902T090000"))))
+
+    def testInterned(self):
+        rr = rrule(DAILY, count=3, dtstart=parse("19970902T090000"))
+        other = rrule(DAILY, count=3, dtstart=parse("19970902T090000"))
+        self.assertTrue(rr.interned() is rr)
+        self.assertTrue(other.interned() is rr)
+        self.assertTrue(rr._cache is not None)
+        self.assertEqual(list(rr),
+                         [datetime(1997, 9, 2, 9, 0),
+                          datetime(1997, 9, 3, 9, 0),
+                          datetime(1997, 9, 4, 9, 0)])
+        self.assertTrue(rr._cache_complete)
+        # Rules are only kept while in use.
+        del rr
+        self.assertTrue(other.interned() is other)
+
+    def testReplace(self):
+        rr = rrule(DAILY, byhour=(9, 17), dtstart=parse("19970902T090000"))
+        other = rr.replace(count=3)
+        self.assertEqual(list(other),
+                         [datetime(1997, 9, 2, 9, 0),
+                          datetime(1997, 9, 2, 17, 0),
+                          datetime(1997, 9, 3, 9, 0)])
+        self.assertEqual(other, rrule(DAILY, byhour=(9, 17), count=3,
+                                      dtstart=parse("19970902T090000")))
+        self.assertEqual(other.original_params["COUNT"], 3)
+        self.assertTrue(other._timeset is rr._timeset)
+        # The template is left alone.
+        self.assertEqual(rr._count, None)
+        self.assertTrue("COUNT" not in rr.original_params)
+
+    def testReplaceImplied(self):
+        rr = rrule(WEEKLY, count=3, dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr.replace(byweekday=FR)),
+                         [datetime(1997, 9, 5, 9, 0),
+                          datetime(1997, 9, 12, 9, 0),
+                          datetime(1997, 9, 19, 9, 0)])
+        self.assertEqual(list(rr.replace(dtstart=parse("19970904T100000"))),
+                         [datetime(1997, 9, 4, 10, 0),
+                          datetime(1997, 9, 11, 10, 0),
+                          datetime(1997, 9, 18, 10, 0)])
+        self.assertEqual(list(rr.replace(freq=MONTHLY)),
+                         [datetime(1997, 9, 2, 9, 0),
+                          datetime(1997, 10, 2, 9, 0),
+                          datetime(1997, 11, 2, 9, 0)])
+
+    def testReplaceInvalid(self):
+        rr = rrule(DAILY, dtstart=parse("19970902T090000"))
+        self.assertRaises(TypeError, rr.replace, bymonthdays=1)
+        self.assertRaises(ValueError, rr.replace, bysetpos=0)
+        self.assertRaises(ValueError, rr.replace, byminute=60)
+
+    def testSecondlySparse(self):
+        self.assertEqual(list(rrule(SECONDLY, count=3, byhour=3, byminute=0,
+                                    dtstart=parse("19970902T090000"))),
+                         [datetime(1997, 9, 3, 3, 0, 0),
+                          datetime(1997, 9, 3, 3, 0, 1),
+                          datetime(1997, 9, 3, 3, 0, 2)])
+
+    def testMinutelySparseInterval(self):
+        self.assertEqual(list(rrule(MINUTELY, count=3, interval=7,
+                                    byhour=(6, 18), byminute=(0, 30),
+                                    dtstart=parse("19970902T090000"))),
+                         [datetime(1997, 9, 3, 6, 0),
+                          datetime(1997, 9, 4, 6, 30),
+                          datetime(1997, 9, 6, 18, 0)])
+
+    def testHourlyImpossible(self):
+        self.assertEqual(list(rrule(HOURLY, count=3, interval=2, byhour=4,
+                                    dtstart=parse("19970902T090000"))), [])
+
+    def testSecondlyImpossible(self):
+        rr = rrule(SECONDLY, count=3, interval=60, bysecond=30,
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr), [])
+        self.assertEqual(rr.after(parse("19970902T090000")), None)
+
+    def testTimesetCached(self):
+        rr = rrule(MINUTELY, bysecond=(30, 0), count=4,
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr),
+                         [datetime(1997, 9, 2, 9, 0, 0),
+                          datetime(1997, 9, 2, 9, 0, 30),
+                          datetime(1997, 9, 2, 9, 1, 0),
+                          datetime(1997, 9, 2, 9, 1, 30)])
+        self.assertEqual(rr._timesets[9, 1], ((9, 1, 0), (9, 1, 30)))
+        timeset = rr._timesets[9, 1]
+        list(rr)
+        self.assert_(rr._timesets[9, 1] is timeset)
+
+    def testHourlyTZInfo(self):
+        tz = tzoffset("BRST", -10800)
+        self.assertEqual(list(rrule(HOURLY, byminute=(0, 30), count=3,
+                                    dtstart=datetime(1997, 9, 2, 23,
+                                                     tzinfo=tz))),
+                         [datetime(1997, 9, 2, 23, 0, tzinfo=tz),
+                          datetime(1997, 9, 2, 23, 30, tzinfo=tz),
+                          datetime(1997, 9, 3, 0, 0, tzinfo=tz)])
+
+    def testSharedMasks(self):
+        from dateutil import rrule as rrulemodule
+        mask = rrulemodule._wnomask(1998, MO.weekday, (1, -1))
+        self.assertEqual([i for i in range(365+7) if mask>>i&1],
+                         range(4)+range(361, 368))
+        self.assert_(rrulemodule._wnomask(1998, MO.weekday, (1, -1)) is mask)
+        rr1 = rrule(YEARLY, count=3, byweekno=20, byweekday=MO,
+                    dtstart=parse("19970902T090000"))
+        rr2 = rrule(YEARLY, count=3, byweekno=20, byweekday=MO,
+                    dtstart=parse("19980101T090000"))
+        self.assertEqual(list(rr1), list(rr2))
+        mask = rrulemodule._nwdaymask(1998, 3, MONTHLY, None, ((4, -1),))
+        self.assertEqual([i for i in range(365) if mask>>i&1],
+                         [date(1998, 3, 27).timetuple().tm_yday-1])
+        self.assert_(rrulemodule._nwdaymask(1998, 3, MONTHLY, (1, 2),
+                                            ((4, -1),)) is mask)
+
     def testContains(self):
         rr = rrule(DAILY, count=3, dtstart=parse("19970902T090000"))
         self.assertEqual(datetime(1997, 9, 3, 9, 0) in rr, True)
@@ -2544,6 +3180,55 @@ class RRuleTest(unittest.TestCase):
                                .before(parse("19970905T090000"), inc=True),
                          datetime(1997, 9, 5, 9, 0))
 
+    def testReversed(self):
+        rr = rrule(WEEKLY, byweekday=(TU, TH),
+                   until=parse("19970918T090000"),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(reversed(rr)),
+                         [datetime(1997, 9, 18, 9, 0),
+                          datetime(1997, 9, 16, 9, 0),
+                          datetime(1997, 9, 11, 9, 0),
+                          datetime(1997, 9, 9, 9, 0),
+                          datetime(1997, 9, 4, 9, 0),
+                          datetime(1997, 9, 2, 9, 0)])
+
+    def testReversedCount(self):
+        rr = rrule(MONTHLY, count=3, bymonthday=(1, -1),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(reversed(rr)),
+                         [datetime(1997, 10, 31, 9, 0),
+                          datetime(1997, 10, 1, 9, 0),
+                          datetime(1997, 9, 30, 9, 0)])
+
+    def testReversedUnbounded(self):
+        rr = rrule(DAILY, dtstart=parse("19970902T090000"))
+        self.assertRaises(ValueError, reversed, rr)
+
+    def testIterBefore(self):
+        rr = rrule(MONTHLY, byweekday=FR(-1),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr.iter_before(parse("19971226T090000"))),
+                         [datetime(1997, 11, 28, 9, 0),
+                          datetime(1997, 10, 31, 9, 0),
+                          datetime(1997, 9, 26, 9, 0)])
+
+    def testIterBeforeInc(self):
+        rr = rrule(MONTHLY, byweekday=FR(-1),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr.iter_before(parse("19971226T090000"),
+                                             inc=True))[:2],
+                         [datetime(1997, 12, 26, 9, 0),
+                          datetime(1997, 11, 28, 9, 0)])
+
+    def testIterBeforeMinutely(self):
+        rr = rrule(MINUTELY, interval=7, byhour=(6, 18), byminute=(0, 30),
+                   dtstart=parse("19970902T090000"))
+        self.assertEqual(list(rr.iter_before(parse("19970906T180000"),
+                                             inc=True)),
+                         [datetime(1997, 9, 6, 18, 0),
+                          datetime(1997, 9, 4, 6, 30),
+                          datetime(1997, 9, 3, 6, 0)])
+
     def testAfter(self):
         self.assertEqual(rrule(DAILY,
                                #count=5,
@@ -2748,6 +3433,90 @@ class RRuleTest(unittest.TestCase):
                         dtstart=parse("19970902T090000")))
         self.assertEqual(set.count(), 3)
 
+    def testSetReversed(self):
+        set = rruleset()
+        set.rrule(rrule(WEEKLY, byweekday=(TU, TH),
+                        until=parse("19970918T090000"),
+                        dtstart=parse("19970902T090000")))
+        set.rdate(datetime(1997, 9, 20, 9))
+        set.exdate(datetime(1997, 9, 16, 9))
+        set.exrule(rrule(YEARLY, count=1, byweekday=TH,
+                         dtstart=parse("19970902T090000")))
+        self.assertEqual(list(reversed(set)),
+                         [datetime(1997, 9, 20, 9, 0),
+                          datetime(1997, 9, 18, 9, 0),
+                          datetime(1997, 9, 11, 9, 0),
+                          datetime(1997, 9, 9, 9, 0),
+                          datetime(1997, 9, 2, 9, 0)])
+
+    def testSetIterBefore(self):
+        set = rruleset()
+        set.rrule(rrule(DAILY, byweekday=(MO, WE),
+                        dtstart=parse("19970902T090000")))
+        set.exdate(datetime(1997, 9, 8, 9))
+        self.assertEqual(list(set.iter_before(parse("19970915T090000"))),
+                         [datetime(1997, 9, 10, 9, 0),
+                          datetime(1997, 9, 3, 9, 0)])
+
+    def testSetPage(self):
+        set = rruleset()
+        set.rrule(rrule(DAILY, count=4,
+                        dtstart=parse("19970902T090000")))
+        set.rrule(rrule(DAILY, interval=2, count=3,
+                        dtstart=parse("19970902T090000")))
+        set.rdate(datetime(1997, 9, 3, 12))
+        set.exdate(datetime(1997, 9, 4, 9))
+        items, cursor = set.page(size=2)
+        self.assertEqual(items, [datetime(1997, 9, 2, 9, 0),
+                                 datetime(1997, 9, 3, 9, 0)])
+        items, cursor = set.page(cursor, size=2)
+        self.assertEqual(items, [datetime(1997, 9, 3, 12, 0),
+                                 datetime(1997, 9, 5, 9, 0)])
+        self.assertEqual(set.page(cursor, size=2),
+                         ([datetime(1997, 9, 6, 9, 0)], None))
+
+    def testSetIterAfter(self):
+        set = rruleset()
+        set.rrule(rrule(WEEKLY, byweekday=(MO, WE),
+                        dtstart=parse("19970902T090000")))
+        set.exdate(datetime(1997, 10, 1, 9))
+        set.rdate(datetime(1997, 10, 2, 12))
+        self.assertEqual(list(itertools.islice(
+                             set.iter_after(parse("19970930T090000")), 3)),
+                         [datetime(1997, 10, 2, 12, 0),
+                          datetime(1997, 10, 6, 9, 0),
+                          datetime(1997, 10, 8, 9, 0)])
+
+    def testSetRuleIndex(self):
+        set = rruleset()
+        set.rrule(rrule(YEARLY, count=3, dtstart=parse("19970902T090000")))
+        set.rdate(datetime(2005, 1, 1, 9))
+        index = RuleIndex()
+        index.add(set, "set")
+        self.assertEqual(index.query(parse("20000101"), parse("20040101")),
+                         [])
+        self.assertEqual(index.query(parse("20040101"), parse("20060101")),
+                         ["set"])
+
+    def testSetRemoveInstance(self):
+        set = rruleset()
+        set.rrule(rrule(DAILY, byweekday=MO, count=4,
+                        dtstart=parse("19970902T090000")))
+        set.remove_instance(datetime(1997, 9, 8, 9, 0))
+        self.assertEqual(list(set)[:2],
+                         [datetime(1997, 9, 15, 9, 0),
+                          datetime(1997, 9, 22, 9, 0)])
+
+    def testSetKeepsHashedRules(self):
+        rr = rrule(DAILY, byweekday=MO, count=4,
+                   dtstart=parse("19970902T090000"))
+        rules = {rr: None}
+        set = rruleset()
+        set.rrule(rr)
+        set.remove_instance(datetime(1997, 9, 8, 9, 0))
+        self.assertEqual(rr._dtstart, datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr in rules)
+
     def testSetCachePre(self):
         set = rruleset()
         set.rrule(rrule(YEARLY, count=2, byweekday=TU,
@@ -3074,6 +3843,24 @@ class ParserTest(unittest.TestCase):
                          datetime(2003, 9, 25, 10, 49, 41, 500000,
                                   tzinfo=self.brsttz))
 
+    def testISOFormatYears(self):
+        # Four digit years are taken as they are, and there's no year 0.
+        self.assertEqual(parse("0099-01-01"), datetime(99, 1, 1))
+        self.assertRaises(ValueError, parse, "0000-01-01")
+        self.assertRaises(ValueError, parse, "00000101T1000")
+
+    def testISOFormatYearNoTime(self):
+        # A bare year is not followed by a time, so these are left
+        # to the general parser.
+        default = datetime(2020, 6, 15)
+        self.assertEqual(parse("2003 10", default=default),
+                         datetime(2003, 10, 15))
+        self.assertEqual(parse("2003 12", default=default),
+                         datetime(2003, 12, 15))
+        self.assertEqual(parse("2003T10", default=default),
+                         datetime(2003, 10, 15))
+        self.assertRaises(ValueError, parse, "1600 2003", default=default)
+
     def testISOFormatStrip1(self):
         self.assertEqual(parse("2003-09-25T10:49:41-03:00"),
                          datetime(2003, 9, 25, 10, 49, 41,
@@ -3617,6 +4404,221 @@ class ParserTest(unittest.TestCase):
         dt = myparser.parse("01/Foo/2007")
         self.assertEquals(dt, datetime(2007, 1, 1))
 
+    def testAccentedParserInfo(self):
+        from dateutil.parser import parserinfo, parser
+        class myparserinfo(parserinfo):
+            MONTHS = parserinfo.MONTHS[:]
+            MONTHS[11] = ("Dec", "D\xe9cembre")
+        myparser = parser(myparserinfo())
+        self.assertEquals(myparser.parse("10 d\xe9cembre 2003"),
+                          datetime(2003, 12, 10))
+
+    def testParserInfoOverride(self):
+        from dateutil.parser import parserinfo, parser
+        class myparserinfo(parserinfo):
+            def month(self, name):
+                if name.lower() == "septembre":
+                    return 9
+                return parserinfo.month(self, name)
+            def jump(self, name):
+                return name == "le" or parserinfo.jump(self, name)
+        myparser = parser(myparserinfo())
+        self.assertEquals(myparser.parse("le 25 Septembre 2003"),
+                          datetime(2003, 9, 25))
+        self.assertEquals(myparser.parse("Sep 25 2003"),
+                          datetime(2003, 9, 25))
+
+    def testParserInfoCaseVariants(self):
+        from dateutil.parser import parserinfo
+        info = parserinfo()
+        for name in ["sep", "Sep", "SEP", "sEp", "september", "SePtEmBeR"]:
+            self.assertEqual(info.month(name), 9)
+        self.assertEqual(info.weekday("THURSDAY"), 3)
+        self.assertEqual(info.hms("Minutes"), 1)
+        self.assertEqual(info.ampm("PM"), 1)
+        self.assertEqual(info.jump("AND"), True)
+        self.assertEqual(info.pertain("Of"), True)
+        self.assertEqual(info.utczone("gmt"), True)
+        self.assertEqual(info.month("Foo"), None)
+        self.assertEqual(info.jump("Foo"), False)
+
+    def testParserInfoShortNames(self):
+        # Weekday and month names must have at least three letters.
+        from dateutil.parser import parserinfo
+        class myparserinfo(parserinfo):
+            MONTHS = parserinfo.MONTHS[:]
+            MONTHS[8] = ("Se", "Sep", "September")
+        info = myparserinfo()
+        self.assertEqual(info.month("se"), None)
+        self.assertEqual(info.month("SEP"), 9)
+
+    def testMixedCaseTokens(self):
+        self.assertEqual(parse("THU SEPTEMBER 25 10:36:28 2003"),
+                         datetime(2003, 9, 25, 10, 36, 28))
+        self.assertEqual(parse("tHu sEpTeMbEr 25 10:36:28 2003"),
+                         datetime(2003, 9, 25, 10, 36, 28))
+        self.assertEqual(parse("10H36M28S", default=self.default),
+                         datetime(2003, 9, 25, 10, 36, 28))
+
+    def testISOParseCalendarDate(self):
+        self.assertEqual(isoparse("2003-09-25"), datetime(2003, 9, 25))
+        self.assertEqual(isoparse("20030925"), datetime(2003, 9, 25))
+        self.assertEqual(isoparse("2003-09"), datetime(2003, 9, 1))
+        self.assertEqual(isoparse("2003"), datetime(2003, 1, 1))
+
+    def testISOParseWeekDate(self):
+        self.assertEqual(isoparse("2003-W39-4"), datetime(2003, 9, 25))
+        self.assertEqual(isoparse("2003W394"), datetime(2003, 9, 25))
+        self.assertEqual(isoparse("2003-W39"), datetime(2003, 9, 22))
+        self.assertEqual(isoparse("2004-W53-7"), datetime(2005, 1, 2))
+        self.assertEqual(isoparse("2009-W01-1"), datetime(2008, 12, 29))
+
+    def testISOParseOrdinalDate(self):
+        self.assertEqual(isoparse("2003-268"), datetime(2003, 9, 25))
+        self.assertEqual(isoparse("2003268"), datetime(2003, 9, 25))
+        self.assertEqual(isoparse("2004-366"), datetime(2004, 12, 31))
+
+    def testISOParseTime(self):
+        self.assertEqual(isoparse("2003-09-25T10:49:41"),
+                         datetime(2003, 9, 25, 10, 49, 41))
+        self.assertEqual(isoparse("20030925T104941"),
+                         datetime(2003, 9, 25, 10, 49, 41))
+        self.assertEqual(isoparse("2003-09-25 10:49"),
+                         datetime(2003, 9, 25, 10, 49))
+        self.assertEqual(isoparse("2003-09-25T10"),
+                         datetime(2003, 9, 25, 10))
+
+    def testISOParseFraction(self):
+        self.assertEqual(isoparse("2003-09-25T10:49:41.5"),
+                         datetime(2003, 9, 25, 10, 49, 41, 500000))
+        self.assertEqual(isoparse("2003-09-25T10:49:41,123456789"),
+                         datetime(2003, 9, 25, 10, 49, 41, 123456))
+        self.assertEqual(isoparse("2003-09-25T10:49.5"),
+                         datetime(2003, 9, 25, 10, 49, 30))
+        self.assertEqual(isoparse("2003-09-25T10.25"),
+                         datetime(2003, 9, 25, 10, 15))
+
+    def testISOParseOffset(self):
+        self.assertEqual(isoparse("2003-09-25T10:49:41Z"),
+                         datetime(2003, 9, 25, 10, 49, 41, tzinfo=tzutc()))
+        self.assertEqual(isoparse("2003-09-25T10:49:41-03:00"),
+                         datetime(2003, 9, 25, 10, 49, 41,
+                                  tzinfo=self.brsttz))
+        self.assertEqual(isoparse("2003-09-25T10:49:41-0300"),
+                         datetime(2003, 9, 25, 10, 49, 41,
+                                  tzinfo=self.brsttz))
+        self.assertEqual(isoparse("2003-09-25T10:49:41-03"),
+                         datetime(2003, 9, 25, 10, 49, 41,
+                                  tzinfo=self.brsttz))
+
+    def testISOParseInvalid(self):
+        for s in ["Sep 25 2003", "2003-9-25", "200309", "2003-W54",
+                  "2008-W53-1", "2003-367", "2003-13-01",
+                  "2003-09-25T24:00", "2003-09-25T10:49:41+", "10:49:41"]:
+            self.assertRaises(ValueError, isoparse, s)
+
+    def testParseISOWeekAndOrdinalDate(self):
+        self.assertEqual(parse("2003-W39-4T10:49"),
+                         datetime(2003, 9, 25, 10, 49))
+        self.assertEqual(parse("2003-268T10:49"),
+                         datetime(2003, 9, 25, 10, 49))
+
+    def testParseISOTimeOnly(self):
+        self.assertEqual(parse("T10:49:41", default=self.default),
+                         datetime(2003, 9, 25, 10, 49, 41))
+        self.assertEqual(parse("T104941", default=self.default),
+                         datetime(2003, 9, 25, 10, 49, 41))
+
+    def testParseISOMatchesGeneralParser(self):
+        # The strict ISO-8601 parser must give the same results the
+        # general parser gives for the strings it accepts.
+        from dateutil.parser import DEFAULTPARSER, DEFAULTISOPARSER
+        for s in ["2003-09-25T10:49:41.5-03:00", "20030925T104941Z",
+                  "2003-09-25 10:49", "2003-09", "2003", "0099-01-01",
+                  "10:49:41", "2003-09-25T10:49:41+00:00"]:
+            res = DEFAULTISOPARSER.parse(s)
+            DEFAULTPARSER.info.validate(res)
+            self.assertEqual(repr(res), repr(DEFAULTPARSER._parse(s)))
+
+    def testParseEpoch(self):
+        self.assertEqual(parse_epoch("2003-09-25T10:49:41.5-03:00"),
+                         1064497781500000)
+        self.assertEqual(parse_epoch("Thu Sep 25 10:36:28 2003"),
+                         1064486188000000)
+        self.assertEqual(parse_epoch("1969-12-31T23:59:59.999999"), -1)
+        self.assertEqual(parse_epoch("1600-01-01"), -11676096000000000)
+
+    def testParseEpochDefault(self):
+        self.assertEqual(parse_epoch("10:36", default=self.default),
+                         1064486160000000)
+        self.assertEqual(parse_epoch("Wed", default=self.default),
+                         1064966400000000)
+
+    def testParseEpochTZ(self):
+        s = "Thu Sep 25 10:36:28 BRST 2003"
+        self.assertEqual(parse_epoch(s), 1064486188000000)
+        self.assertEqual(parse_epoch(s, tzinfos={"BRST": -10800}),
+                         1064496988000000)
+        self.assertEqual(parse_epoch(s, tzinfos={"BRST": tzstr("BRST+3")}),
+                         1064496988000000)
+        self.assertEqual(parse_epoch("2003-09-25T10:36:28+02:00",
+                                     ignoretz=True), 1064486188000000)
+
+    def testParseEpochInvalid(self):
+        self.assertRaises(ValueError, parse_epoch, "2003-02-29")
+        self.assertRaises(ValueError, parse_epoch, "Sep 31 2003")
+
+    def testFindIter(self):
+        s = ("The meeting on Thursday, September 25, 2003 at 10:30 was "
+             "moved. See also 2003-09-26T09:00Z and 1, 2, 3.")
+        l = list(finditer(s))
+        self.assertEqual([s[b:e] for b, e, dt in l],
+                         ["Thursday, September 25, 2003 at 10:30",
+                          "2003-09-26T09:00Z"])
+        self.assertEqual(l[0][2], datetime(2003, 9, 25, 10, 30))
+        self.assertEqual(l[1][2], datetime(2003, 9, 26, 9, 0, tzinfo=tzutc()))
+
+    def testFindIterStream(self):
+        s = "Sent: Thu Sep 25 10:36:28 BRST 2003\nReply by 3rd of May 2004\n"
+        self.assertEqual(list(finditer(StringIO(s*1000))),
+                         list(finditer(s*1000)))
+
+    def testFindIterSeparatedDates(self):
+        s = "Dates: 26 Sep 2004, 25.09.2003; 10:30. Wed"
+        self.assertEqual([s[b:e] for b, e, dt in finditer(s)],
+                         ["26 Sep 2004", "25.09.2003", "10:30"])
+
+    def testFindIterNoDates(self):
+        self.assertEqual(list(finditer("1, 2, 3 and 4 or 5")), [])
+        self.assertEqual(list(finditer("")), [])
+
+    def testFindIterLongRun(self):
+        s = "and "*1000+"25 Sep 2003 10:30 "+"and "*1000
+        self.assertEqual([s[b:e] for b, e, dt in finditer(s)],
+                         ["25 Sep 2003 10:30"])
+
+
+class CalendarTest(unittest.TestCase):
+
+    def testYears(self):
+        from dateutil import _calendar
+        for year in range(1, 10000, 7)+[1600, 1900, 2000, 2100, 9999]:
+            first = date(year, 1, 1)
+            self.assertEqual(_calendar.yearordinal(year), first.toordinal())
+            self.assertEqual(_calendar.yearweekday(year), first.weekday())
+            self.assertEqual(_calendar.isleap(year), calendar.isleap(year))
+            self.assertEqual(_calendar.yearlen(year),
+                             365+calendar.isleap(year))
+
+    def testMonths(self):
+        from dateutil import _calendar
+        for year in [1600, 1900, 2000, 2003, 2004]:
+            for month in range(1, 13):
+                days = calendar.monthrange(year, month)[1]
+                self.assertEqual(_calendar.monthdays(year, month), days)
+                self.assertEqual(_calendar.toordinal(year, month, days),
+                                 date(year, month, days).toordinal())
+
 
 class EasterTest(unittest.TestCase):
     easterlist = [
@@ -3695,6 +4697,22 @@ class EasterTest(unittest.TestCase):
             self.assertEqual(western,  easter(western.year,  EASTER_WESTERN))
             self.assertEqual(orthodox, easter(orthodox.year, EASTER_ORTHODOX))
 
+    def testEasterOutsideTable(self):
+        self.assertEqual(easter(1582), date(1582, 4, 18))
+        self.assertEqual(easter(4100), date(4100, 4, 11))
+        self.assertEqual(easter(1000, EASTER_JULIAN), date(1000, 3, 31))
+
+    def testEasterRange(self):
+        for method in (EASTER_WESTERN, EASTER_ORTHODOX):
+            self.assertEqual(list(easter_range(1990, 2050, method)),
+                             [easter(year, method).toordinal()
+                              for year in range(1990, 2051)])
+        self.assertEqual(list(easter_range(1580, 1585)),
+                         [easter(year).toordinal()
+                          for year in range(1580, 1586)])
+        self.assertEqual(list(easter_range(2000, 1999)), [])
+        self.assertRaises(ValueError, easter_range, 2000, 2010, 4)
+
 class TZTest(unittest.TestCase):
 
     TZFILE_EST5EDT = """
@@ -3885,6 +4903,24 @@ END:VTIMEZONE
         self.assertEqual(tzstr("EST5EDT"),
                          tzstr("EST5EDT,4,1,0,7200,10,-1,0,7200,3600"))
 
+    def testStrCached(self):
+        s = "EST5EDT4,M4.1.0/02:00:00,M10-5-0/02:00"
+        tz1, tz2 = tzstr(s), tzstr(s)
+        self.assertEqual(tz1, tz2)
+        self.assertEqual(repr(tz2), "tzstr('%s')" % s)
+        self.assertEqual(datetime(2003,4,6,2,00,tzinfo=tz2).tzname(), "EDT")
+
+    def testStrSouthernHemisphere(self):
+        s = "BRST3BRDT,M10.3.0,M2.3.0"
+        self.assertEqual(datetime(2003,2,16,0,59,
+                                  tzinfo=tzstr(s)).tzname(), "BRDT")
+        self.assertEqual(datetime(2003,2,16,1,00,
+                                  tzinfo=tzstr(s)).tzname(), "BRST")
+        self.assertEqual(datetime(2003,10,19,1,59,59,999999,
+                                  tzinfo=tzstr(s)).tzname(), "BRST")
+        self.assertEqual(datetime(2003,10,19,2,00,
+                                  tzinfo=tzstr(s)).tzname(), "BRDT")
+
     def testRangeCmp1(self):
         self.assertEqual(tzstr("EST5EDT"),
                          tzrange("EST", -18000, "EDT", -14400,
@@ -3899,6 +4935,22 @@ END:VTIMEZONE
         self.assertEqual(tzstr("EST5EDT"),
                          tzrange("EST", -18000, "EDT"))
 
+    def testRangeWithoutTransitions(self):
+        # As unpickled from before transitions were cached, or made by
+        # a subclass not calling tzrange.__init__().
+        class mytzrange(tzrange):
+            def __init__(self):
+                self._std_abbr, self._dst_abbr = "EST", "EDT"
+                self._std_offset = timedelta(hours=-5)
+                self._dst_offset = timedelta(hours=-4)
+                self._start_delta = relativedelta(hours=+2, month=4, day=1,
+                                                  weekday=SU(+1))
+                self._end_delta = relativedelta(hours=+1, month=10, day=31,
+                                                weekday=SU(-1))
+        tz = mytzrange()
+        self.assertEqual(datetime(2003,4,6,1,59,tzinfo=tz).tzname(), "EST")
+        self.assertEqual(datetime(2003,4,6,2,00,tzinfo=tz).tzname(), "EDT")
+
     def testFileStart1(self):
         tz = tzfile(StringIO(base64.decodestring(self.TZFILE_EST5EDT)))
         self.assertEqual(datetime(2003,4,6,1,59,tzinfo=tz).tzname(), "EST")